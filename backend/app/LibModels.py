@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.passwords import password_hasher
+from app.routing import RoutingSession
 
-db = SQLAlchemy()
+# Reads marked with @replica_read can go to a replica bind (see app/routing.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # User Model (For authentication purposes)
 class User(db.Model):
@@ -12,10 +14,10 @@ class User(db.Model):
     password_hash = db.Column(db.String(200), nullable=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(password, self.password_hash)
 
     def __repr__(self):
         return f"<User {self.username}>"
@@ -32,14 +34,18 @@ class LoanType(db.Model):
 
     @staticmethod
     def seed_loan_types():
-        """Seed the database with predefined loan types."""
+        """Add whichever predefined loan types are missing; returns how many were added."""
         loan_types = [
             LoanType(type_name="Short Term", max_days=2),
             LoanType(type_name="Medium Term", max_days=5),
             LoanType(type_name="Long Term", max_days=10)
         ]
-        db.session.bulk_save_objects(loan_types)
-        db.session.commit()
+        existing = set(db.session.scalars(db.select(LoanType.type_name)))
+        missing = [loan_type for loan_type in loan_types if loan_type.type_name not in existing]
+        if missing:
+            db.session.add_all(missing)
+            db.session.commit()
+        return len(missing)
 
     def __repr__(self):
         return f"<LoanType {self.type_name} ({self.max_days} days)>"
@@ -62,6 +68,14 @@ class Book(db.Model):
     # Relationship with Loans (a book can have multiple loans)
     loans = db.relationship('Loan', back_populates='book')
 
+    # Composite indexes for keyset pagination (filter column first, then id)
+    __table_args__ = (
+        db.Index('ix_books_active_id', 'active', 'id'),
+        db.Index('ix_books_author_id', 'author', 'id'),
+        db.Index('ix_books_year_id', 'year_published', 'id'),
+        db.Index('ix_books_loan_type_id', 'loan_type_id', 'id'),
+    )
+
     def deactivate(self):
         """Deactivate the book."""
         self.active = False
@@ -69,6 +83,10 @@ class Book(db.Model):
     def __repr__(self):
         return f"<Book {self.name} by {self.author}>"
 
+    def to_dict(self):
+        from app.serializers import BOOK
+        return BOOK.dump(self)
+
 
 # Customer Model
 class Customer(db.Model):
@@ -87,10 +105,10 @@ class Customer(db.Model):
     loans = db.relationship('Loan', back_populates='customer')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(password, self.password_hash)
 
     def deactivate(self):
         """Deactivate the customer account."""
@@ -104,11 +122,8 @@ class Customer(db.Model):
         return f"<Customer {self.name}, Active: {self.active}>"
 
     def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'active': self.active
-        }
+        from app.serializers import CUSTOMER
+        return CUSTOMER.dump(self)
 
 # Loan Model
 class Loan(db.Model):
@@ -117,6 +132,7 @@ class Loan(db.Model):
     cust_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
     loan_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    due_date = db.Column(db.DateTime)  # loan_date + the book's LoanType.max_days, set at checkout
     return_date = db.Column(db.DateTime)
     is_loaned = db.Column(db.Boolean, default=True)
     active = db.Column(db.Boolean, default=True)
@@ -125,6 +141,11 @@ class Loan(db.Model):
     customer = db.relationship('Customer', back_populates='loans')
     book = db.relationship('Book', back_populates='loans')
 
+    # Late loan detection scans open loans by due date
+    __table_args__ = (
+        db.Index('ix_loans_is_loaned_due_date', 'is_loaned', 'due_date'),
+    )
+
     def mark_returned(self):
         """Mark the loan as returned."""
         self.is_loaned = False
@@ -134,24 +155,89 @@ class Loan(db.Model):
     def __repr__(self):
         return f"<Loan Customer ID {self.cust_id} Book ID {self.book_id}>"
 
+    def to_dict(self):
+        from app.serializers import LOAN
+        return LOAN.dump(self)
+
+    def to_detail_dict(self):
+        """to_dict() plus book and customer names; load those relationships eagerly first."""
+        data = self.to_dict()
+        data['book_name'] = self.book.name if self.book else None
+        data['author'] = self.book.author if self.book else None
+        data['customer_name'] = self.customer.name if self.customer else None
+        return data
 
-# MyLoan Model (for tracking customer-specific book loans)
+
+# MyLoan Model: per-customer loan feed (a read model of loans + books, kept by app/my_loans.py)
 class MyLoan(db.Model):
     __tablename__ = 'my_loans'
-    loan_id = db.Column(db.Integer, primary_key=True)
+    loan_id = db.Column(db.Integer, db.ForeignKey('loans.id'), primary_key=True)
+    cust_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'))
     book_name = db.Column(db.String(255))
     author = db.Column(db.String(255))
     loan_date = db.Column(db.DateTime)
+    due_date = db.Column(db.DateTime)
     return_date = db.Column(db.DateTime)
     is_loaned = db.Column(db.Boolean, default=True)
     active = db.Column(db.Boolean, default=True)
 
+    # A customer's current or past loans, newest first, are one range scan
+    __table_args__ = (
+        db.Index('ix_my_loans_cust_id_is_loaned_loan_date', 'cust_id', 'is_loaned', 'loan_date'),
+    )
+
     def __repr__(self):
         return f"<MyLoan Loan ID {self.loan_id} Book Name {self.book_name}>"
 
 
+# LateLoan Model (overdue loans, materialized on a schedule by app/late_loans.py)
+class LateLoan(db.Model):
+    __tablename__ = 'late_loans'
+    loan_id = db.Column(db.Integer, db.ForeignKey('loans.id'), primary_key=True)
+    cust_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
+    customer_name = db.Column(db.String(255))
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    book_name = db.Column(db.String(255))
+    loan_date = db.Column(db.DateTime)
+    due_date = db.Column(db.DateTime, index=True)
+    refreshed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<LateLoan Loan ID {self.loan_id} due {self.due_date}>"
+
+    def to_dict(self, now=None):
+        now = now or datetime.utcnow()
+        return {
+            'loan_id': self.loan_id,
+            'cust_id': self.cust_id,
+            'customer_name': self.customer_name,
+            'book_id': self.book_id,
+            'book_name': self.book_name,
+            'loan_date': self.loan_date.strftime("%Y-%m-%d") if self.loan_date else None,
+            'due_date': self.due_date.strftime("%Y-%m-%d") if self.due_date else None,
+            'days_late': (now - self.due_date).days if self.due_date else None
+        }
+
+
+# IdempotencyKey Model (stored results of checkouts, so retried requests are not repeated)
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    user_id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(128), primary_key=True)
+    request_fingerprint = db.Column(db.String(255), nullable=False)
+    loan_id = db.Column(db.Integer, db.ForeignKey('loans.id'))
+    status_code = db.Column(db.Integer, nullable=False)
+    response_body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.key} for user {self.user_id}>"
+
+
 # BookAvailability Model (for tracking book availability)
+# A read model kept in sync by app/availability.py: one row per book, so availability
+# reads never need to join books, loantypes and loans.
 class BookAvailability(db.Model):
     __tablename__ = 'bookavailability'
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
@@ -159,9 +245,21 @@ class BookAvailability(db.Model):
     author = db.Column(db.String(255))
     year_published = db.Column(db.Integer)
     image_url = db.Column(db.String(500))
+    loan_type_id = db.Column(db.Integer)
     loan_type = db.Column(db.String(100))
     return_date = db.Column(db.DateTime)
     availability_status = db.Column(db.String(50))
 
+    # Composite indexes for keyset pagination of the available books listing
+    __table_args__ = (
+        db.Index('ix_bookavailability_status_book', 'availability_status', 'book_id'),
+        db.Index('ix_bookavailability_author_book', 'author', 'book_id'),
+        db.Index('ix_bookavailability_loan_type_book', 'loan_type_id', 'book_id'),
+    )
+
     def __repr__(self):
         return f"<BookAvailability {self.book_name} Status {self.availability_status}>"
+
+    def to_dict(self):
+        from app.serializers import AVAILABLE_BOOK
+        return AVAILABLE_BOOK.dump(self)
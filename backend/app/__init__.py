@@ -1,30 +1,104 @@
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, request
 from config.config import Config
-from app.logger import log_info, log_error, log_warning, log_debug
 
-# Logging
-log_info("Flask application is starting")
-log_debug("Debugging application configuration")
-log_warning("This is a warning")
-log_error("An error occurred while processing")
+# ------------------------------------------------------------
+# Application factory
+#
+# create_app() only wires configuration, extensions and blueprints: it runs no DDL,
+# seeds nothing and starts no background jobs, so a worker process is ready as soon
+# as the imports are done. The one thread it does start is the log queue listener
+# (init_logging), which only drains log records to their handler. Create the schema
+# and the loan types with `flask init-db`, and call start_background_jobs() once in
+# each process that serves requests.
+# Blueprint and extension modules are imported inside the factory, so importing
+# the package (e.g. for the CLI or the models) does not pull in the whole API.
+# ------------------------------------------------------------
 
-db = SQLAlchemy()
 
-def create_app():
+def create_app(config_object=Config, **overrides):
+    """Build the Flask app from `config_object`, with keyword arguments overriding single settings."""
+    from flask_cors import CORS
+    from app.logger import log_info, init_logging
+    from app.database import init_db
+    from app.auth import auth_bp, init_auth
+    from app.api import api_bp
+    from app.instrumentation import init_instrumentation
+    from app.ratelimit import init_rate_limit
+    from app.querycount import init_query_guard
+    from app.cache import init_cache
+    from app.json_provider import init_json
+    from app.httpcache import init_http_cache
+    from app.schema import init_migrations
+    from app.commands import register_commands
+
     app = Flask(__name__)
+    app.config.from_object(config_object)
+    app.config.update(overrides)
+
+    # Queue-based logging with rotation, request ids and access lines
+    init_logging(app)
+
+    # Enable CORS (optional)
+    CORS(app, resources={r"/*": {"origins": "*"}})
+
+    # JWT, token revocation and the password hashing pool
+    init_auth(app)
+
+    # SQLAlchemy with the shared engine factory and pool settings (no connection is made yet)
+    init_db(app)
+
+    # Register blueprints for authentication and API
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(api_bp, url_prefix='/api')
+
+    # Per-endpoint timing, SQL counts, slow request profiles and /metrics
+    init_instrumentation(app)
+
+    # Per-caller token buckets; answers 429 before the view runs
+    init_rate_limit(app)
+
+    # Count SQL statements per request and enforce SQL_QUERY_BUDGET
+    init_query_guard(app)
+
+    # Size and TTL of the catalog read cache
+    init_cache(app)
+
+    # orjson-backed jsonify()
+    init_json(app)
+
+    # Compress large JSON responses (catalog ETags are set per view)
+    init_http_cache(app)
+
+    # Alembic migrations through Flask-Migrate (`flask db upgrade`, see app/schema.py)
+    init_migrations(app)
+
+    # Register CLI commands (e.g. `flask init-db`)
+    register_commands(app)
+
+    @app.route('/')
+    def home():
+        log_info(f"Home route accessed from {request.remote_addr}")
+        return "Welcome to the home page!"
+
+    return app
+
+
+def start_background_jobs(app):
+    """Build the search index and start the late-loan refresh; call after any fork, not before."""
+    from app.search import init_search
+    from app.late_loans import start_late_loan_scheduler
+
+    # Build the catalog search index in the background
+    init_search(app)
 
-    # Load configuration
-    app.config.from_object(Config)
-    print("Using database:", app.config['SQLALCHEMY_DATABASE_URI'])
+    # Keep the late_loans summary fresh in the background
+    start_late_loan_scheduler(app)
 
-    # Initialize the database
-    db.init_app(app)
 
-    with app.app_context():
-        # Import models to ensure table creation
-        from app.LibModels import Book, LoanType, Customer, Loan, MyLoan, BookAvailability
-        db.create_all()
-        print("Database tables created successfully!")
+def stop_background_jobs(app):
+    """Stop the late-loan refresh and close pooled connections; for process shutdown."""
+    from app.late_loans import stop_late_loan_scheduler
+    from app.database import dispose_engines
 
-    return app
\ No newline at end of file
+    stop_late_loan_scheduler()
+    dispose_engines(app)
@@ -1,9 +1,16 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import base64
+import binascii
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
 from app.logger import log_info, log_error, log_warning, log_debug
-from app.LibModels import BookAvailability, MyLoan
-from app.auth import auth_bp, init_auth
+from app.LibModels import BookAvailability
+from app.auth import auth_bp, init_auth, current_identity
 from app.dbmanager import DBManager
+from app.cache import catalog_cache
+from app.search import search_index
+from app.checkout import checkout_book
+from app.httpcache import conditional
+from datetime import datetime, timedelta
 
 # Initialize Blueprint for API routes
 api_bp = Blueprint('api', __name__)
@@ -17,18 +24,114 @@ log_info("API Blueprint initialized")
 
 def check_customer_role():
     """Helper function to check if the current user is a customer."""
-    current_user = get_jwt_identity()
+    current_user = current_identity()
     if current_user['role'] != 'customer':
         log_error(f"Unauthorized access attempt by {current_user['username']}")
         return jsonify({"error": "Unauthorized access"}), 403
     return current_user
 
+def encode_cursor(last_id):
+    """Turn the last book ID of a page into an opaque cursor string."""
+    if last_id is None:
+        return None
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Turn a cursor string back into a book ID. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        prefix, _, value = base64.urlsafe_b64decode(padded.encode()).decode().partition(':')
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if prefix != 'id' or not value.isdigit():
+        raise ValueError("Invalid cursor")
+    return int(value)
+
+def encode_loan_cursor(last):
+    """Turn the (loan_date, loan_id) of the last loan of a my-loans page into a cursor string."""
+    if last is None:
+        return None
+    loan_date, loan_id = last
+    return base64.urlsafe_b64encode(f"loan:{loan_date.isoformat()}:{loan_id}".encode()).decode().rstrip('=')
+
+def decode_loan_cursor(cursor):
+    """Turn a my-loans cursor back into (loan_date, loan_id). Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        prefix, _, value = base64.urlsafe_b64decode(padded.encode()).decode().partition(':')
+        loan_date, _, loan_id = value.rpartition(':')
+        if prefix == 'loan' and loan_id.isdigit():
+            return datetime.fromisoformat(loan_date), int(loan_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        pass
+    raise ValueError("Invalid cursor")
+
+def parse_bool(value):
+    """Parse a query string boolean such as 'true' / '0'."""
+    lowered = value.lower()
+    if lowered in ('1', 'true', 'yes'):
+        return True
+    if lowered in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"Invalid boolean value '{value}'")
+
+def parse_page_size(args, default, maximum):
+    """?limit= as an int capped at maximum (default if absent). Raises ValueError unless it is a positive integer."""
+    limit = args.get('limit')
+    if limit is None:
+        return default
+    if not limit.isdigit() or int(limit) < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(int(limit), maximum)
+
+def parse_page_args(args=None, config=None):
+    """
+    Read cursor, limit and catalog filters from the query string (request.args and the
+    app config unless given, e.g. by the async API). Returns (after_id, limit, filters).
+    Raises ValueError on bad input.
+    """
+    args = request.args if args is None else args
+    config = current_app.config if config is None else config
+    cursor = args.get('cursor')
+    after_id = decode_cursor(cursor) if cursor else None
+
+    limit = parse_page_size(args, config.get('BOOKS_PAGE_SIZE', 50), config.get('BOOKS_MAX_PAGE_SIZE', 200))
+
+    filters = {}
+    if args.get('author'):
+        filters['author'] = args['author']
+    for name in ('year_from', 'year_to', 'loan_type'):
+        if args.get(name) is not None:
+            if not args[name].lstrip('-').isdigit():
+                raise ValueError(f"{name} must be an integer")
+            filters['loan_type_id' if name == 'loan_type' else name] = int(args[name])
+    if args.get('active') is not None:
+        filters['active'] = parse_bool(args['active'])
+    return after_id, limit, filters
+
+def parse_my_loans_args(args=None, config=None):
+    """
+    Read status (all, current or history), cursor and limit for a my-loans page.
+    Returns (status, after, limit). Raises ValueError on bad input.
+    """
+    args = request.args if args is None else args
+    config = current_app.config if config is None else config
+    status = args.get('status', 'all')
+    if status not in DBManager.MY_LOAN_STATUSES:
+        raise ValueError("status must be one of all, current, history")
+    cursor = args.get('cursor')
+    after = decode_loan_cursor(cursor) if cursor else None
+
+    limit = parse_page_size(args, config.get('MY_LOANS_PAGE_SIZE', 50), config.get('MY_LOANS_MAX_PAGE_SIZE', 200))
+    return status, after, limit
+
 # ------------------------------------------------------------
 # Customer Endpoints
 # ------------------------------------------------------------
 
 @api_bp.route('/books/available', methods=['GET'])
 @jwt_required()
+@conditional(('availability',), roles=('customer',))
 def get_available_books():
     """
     Endpoint to get the list of available books.
@@ -38,44 +141,109 @@ def get_available_books():
     if isinstance(current_user, tuple):  # if an error response, return it
         return current_user
 
-    books = DBManager.get_books()
-    book_list = [
-        {
-            "book_id": book.book_id,
-            "book_name": book.book_name,
-            "author": book.author,
-            "year_published": book.year_published,
-            "loan_type": book.loan_type,
-            "availability_status": book.availability_status
-        } for book in books
-    ]
+    try:
+        after_id, limit, filters = parse_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filters.pop('active', None)  # this listing only ever shows active books
+
+    book_list, last_id = DBManager.get_available_books_page_dicts(after_id, limit, **filters)
     log_info(f"Customer {current_user['username']} accessed available books")
-    return jsonify(book_list), 200
+    return jsonify({"books": book_list, "next_cursor": encode_cursor(last_id)}), 200
+
+@api_bp.route('/books/search', methods=['GET'])
+@jwt_required()
+@conditional(('books',), cache_control='private, max-age=30')
+def search_books():
+    """
+    Endpoint to search active books by name and author.
+    Served from the in-memory search index; ?q= is required, ?limit= is optional.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    limit = request.args.get('limit', current_app.config.get('SEARCH_PAGE_SIZE', 20), type=int)
+    if limit is None or limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    limit = min(limit, current_app.config.get('BOOKS_MAX_PAGE_SIZE', 200))
+
+    results = search_index.search(query, limit)
+    return jsonify({"query": query, "results": results}), 200
+
+@api_bp.route('/books/<int:book_id>/availability', methods=['GET'])
+@jwt_required()
+@conditional(('availability',))
+def get_book_availability(book_id):
+    """
+    Endpoint to check whether a single book can be borrowed.
+    Served from the availability projection with a primary key lookup.
+    """
+    book = DBManager.get_availability_dict(book_id)
+    if not book:
+        return jsonify({"error": "Book not found"}), 404
+    return jsonify({
+        "book_id": book['book_id'],
+        "book_name": book['book_name'],
+        "availability_status": book['availability_status'],
+        "return_date": book['return_date']
+    }), 200
+
+@api_bp.route('/loan-types', methods=['GET'])
+@jwt_required()
+@conditional(('loan_types',), cache_control='private, max-age=300')
+def get_loan_types():
+    """Endpoint to list the loan types and their maximum loan days."""
+    return jsonify(DBManager.get_loan_types()), 200
 
 @api_bp.route('/my-loans', methods=['GET'])
 @jwt_required()
 def get_my_loans():
     """
-    Endpoint for customers to view their own loans.
+    Endpoint for customers to page through their own loans, newest first.
+    Accepts `status` (all, current or history), `cursor` and `limit` query parameters.
     """
     current_user = check_customer_role()
     if isinstance(current_user, tuple):
         return current_user
+    try:
+        status, after, limit = parse_my_loans_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    my_loans = MyLoan.query.filter_by(cust_id=current_user['id']).all()
-    loan_list = [
-        {
-            "loan_id": loan.loan_id,
-            "book_id": loan.book_id,
-            "book_name": loan.book_name,
-            "author": loan.author,
-            "loan_date": loan.loan_date.strftime("%Y-%m-%d"),
-            "return_date": loan.return_date.strftime("%Y-%m-%d") if loan.return_date else None,
-            "is_loaned": loan.is_loaned
-        } for loan in my_loans
-    ]
+    loan_list, last = DBManager.get_my_loans_page_dicts(current_user['id'], status, after, limit)
     log_info(f"Customer {current_user['username']} accessed their loans")
-    return jsonify(loan_list), 200
+    return jsonify({"loans": loan_list, "next_cursor": encode_loan_cursor(last)}), 200
+
+@api_bp.route('/loans/checkout', methods=['POST'])
+@jwt_required()
+def checkout():
+    """
+    Endpoint to borrow a book: {"book_id": 1}, plus "cust_id" when a librarian lends it.
+    Send an Idempotency-Key header to make retries safe; a repeated key returns the
+    original result instead of creating a second loan.
+    """
+    current_user = current_identity()
+    data = request.get_json(silent=True) or {}
+    if current_user['role'] == 'customer':
+        cust_id = current_user['id']
+    elif current_user['role'] in ('librarian', 'root'):
+        cust_id = data.get('cust_id')
+    else:
+        return jsonify({"error": "Unauthorized access"}), 403
+
+    book_id = data.get('book_id')
+    if not isinstance(book_id, int) or not isinstance(cust_id, int):
+        return jsonify({"error": "book_id and cust_id must be integers"}), 400
+    key = request.headers.get('Idempotency-Key')
+    if key is not None and not 0 < len(key) <= 128:
+        return jsonify({"error": "Idempotency-Key must be 1 to 128 characters"}), 400
+
+    result = checkout_book(cust_id, book_id, idempotency_key=key, key_owner=current_user['id'],
+                           key_ttl=timedelta(hours=current_app.config.get('IDEMPOTENCY_KEY_TTL_HOURS', 24)))
+    response = jsonify(result.body)
+    if result.replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response, result.status_code
 
 # ------------------------------------------------------------
 # Book Management (CRUD)
@@ -83,12 +251,14 @@ def get_my_loans():
 
 @api_bp.route('/books', methods=['POST', 'GET'])
 @jwt_required()
+@conditional(('books',))
 def handle_books():
     try:
         if request.method == 'POST':
             # Extract book data from request
-            book_data = request.get_json()
-            log_info(f"Received book creation request: {book_data}")
+            book_data = request.get_json() or {}
+            # Log the title only, not the whole request body
+            log_info(f"Received book creation request for '{book_data.get('name') or book_data.get('book_name')}'")
 
             # Forward the data to DBManager for processing
             new_book = DBManager.create_book(book_data)
@@ -98,9 +268,12 @@ def handle_books():
                 return jsonify({"error": "Failed to add book"}), 400
 
         elif request.method == 'GET':
-            books = DBManager.get_books()
-            book_list = [book.to_dict() for book in books]
-            return jsonify(book_list), 200
+            try:
+                after_id, limit, filters = parse_page_args()
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            book_list, last_id = DBManager.get_books_page_dicts(after_id, limit, **filters)
+            return jsonify({"books": book_list, "next_cursor": encode_cursor(last_id)}), 200
 
     except Exception as e:
         log_error(f"Error processing book request: {str(e)}")
@@ -117,12 +290,43 @@ def admin_dashboard():
     Endpoint for the admin dashboard.
     Accessible only to librarians.
     """
-    current_user = get_jwt_identity()
+    current_user = current_identity()
     if current_user['role'] != 'librarian':
         log_error(f"Unauthorized access attempt by {current_user['username']} to admin dashboard")
         return jsonify({"error": "Access forbidden"}), 403
     return jsonify({"message": "Welcome to the admin dashboard!"})
 
+@api_bp.route('/admin/loans', methods=['GET'])
+@jwt_required()
+def admin_loans():
+    """
+    Endpoint for librarians to page through all loans with book and customer names.
+    Accepts `cursor`, `limit` and `active` query parameters.
+    """
+    current_user = current_identity()
+    if current_user['role'] != 'librarian':
+        log_error(f"Unauthorized access attempt by {current_user['username']} to loan list")
+        return jsonify({"error": "Access forbidden"}), 403
+    try:
+        after_id, limit, filters = parse_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    loan_list, last_id = DBManager.get_loans_page_dicts(after_id, limit, active=filters.get('active'))
+    return jsonify({"loans": loan_list, "next_cursor": encode_cursor(last_id)}), 200
+
+@api_bp.route('/admin/cache', methods=['GET'])
+@jwt_required()
+def admin_cache_stats():
+    """
+    Endpoint for librarians to see the catalog cache hit/miss counters.
+    """
+    current_user = current_identity()
+    if current_user['role'] != 'librarian':
+        log_error(f"Unauthorized access attempt by {current_user['username']} to cache stats")
+        return jsonify({"error": "Access forbidden"}), 403
+    return jsonify(catalog_cache.stats()), 200
+
 # ------------------------------------------------------------
 # User Endpoints
 # ------------------------------------------------------------
@@ -133,5 +337,5 @@ def user_dashboard():
     """
     Endpoint for users to view their dashboard.
     """
-    current_user = get_jwt_identity()
+    current_user = current_identity()
     return jsonify({"message": f"Welcome {current_user['username']}!"})
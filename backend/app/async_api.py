@@ -0,0 +1,266 @@
+import json
+import random
+from contextlib import asynccontextmanager
+import jwt
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from config.config import Config
+from app.LibModels import Book, Customer, BookAvailability
+from app.api import parse_page_args, parse_my_loans_args, encode_cursor, encode_loan_cursor
+from app.cache import catalog_cache
+from app.dbmanager import DBManager
+from app.logger import configure_logging, logging_options, log_info, log_warning, log_error
+from app.ratelimit import MemoryBucketStore, create_bucket_store, parse_rules, check_limit
+from app.revocation import MemoryRevocationStore, SQLiteRevocationStore
+from app.serializers import BOOK, AVAILABLE_BOOK, CUSTOMER
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; without it the standard json module is used
+    orjson = None
+
+# ------------------------------------------------------------
+# Async read-only API
+#
+# The read-heavy GET endpoints (catalog, available books, my-loans, customer lookup)
+# served by Starlette on SQLAlchemy's asyncio engine, so one process holds many slow
+# clients on a single event loop instead of a thread each. It reads the same tables
+# through the same serializers, filters and cursors as the Flask views, verifies the
+# Flask app's access tokens with PyJWT, and answers with identical bodies. Writes
+# (and every other route) stay on the WSGI app; route only these paths here.
+#
+# Revocations made by the Flask app are only visible here when both share
+# JWT_REVOCATION_DB_PATH, the same as for several Flask worker processes; without
+# it a revoked token is accepted until it expires, and startup logs a warning.
+# Rate limits are checked with the Flask app's rules under its endpoint names, so
+# with a shared RATELIMIT_STORAGE_URL both apps draw from the same buckets. Lookups
+# in the SQLite revocation file and in Redis block, so they run on the thread pool
+# rather than on the event loop.
+#
+# catalog_cache here is this process's own: the Flask app's writes do not invalidate
+# it, so a cached page can be up to CACHE_TTL_SECONDS older than the database.
+# ------------------------------------------------------------
+
+# Synchronous driver -> the asyncio driver for the same database
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'mysql+mysqldb': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite'
+}
+
+
+class AuthError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class ApiJSONResponse(JSONResponse):
+    """Same bytes as the Flask app's jsonify(): sorted keys and a trailing newline."""
+
+    def render(self, content):
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+        return (json.dumps(content, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+def async_database_url(uri):
+    """The asyncio form of a database URI, e.g. mysql+pymysql:// -> mysql+aiomysql://."""
+    url = make_url(uri)
+    driver = ASYNC_DRIVERS.get(url.drivername)
+    return url.set(drivername=driver) if driver else url
+
+
+def async_engine_options(config, url):
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True)
+    }
+
+
+class AsyncReadAPI:
+    """Engines, token checks and the route handlers of the async app."""
+
+    def __init__(self, config):
+        self.config = config
+        # An explicit ASYNC_DATABASE_URL wins; otherwise every route is a read, so with
+        # replicas configured the primary is not used at all
+        urls = [config['ASYNC_DATABASE_URL']] if config.get('ASYNC_DATABASE_URL') else \
+            [url for url in config.get('DATABASE_REPLICA_URLS') or () if url] or [config['SQLALCHEMY_DATABASE_URI']]
+        self.engines = []
+        for uri in urls:
+            url = async_database_url(uri)
+            self.engines.append(create_async_engine(url, **async_engine_options(config, url)))
+        path = config.get('JWT_REVOCATION_DB_PATH')
+        if not path:
+            log_warning("JWT_REVOCATION_DB_PATH is not set: the async API cannot see tokens revoked by the "
+                        "Flask app (logout, deactivated customers) and accepts them until they expire")
+        self.revocation_store = SQLiteRevocationStore(path) if path else MemoryRevocationStore()
+        self.revocation_blocks = bool(path)
+        self.rate_limit_enabled = config.get('RATELIMIT_ENABLED', True)
+        self.bucket_store = create_bucket_store(config.get('RATELIMIT_STORAGE_URL'))
+        self.bucket_store_blocks = not isinstance(self.bucket_store, MemoryBucketStore)
+        self.default_limit, self.limit_rules = parse_rules(config)
+        self.rate_limit_exempt = set(config.get('RATELIMIT_EXEMPT', ()))
+
+    async def dispose(self):
+        for engine in self.engines:
+            await engine.dispose()
+
+    async def fetch(self, statement):
+        async with random.choice(self.engines).connect() as conn:
+            return (await conn.execute(statement)).all()
+
+    async def keyset_page(self, statement, after_id, limit, key):
+        """One page ordered by the key column, returning (rows, has_more)."""
+        if after_id is not None:
+            statement = statement.where(key > after_id)
+        rows = await self.fetch(statement.order_by(key).limit(limit + 1))
+        return rows[:limit], len(rows) > limit
+
+    @staticmethod
+    async def call(blocking, fn, *args):
+        """fn(*args), on the thread pool if it does blocking I/O."""
+        return await run_in_threadpool(fn, *args) if blocking else fn(*args)
+
+    async def authenticate(self, request):
+        """The verified access token's identity as {'id', 'username', 'role'}; raises AuthError."""
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            raise AuthError(401, "Missing Authorization Header")
+        try:
+            claims = jwt.decode(header[7:], self.config['JWT_SECRET_KEY'],
+                                algorithms=[self.config.get('JWT_ALGORITHM', 'HS256')],
+                                options={'require': ['exp', 'iat', 'jti', 'sub']})
+        except jwt.ExpiredSignatureError:
+            raise AuthError(401, "Token has expired")
+        except jwt.InvalidTokenError as e:
+            raise AuthError(422, str(e))
+        if claims.get('type') != 'access':
+            raise AuthError(422, "Only non-refresh tokens are allowed")
+        if await self.call(self.revocation_blocks, self.revocation_store.is_revoked,
+                           claims['jti'], claims['sub'], claims['iat']):
+            raise AuthError(401, "Token has been revoked")
+        return {'id': int(claims['sub']), 'username': claims.get('username'), 'role': claims.get('role')}
+
+    # ------------------------------------------------------------
+    # Routes (same paths and bodies as the Flask views)
+    # ------------------------------------------------------------
+
+    async def get_books(self, request, user):
+        try:
+            after_id, limit, filters = parse_page_args(request.query_params, self.config)
+        except ValueError as e:
+            return ApiJSONResponse({"error": str(e)}, 400)
+
+        async def load():
+            query = DBManager._filter_books(BOOK.select(), **filters)
+            rows, has_more = await self.keyset_page(query, after_id, limit, Book.id)
+            return BOOK.dump_rows(rows), (rows[-1].id if has_more else None)
+        key = ('books', 'page', after_id, limit, tuple(sorted(filters.items())))
+        book_list, last_id = await catalog_cache.get_or_load_async(key, load)
+        return ApiJSONResponse({"books": book_list, "next_cursor": encode_cursor(last_id)})
+
+    async def get_available_books(self, request, user):
+        if user['role'] != 'customer':
+            return ApiJSONResponse({"error": "Unauthorized access"}, 403)
+        try:
+            after_id, limit, filters = parse_page_args(request.query_params, self.config)
+        except ValueError as e:
+            return ApiJSONResponse({"error": str(e)}, 400)
+        filters.pop('active', None)
+
+        async def load():
+            query = DBManager._filter_available(AVAILABLE_BOOK.select(), **filters)
+            rows, has_more = await self.keyset_page(query, after_id, limit, BookAvailability.book_id)
+            return AVAILABLE_BOOK.dump_rows(rows), (rows[-1].book_id if has_more else None)
+        key = ('availability', 'page', after_id, limit, tuple(sorted(filters.items())))
+        book_list, last_id = await catalog_cache.get_or_load_async(key, load)
+        return ApiJSONResponse({"books": book_list, "next_cursor": encode_cursor(last_id)})
+
+    async def get_my_loans(self, request, user):
+        if user['role'] != 'customer':
+            return ApiJSONResponse({"error": "Unauthorized access"}, 403)
+        try:
+            status, after, limit = parse_my_loans_args(request.query_params, self.config)
+        except ValueError as e:
+            return ApiJSONResponse({"error": str(e)}, 400)
+        rows = await self.fetch(DBManager._my_loans_select(user['id'], status, after, limit))
+        loan_list, last = DBManager._my_loans_page(rows, limit)
+        return ApiJSONResponse({"loans": loan_list, "next_cursor": encode_loan_cursor(last)})
+
+    async def get_customer(self, request, user):
+        if user['role'] not in ('librarian', 'root'):
+            return ApiJSONResponse({"error": "Unauthorized access"}, 403)
+        rows = await self.fetch(CUSTOMER.select().where(Customer.id == request.path_params['id']))
+        if not rows:
+            return ApiJSONResponse({"error": "Customer not found"}, 404)
+        return ApiJSONResponse(CUSTOMER.dump_row(rows[0]))
+
+    async def retry_after(self, endpoint, request, user):
+        """Seconds to wait if the caller's budget for the (Flask) endpoint is spent, else 0."""
+        if not self.rate_limit_enabled or endpoint in self.rate_limit_exempt:
+            return 0
+        # Same keys as the Flask app: the token's subject, else the client IP
+        identity = f"user:{user['id']}" if user else f"ip:{request.client.host if request.client else 'unknown'}"
+        return await self.call(self.bucket_store_blocks, check_limit, self.bucket_store, endpoint, identity,
+                               self.default_limit, self.limit_rules)
+
+    def route(self, handler, endpoint):
+        """Wrap a handler(request, user) with token verification, the rate limit of `endpoint` and error handling."""
+        async def view(request):
+            try:
+                user, error = await self.authenticate(request), None
+            except AuthError as e:
+                user, error = None, e
+            retry_after = await self.retry_after(endpoint, request, user)
+            if retry_after:
+                return ApiJSONResponse({"error": "Too many requests"}, 429, headers={'Retry-After': str(retry_after)})
+            if error is not None:
+                return ApiJSONResponse({"msg": error.message}, error.status_code)
+            try:
+                return await handler(request, user)
+            except Exception as e:
+                log_error(f"Error in async {request.url.path}: {str(e)}")
+                return ApiJSONResponse({"error": "Internal server error"}, 500)
+        return view
+
+
+def create_async_app(config_object=Config, **overrides):
+    """Starlette app for the read-only endpoints; run with e.g. `uvicorn asgi:app`."""
+    config = {key: getattr(config_object, key) for key in dir(config_object) if key.isupper()}
+    config.update(overrides)
+    configure_logging(**logging_options(config))
+    api = AsyncReadAPI(config)
+
+    routes = [
+        Route('/api/books', api.route(api.get_books, 'api.handle_books'), methods=['GET']),
+        Route('/api/books/available', api.route(api.get_available_books, 'api.get_available_books'), methods=['GET']),
+        Route('/api/my-loans', api.route(api.get_my_loans, 'api.get_my_loans'), methods=['GET']),
+        Route('/auth/customers/{id:int}', api.route(api.get_customer, 'auth.get_customer'), methods=['GET'])
+    ]
+
+    @asynccontextmanager
+    async def lifespan(app):
+        log_info(f"Async read API serving {len(routes)} routes from {len(api.engines)} engine(s)")
+        yield
+        await api.dispose()
+
+    app = Starlette(routes=routes, lifespan=lifespan,
+                    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_headers=['*'])])
+    app.state.api = api
+    return app
@@ -1,10 +1,18 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, JWTManager
-from werkzeug.security import generate_password_hash, check_password_hash
+import io
+import time
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import (create_access_token, create_refresh_token, jwt_required,
+                                get_jwt, get_jwt_identity, JWTManager)
 from app.LibModels import db, BookAvailability, Loan, Customer, Book
+from app.dbmanager import DBManager
+from app.importer import import_records, FORMATS
+from app.patching import CUSTOMER_FIELDS, BOOK_FIELDS, LOAN_FIELDS, parse_bulk
+from app import export
 from app.logger import log_info, log_error, log_warning
+from app.revocation import init_revocation, get_revocation_store
+from app.passwords import password_hasher, init_password_hasher, HasherBusy, dummy_hash
 from config.config import Config
-from datetime import datetime
+from datetime import datetime, timedelta
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -14,6 +22,41 @@ jwt = JWTManager()
 # Static mapping of librarian username
 LIBRARIAN_USERNAME = "Ran"  # Librarian root user
 
+# ------------------------------------------------------------
+# Tokens
+#
+# Tokens are stateless: the subject is the customer ID and the username/role travel as
+# extra claims, so verifying a request never touches the database. Logging out or
+# deactivating a customer adds an entry to the revocation list instead.
+# ------------------------------------------------------------
+
+def create_tokens(user_id, username, role):
+    """Return (access_token, refresh_token) for a user."""
+    claims = {'username': username, 'role': role}
+    return (create_access_token(identity=str(user_id), additional_claims=claims),
+            create_refresh_token(identity=str(user_id), additional_claims=claims))
+
+def current_identity():
+    """The authenticated user as {'id', 'username', 'role'}, read from the verified token."""
+    claims = get_jwt()
+    return {
+        'id': int(get_jwt_identity()),
+        'username': claims.get('username'),
+        'role': claims.get('role')
+    }
+
+def revoke_user_tokens(user_id):
+    """Revoke every token already issued to a user (e.g. when the account is deactivated)."""
+    # Token iat/exp are POSIX seconds; a naive utcnow() would be read as local time
+    now = time.time()
+    longest = max(current_app.config['JWT_ACCESS_TOKEN_EXPIRES'],
+                  current_app.config['JWT_REFRESH_TOKEN_EXPIRES'])
+    get_revocation_store().revoke_user(user_id, now, now + longest.total_seconds())
+
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    return get_revocation_store().is_revoked(jwt_payload['jti'], jwt_payload['sub'], jwt_payload['iat'])
+
 # ------------------------------------------------------------
 # Login Endpoint
 # ------------------------------------------------------------
@@ -36,41 +79,109 @@ def login():
             role = 'librarian'
 
         user = Customer.query.filter_by(name=username).first()
-        if not user or not check_password_hash(user.password_hash, password):
+        try:
+            valid = password_hasher.verify_offloaded(password, user.password_hash if user else dummy_hash())
+        except HasherBusy:
+            log_warning(f"Login for {username} rejected - password hasher is saturated")
+            response = jsonify({"error": "Server busy, please retry"})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        if not user or not valid:
             log_warning(f"Invalid credentials for user {username}")
             return jsonify({"error": "Invalid credentials"}), 401
+        if user.active is False:
+            # Deactivation revoked the old tokens; do not hand out new ones
+            log_warning(f"Login refused for deactivated user {username}")
+            return jsonify({"error": "Account is deactivated"}), 403
 
-        # Revoke previous token if exists
-        if user.token:
-            log_info(f"User {username} had an active session, revoking old token.")
-
-        access_token = create_access_token(identity={
-            'id': user.id,
-            'username': user.name,
-            'role': role
-        })
+        # Upgrade hashes made with an older scheme or cost while we have the plain password
+        if password_hasher.needs_rehash(user.password_hash):
+            try:
+                user.password_hash = password_hasher.hash_offloaded(password)
+                db.session.commit()
+                log_info(f"Rehashed password for user {username} with {password_hasher.scheme}")
+            except Exception as e:
+                db.session.rollback()
+                log_warning(f"Could not rehash password for user {username}: {str(e)}")
 
-        user.token = access_token
-        db.session.commit()
+        # No database write here: the token itself carries the session
+        access_token, refresh_token = create_tokens(user.id, user.name, role)
 
         log_info(f"User {username} logged in successfully as {role}")
-        return jsonify({"access_token": access_token, "role": role}), 200
+        return jsonify({"access_token": access_token, "refresh_token": refresh_token, "role": role}), 200
 
     except Exception as e:
         log_error(f"Error during login: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@auth_bp.route('/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    """Exchange a refresh token for a new short-lived access token."""
+    user = current_identity()
+    access_token = create_access_token(identity=str(user['id']),
+                                       additional_claims={'username': user['username'], 'role': user['role']})
+    return jsonify({"access_token": access_token}), 200
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required(verify_type=False)
+def logout():
+    """Revoke the token sent with this request (send the refresh token to end the session)."""
+    claims = get_jwt()
+    get_revocation_store().revoke_token(claims['jti'], claims['exp'])
+    log_info(f"User {claims.get('username')} logged out ({claims['type']} token revoked)")
+    return jsonify({"message": "Token revoked"}), 200
+
 # Function to initialize JWT in the Flask app
 def init_auth(app):
     app.config['JWT_SECRET_KEY'] = Config.JWT_SECRET_KEY
     jwt.init_app(app)
+    init_revocation(app)
+    init_password_hasher(app)
 
 def is_admin_or_root():
-    current_user = get_jwt_identity()
+    current_user = current_identity()
     if current_user['role'] not in ['librarian', 'root']:
         return False
     return True
 
+# Partial updates: PATCH (or PUT) /<kind>/<id> with only the columns to change, or
+# PATCH /<kind> with a list of {"id": ..., <columns>} (see app/patching.py)
+def patch_one(update, row_id, noun):
+    """Run update(row_id, body) for one record. Returns (result, None) or (None, error response)."""
+    data = request.get_json(silent=True)
+    try:
+        result = update(row_id, data)
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+    if not result:
+        return None, (jsonify({"error": f"Failed to update {noun}"}), 400)
+    if result['status'] == 'not_found':
+        return None, (jsonify({"error": f"{noun.capitalize()} not found"}), 404)
+    return result, None
+
+def patch_many(fields, update, noun):
+    """Run update({id: changes}) for a bulk body. Returns (updates, results, None) or (None, None, error response)."""
+    try:
+        updates = parse_bulk(fields, request.get_json(silent=True),
+                             current_app.config.get('BULK_UPDATE_MAX_SIZE', 10000))
+        results = update(updates)
+    except ValueError as e:
+        return None, None, (jsonify({"error": str(e)}), 400)
+    if results is None:
+        return None, None, (jsonify({"error": f"Failed to update {noun}"}), 400)
+    return updates, results, None
+
+def bulk_response(results):
+    updated = sum(1 for r in results if r['status'] == 'updated')
+    return jsonify({"updated": updated, "results": results}), 200
+
+def revoke_deactivated(updates, results):
+    """Revoke the tokens of customers that an update just deactivated."""
+    for result in results:
+        if 'active' in result.get('changed', ()) and updates[result['id']]['active'] is False:
+            revoke_user_tokens(result['id'])
+
 # Customer CRUD operations
 @auth_bp.route('/customers', methods=['POST'])
 @jwt_required()
@@ -85,9 +196,11 @@ def signup():
         if Customer.query.filter_by(name=data['username']).first():
             return jsonify({"error": "User already exists"}), 409
         
-        hashed_password = generate_password_hash(data['password'])
-        access_token = create_access_token(identity={'username': data['username'], 'role': 'customer'})
-        
+        try:
+            hashed_password = password_hasher.hash_offloaded(data['password'])
+        except HasherBusy:
+            return jsonify({"error": "Server busy, please retry"}), 503
+
         new_customer = Customer(
             name=data['username'],
             city=data.get('city', ''),
@@ -95,11 +208,11 @@ def signup():
             phone_number=data.get('phone_number'),
             birth_date=data.get('birth_date'),
             password_hash=hashed_password,
-            token=access_token,
             active=True
         )
         db.session.add(new_customer)
         db.session.commit()
+        access_token, _ = create_tokens(new_customer.id, new_customer.name, 'customer')
 
         return jsonify({"message": "User registered successfully", "access_token": access_token}), 201
 
@@ -114,18 +227,41 @@ def get_customer(id):
     customer = Customer.query.get_or_404(id)
     return jsonify(customer.to_dict())
 
-@auth_bp.route('/customers/<int:id>', methods=['PUT'])
+@auth_bp.route('/customers/<int:id>/loans', methods=['GET'])
+@jwt_required()
+def get_customer_loans(id):
+    if not is_admin_or_root():
+        return jsonify({"error": "Unauthorized access"}), 403
+    customer = DBManager.get_customer_with_loans(id)
+    if not customer:
+        return jsonify({"error": "Customer not found"}), 404
+    data = customer.to_dict()
+    data['loans'] = [loan.to_detail_dict() for loan in customer.loans]
+    return jsonify(data)
+
+@auth_bp.route('/customers/<int:id>', methods=['PUT', 'PATCH'])
 @jwt_required()
 def update_customer(id):
+    """Change the columns in the body; nothing is written when they already match."""
     if not is_admin_or_root():
         return jsonify({"error": "Unauthorized access"}), 403
-    data = request.get_json()
-    customer = Customer.query.get_or_404(id)
-    for key, value in data.items():
-        if hasattr(customer, key):
-            setattr(customer, key, value)
-    db.session.commit()
-    return jsonify(customer.to_dict())
+    result, error = patch_one(DBManager.update_customer, id, 'customer')
+    if error:
+        return error
+    revoke_deactivated({id: request.get_json()}, [result])
+    return jsonify(db.session.get(Customer, id).to_dict())
+
+@auth_bp.route('/customers', methods=['PATCH'])
+@jwt_required()
+def update_customers():
+    """Update many customers in one transaction; the response lists the outcome per customer."""
+    if not is_admin_or_root():
+        return jsonify({"error": "Unauthorized access"}), 403
+    updates, results, error = patch_many(CUSTOMER_FIELDS, DBManager.update_customers, 'customers')
+    if error:
+        return error
+    revoke_deactivated(updates, results)
+    return bulk_response(results)
 
 @auth_bp.route('/customers/<int:id>', methods=['DELETE'])
 @jwt_required()
@@ -135,6 +271,7 @@ def delete_customer(id):
     customer = Customer.query.get_or_404(id)
     customer.active = False
     db.session.commit()
+    revoke_user_tokens(id)
     return jsonify({"message": "Customer deactivated"})
 
 # Book CRUD operations
@@ -144,9 +281,9 @@ def add_book():
     if not is_admin_or_root():
         return jsonify({"error": "Unauthorized access"}), 403
     data = request.get_json()
-    new_book = Book(**data)
-    db.session.add(new_book)
-    db.session.commit()
+    new_book = DBManager.create_book(data)
+    if not new_book:
+        return jsonify({"error": "Failed to add book"}), 400
     return jsonify(new_book.to_dict()), 201
 
 @auth_bp.route('/books/<int:id>', methods=['GET'])
@@ -154,32 +291,116 @@ def add_book():
 def get_book(id):
     if not is_admin_or_root():
         return jsonify({"error": "Unauthorized access"}), 403
-    book = Book.query.get_or_404(id)
-    return jsonify(book.to_dict())
+    book = DBManager.get_book_dict(id)
+    if not book:
+        return jsonify({"error": "Book not found"}), 404
+    return jsonify(book)
 
-@auth_bp.route('/books/<int:id>', methods=['PUT'])
+@auth_bp.route('/books/<int:id>', methods=['PUT', 'PATCH'])
 @jwt_required()
 def update_book(id):
+    """Change the columns in the body; nothing is written when they already match."""
     if not is_admin_or_root():
         return jsonify({"error": "Unauthorized access"}), 403
-    data = request.get_json()
-    book = Book.query.get_or_404(id)
-    for key, value in data.items():
-        if hasattr(book, key):
-            setattr(book, key, value)
-    db.session.commit()
-    return jsonify(book.to_dict())
+    _, error = patch_one(DBManager.update_book, id, 'book')
+    if error:
+        return error
+    return jsonify(db.session.get(Book, id).to_dict())
+
+@auth_bp.route('/books', methods=['PATCH'])
+@jwt_required()
+def update_books():
+    """Update many books (e.g. move them to another loan type) with set-based UPDATEs."""
+    if not is_admin_or_root():
+        return jsonify({"error": "Unauthorized access"}), 403
+    _, results, error = patch_many(BOOK_FIELDS, DBManager.update_books, 'books')
+    if error:
+        return error
+    return bulk_response(results)
 
 @auth_bp.route('/books/<int:id>', methods=['DELETE'])
 @jwt_required()
 def delete_book(id):
     if not is_admin_or_root():
         return jsonify({"error": "Unauthorized access"}), 403
-    book = Book.query.get_or_404(id)
-    book.active = False
-    db.session.commit()
+    Book.query.get_or_404(id)
+    if not DBManager.deactivate_book(id):
+        return jsonify({"error": "Failed to deactivate book"}), 400
     return jsonify({"message": "Book deactivated"})
 
+# Bulk import
+@auth_bp.route('/import/<kind>', methods=['POST'])
+@jwt_required()
+def bulk_import(kind):
+    """
+    Import books or customers from a CSV or JSON-lines request body.
+    The format comes from ?format= or the Content-Type; ?batch_size= overrides IMPORT_BATCH_SIZE.
+    At most IMPORT_HTTP_MAX_PLAIN_PASSWORDS customers may carry a plain password.
+    An unreadable body answers 400 with the report of what was imported before the break.
+    """
+    if not is_admin_or_root():
+        return jsonify({"error": "Unauthorized access"}), 403
+    if kind not in ('books', 'customers'):
+        return jsonify({"error": "Unknown import kind"}), 404
+
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'csv' if request.mimetype == 'text/csv' else 'jsonl'
+    if fmt not in FORMATS:
+        return jsonify({"error": f"Unsupported format '{fmt}'"}), 400
+    batch_size = request.args.get('batch_size', current_app.config.get('IMPORT_BATCH_SIZE', 1000), type=int)
+    if not batch_size or batch_size < 1:
+        return jsonify({"error": "batch_size must be a positive integer"}), 400
+
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    try:
+        report = import_records(kind, stream, fmt, batch_size,
+                                current_app.config.get('IMPORT_MAX_REPORTED_ERRORS', 1000),
+                                current_app.config.get('IMPORT_HTTP_MAX_PLAIN_PASSWORDS', 2000))
+    except Exception as e:
+        log_error(f"Error importing {kind}: {str(e)}")
+        return jsonify({"error": "Import failed"}), 500
+    return jsonify(report), 400 if report['aborted'] else 200
+
+# Streaming exports
+def export_args():
+    """Read ?format= and ?active= for the export endpoints. Returns (format, active) or raises ValueError."""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}'")
+    active = request.args.get('active')
+    if active is not None:
+        if active.lower() not in ('true', 'false', '1', '0'):
+            raise ValueError("active must be true or false")
+        active = active.lower() in ('true', '1')
+    return fmt, active
+
+@auth_bp.route('/loans/export', methods=['GET'])
+@jwt_required()
+def export_loans():
+    """Stream the full loan history as NDJSON (default) or a JSON array."""
+    if not is_admin_or_root():
+        return jsonify({"error": "Unauthorized access"}), 403
+    try:
+        fmt, active = export_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return export.export_response(export.loans_statement(active), fmt,
+                                  current_app.config.get('EXPORT_BATCH_SIZE', 1000), 'loans')
+
+@auth_bp.route('/books/export', methods=['GET'])
+@jwt_required()
+def export_books():
+    """Stream the book catalog as NDJSON (default) or a JSON array."""
+    if not is_admin_or_root():
+        return jsonify({"error": "Unauthorized access"}), 403
+    try:
+        fmt, active = export_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return export.export_response(export.books_statement(active), fmt,
+                                  current_app.config.get('EXPORT_BATCH_SIZE', 1000), 'books')
+
 # Loan CRUD operations
 @auth_bp.route('/loans', methods=['POST'])
 @jwt_required()
@@ -187,9 +408,9 @@ def add_loan():
     if not is_admin_or_root():
         return jsonify({"error": "Unauthorized access"}), 403
     data = request.get_json()
-    new_loan = Loan(**data)
-    db.session.add(new_loan)
-    db.session.commit()
+    new_loan = DBManager.create_loan(data)
+    if not new_loan:
+        return jsonify({"error": "Failed to create loan"}), 400
     return jsonify(new_loan.to_dict()), 201
 
 @auth_bp.route('/loans/<int:id>', methods=['GET'])
@@ -197,36 +418,107 @@ def add_loan():
 def get_loan(id):
     if not is_admin_or_root():
         return jsonify({"error": "Unauthorized access"}), 403
-    loan = Loan.query.get_or_404(id)
-    return jsonify(loan.to_dict())
+    loan = DBManager.get_loan_with_details(id)
+    if not loan:
+        return jsonify({"error": "Loan not found"}), 404
+    return jsonify(loan.to_detail_dict())
 
-@auth_bp.route('/loans/<int:id>', methods=['PUT'])
+@auth_bp.route('/loans/<int:id>', methods=['PUT', 'PATCH'])
 @jwt_required()
 def update_loan(id):
+    """Change the columns in the body; nothing is written when they already match."""
     if not is_admin_or_root():
         return jsonify({"error": "Unauthorized access"}), 403
-    data = request.get_json()
-    loan = Loan.query.get_or_404(id)
-    for key, value in data.items():
-        if hasattr(loan, key):
-            setattr(loan, key, value)
-    db.session.commit()
-    return jsonify(loan.to_dict())
+    _, error = patch_one(DBManager.update_loan, id, 'loan')
+    if error:
+        return error
+    return jsonify(db.session.get(Loan, id).to_dict())
+
+@auth_bp.route('/loans', methods=['PATCH'])
+@jwt_required()
+def update_loans():
+    """Update many loans in one transaction; the response lists the outcome per loan."""
+    if not is_admin_or_root():
+        return jsonify({"error": "Unauthorized access"}), 403
+    _, results, error = patch_many(LOAN_FIELDS, DBManager.update_loans, 'loans')
+    if error:
+        return error
+    return bulk_response(results)
 
 @auth_bp.route('/loans/<int:id>', methods=['DELETE'])
 @jwt_required()
 def delete_loan(id):
     if not is_admin_or_root():
         return jsonify({"error": "Unauthorized access"}), 403
-    loan = Loan.query.get_or_404(id)
-    loan.active = False
-    db.session.commit()
+    Loan.query.get_or_404(id)
+    if not DBManager.deactivate_loan(id):
+        return jsonify({"error": "Failed to deactivate loan"}), 400
     return jsonify({"message": "Loan deactivated"})
 
+@auth_bp.route('/loans/<int:id>/return', methods=['POST'])
+@jwt_required()
+def return_loan(id):
+    if not is_admin_or_root():
+        return jsonify({"error": "Unauthorized access"}), 403
+    Loan.query.get_or_404(id)
+    loan = DBManager.return_loan(id)
+    if not loan:
+        return jsonify({"error": "Failed to return loan"}), 400
+    return jsonify(loan.to_dict())
+
+def batch_loan_ids():
+    """Read {"loan_ids": [...]} from the request body. Returns (ids, None) or (None, error response)."""
+    data = request.get_json(silent=True) or {}
+    loan_ids = data.get('loan_ids')
+    if not isinstance(loan_ids, list) or not loan_ids or not all(isinstance(i, int) for i in loan_ids):
+        return None, (jsonify({"error": "loan_ids must be a non-empty list of integers"}), 400)
+    max_size = current_app.config.get('LOAN_BATCH_MAX_SIZE', 500)
+    if len(loan_ids) > max_size:
+        return None, (jsonify({"error": f"At most {max_size} loans per batch"}), 400)
+    return list(dict.fromkeys(loan_ids)), None
+
+@auth_bp.route('/loans/return', methods=['POST'])
+@jwt_required()
+def return_loans():
+    """Return a stack of loans in one transaction; the response lists the outcome per loan."""
+    if not is_admin_or_root():
+        return jsonify({"error": "Unauthorized access"}), 403
+    loan_ids, error = batch_loan_ids()
+    if error:
+        return error
+    results = DBManager.return_loans(loan_ids)
+    if results is None:
+        return jsonify({"error": "Failed to return loans"}), 500
+    returned = sum(1 for r in results if r['status'] == 'returned')
+    return jsonify({"returned": returned, "results": results}), 200
+
+@auth_bp.route('/loans/renew', methods=['POST'])
+@jwt_required()
+def renew_loans():
+    """Renew a list of open loans in one transaction; the response lists the new due dates."""
+    if not is_admin_or_root():
+        return jsonify({"error": "Unauthorized access"}), 403
+    loan_ids, error = batch_loan_ids()
+    if error:
+        return error
+    results = DBManager.renew_loans(loan_ids)
+    if results is None:
+        return jsonify({"error": "Failed to renew loans"}), 500
+    renewed = sum(1 for r in results if r['status'] == 'renewed')
+    return jsonify({"renewed": renewed, "results": results}), 200
+
 @auth_bp.route('/loans/late', methods=['GET'])
 @jwt_required()
 def check_late_loans():
     if not is_admin_or_root():
         return jsonify({"error": "Unauthorized access"}), 403
-    late_loans = Loan.query.filter(Loan.due_date < datetime.utcnow(), Loan.returned == False).all()
-    return jsonify([loan.to_dict() for loan in late_loans])
+    # ?format=ndjson|json streams the summary table instead of building one response
+    if request.args.get('format'):
+        fmt = request.args['format']
+        if fmt not in export.FORMATS:
+            return jsonify({"error": f"Unsupported format '{fmt}'"}), 400
+        return export.export_response(export.late_loans_statement(), fmt,
+                                      current_app.config.get('EXPORT_BATCH_SIZE', 1000), 'late_loans')
+    now = datetime.utcnow()
+    late_loans = DBManager.get_late_loans()
+    return jsonify([loan.to_dict(now) for loan in late_loans])
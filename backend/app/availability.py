@@ -0,0 +1,179 @@
+from datetime import timedelta
+from sqlalchemy import select, insert, update, delete, func, case, and_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from app.LibModels import db, Book, Loan, LoanType, BookAvailability
+from app.logger import log_info, log_error
+
+# ------------------------------------------------------------
+# Availability projection
+#
+# The bookavailability table is a read model derived from books, loantypes and loans.
+# Write paths call refresh_availability() for the book they touched, or
+# refresh_availability_rows() for many (inside their own transaction), and
+# rebuild_availability() recomputes the whole table in set-based SQL.
+# ------------------------------------------------------------
+
+STATUS_AVAILABLE = 'Available'
+STATUS_ON_LOAN = 'On Loan'
+STATUS_INACTIVE = 'Inactive'
+
+# Statuses shown in the customer catalog (inactive books are hidden)
+LISTED_STATUSES = (STATUS_AVAILABLE, STATUS_ON_LOAN)
+
+
+class add_days(FunctionElement):
+    """SQL expression for `date + days`, compiled per database dialect."""
+    type = db.DateTime()
+    name = 'add_days'
+    inherit_cache = True
+
+
+@compiles(add_days)
+def _add_days_mysql(element, compiler, **kw):
+    date, days = list(element.clauses)
+    return f"DATE_ADD({compiler.process(date, **kw)}, INTERVAL {compiler.process(days, **kw)} DAY)"
+
+
+@compiles(add_days, 'sqlite')
+def _add_days_sqlite(element, compiler, **kw):
+    date, days = list(element.clauses)
+    return f"datetime({compiler.process(date, **kw)}, '+' || {compiler.process(days, **kw)} || ' days')"
+
+
+def open_loan_filter():
+    """Condition for a loan that currently holds its book."""
+    return and_(Loan.is_loaned == True, Loan.active == True)
+
+
+def refresh_availability(book_id):
+    """
+    Recompute the bookavailability row for one book.
+    Runs in the caller's session and does not commit.
+    """
+    book = db.session.get(Book, book_id)
+    if not book:
+        return None
+
+    open_loan = Loan.query.filter(Loan.book_id == book_id, open_loan_filter()) \
+        .order_by(Loan.loan_date.desc()).first()
+
+    row = db.session.get(BookAvailability, book_id) or BookAvailability(book_id=book_id)
+    row.book_name = book.name
+    row.author = book.author
+    row.year_published = book.year_published
+    row.image_url = book.image_url
+    row.loan_type_id = book.loan_type_id
+    row.loan_type = book.loan_type.type_name if book.loan_type else None
+
+    if not book.active:
+        row.availability_status = STATUS_INACTIVE
+        row.return_date = None
+    elif open_loan:
+        row.availability_status = STATUS_ON_LOAN
+        row.return_date = open_loan.due_date or open_loan.loan_date + timedelta(days=book.loan_type.max_days)
+    else:
+        row.availability_status = STATUS_AVAILABLE
+        row.return_date = None
+
+    db.session.add(row)
+    return row
+
+
+def release_books(book_ids):
+    """
+    Mark books Available again once none of their loans is open (set-based batch
+    counterpart of refresh_availability). Runs in the caller's session and does not commit.
+    """
+    if not book_ids:
+        return 0
+    still_loaned = select(Loan.id).where(Loan.book_id == BookAvailability.book_id, open_loan_filter()).exists()
+    result = db.session.execute(
+        update(BookAvailability)
+        .where(BookAvailability.book_id.in_(book_ids),
+               BookAvailability.availability_status == STATUS_ON_LOAN,
+               ~still_loaned)
+        .values(availability_status=STATUS_AVAILABLE, return_date=None)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def set_return_dates(book_ids, return_date):
+    """Move the expected return date of books on loan. Runs in the caller's session and does not commit."""
+    if not book_ids:
+        return 0
+    result = db.session.execute(
+        update(BookAvailability)
+        .where(BookAvailability.book_id.in_(book_ids),
+               BookAvailability.availability_status == STATUS_ON_LOAN)
+        .values(return_date=return_date)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+AVAILABILITY_COLUMNS = ['book_id', 'book_name', 'author', 'year_published', 'image_url',
+                        'loan_type_id', 'loan_type', 'return_date', 'availability_status']
+
+
+def _availability_rows():
+    """SELECT producing bookavailability rows (AVAILABILITY_COLUMNS) from books, loantypes and loans."""
+    latest_open = select(Loan.book_id,
+                         func.max(Loan.loan_date).label('loan_date'),
+                         func.max(Loan.due_date).label('due_date')) \
+        .where(open_loan_filter()) \
+        .group_by(Loan.book_id) \
+        .subquery()
+
+    return select(
+        Book.id,
+        Book.name,
+        Book.author,
+        Book.year_published,
+        Book.image_url,
+        Book.loan_type_id,
+        LoanType.type_name,
+        case(
+            (Book.active == False, None),
+            # Loans made before due_date existed fall back to loan_date + max_days
+            (latest_open.c.loan_date != None, func.coalesce(
+                latest_open.c.due_date, add_days(latest_open.c.loan_date, LoanType.max_days))),
+            else_=None
+        ),
+        case(
+            (Book.active == False, STATUS_INACTIVE),
+            (latest_open.c.loan_date != None, STATUS_ON_LOAN),
+            else_=STATUS_AVAILABLE
+        )
+    ).join(LoanType, Book.loan_type_id == LoanType.id) \
+     .outerjoin(latest_open, latest_open.c.book_id == Book.id)
+
+
+def refresh_availability_rows(book_ids):
+    """
+    Recompute the rows of many books with one DELETE and one INSERT ... SELECT (set-based
+    counterpart of refresh_availability). Runs in the caller's session and does not commit.
+    """
+    if not book_ids:
+        return 0
+    book_ids = list(book_ids)
+    db.session.execute(delete(BookAvailability).where(BookAvailability.book_id.in_(book_ids)))
+    result = db.session.execute(
+        insert(BookAvailability).from_select(AVAILABILITY_COLUMNS, _availability_rows().where(Book.id.in_(book_ids)))
+    )
+    return result.rowcount
+
+
+def rebuild_availability():
+    """Recompute the whole bookavailability table with one DELETE and one INSERT ... SELECT."""
+    try:
+        db.session.execute(delete(BookAvailability))
+        result = db.session.execute(insert(BookAvailability).from_select(AVAILABILITY_COLUMNS, _availability_rows()))
+        db.session.commit()
+        log_info(f"Rebuilt book availability projection ({result.rowcount} rows)")
+        return result.rowcount
+    except Exception as e:
+        db.session.rollback()
+        log_error(f"Error rebuilding book availability: {str(e)}")
+        raise
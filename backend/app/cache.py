@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ------------------------------------------------------------
+# In-process read-through cache
+#
+# Keys are tuples whose first item is a namespace ('books', 'availability', ...),
+# so a write path can drop everything it may have made stale with invalidate().
+# A value loaded while its namespace was invalidated is returned but not stored: it
+# may have been read before the write committed.
+# Values should be plain data (dicts/lists), never ORM objects bound to a session.
+#
+# The cache and its versions live in one process. Under gunicorn each worker only
+# sees its own writes; another worker's write reaches it when the entry expires, so
+# catalog reads there can be up to CACHE_TTL_SECONDS stale.
+# ------------------------------------------------------------
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a per-entry time to live and a size bound."""
+
+    def __init__(self, maxsize=1024, ttl=30, enabled=True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped by invalidate(); HTTP ETags are derived from these (see app/httpcache.py)
+        self._versions = {}
+        self._generation = 0
+
+    def configure(self, maxsize=None, ttl=None, enabled=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            if enabled is not None:
+                self.enabled = enabled
+            self._data.clear()
+            self._generation += 1
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def _snapshot(self, namespace):
+        with self._lock:
+            return self._generation, self._versions.get(namespace, 0)
+
+    def set(self, key, value, snapshot=None):
+        """Store value; with a snapshot taken before loading it, only if nothing invalidated it since."""
+        with self._lock:
+            if snapshot is not None and snapshot != (self._generation, self._versions.get(key[0], 0)):
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() and caching its result on a miss."""
+        if not self.enabled:
+            return loader()
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            snapshot = self._snapshot(key[0])
+            value = loader()
+            if value is not None:
+                self.set(key, value, snapshot)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """get_or_load() for a coroutine loader (the async API)."""
+        if not self.enabled:
+            return await loader()
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            snapshot = self._snapshot(key[0])
+            value = await loader()
+            if value is not None:
+                self.set(key, value, snapshot)
+        return value
+
+    def invalidate(self, *namespaces):
+        """Drop every entry in the given namespaces, or the whole cache if none are given."""
+        with self._lock:
+            if not namespaces:
+                self._data.clear()
+                self._generation += 1
+            else:
+                for key in [k for k in self._data if k[0] in namespaces]:
+                    del self._data[key]
+                for namespace in namespaces:
+                    self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            self.invalidations += 1
+
+    def version(self, *namespaces):
+        """A string that changes whenever any of the namespaces is invalidated in this process."""
+        with self._lock:
+            return '.'.join([str(self._generation)] + [str(self._versions.get(ns, 0)) for ns in namespaces])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+# Shared cache for catalog, availability and loan type reads
+catalog_cache = TTLCache()
+
+
+def init_cache(app):
+    catalog_cache.configure(
+        maxsize=app.config.get('CACHE_MAX_ENTRIES', 1024),
+        ttl=app.config.get('CACHE_TTL_SECONDS', 30),
+        enabled=app.config.get('CACHE_ENABLED', True)
+    )
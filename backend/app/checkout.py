@@ -0,0 +1,138 @@
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from app.LibModels import db, Book, Loan, BookAvailability, IdempotencyKey
+from app.availability import STATUS_AVAILABLE, STATUS_ON_LOAN, refresh_availability
+from app.cache import catalog_cache
+from app.my_loans import add_my_loan
+from app.logger import log_info, log_error, log_warning
+
+# ------------------------------------------------------------
+# Loan checkout
+#
+# A copy is claimed with a conditional UPDATE on its bookavailability row
+# ('Available' -> 'On Loan'). The database lets exactly one concurrent transaction
+# match that row, so the loser sees rowcount 0 and gets a 409 instead of a second
+# loan. The loan insert and the idempotency key are written in the same transaction
+# as the claim, so a retried request either finds the stored result or claims the
+# copy itself, never both; one that loses the claim to a concurrent request with the
+# same key answers with that request's stored result rather than 409.
+# ------------------------------------------------------------
+
+
+class CheckoutResult:
+    """HTTP status and body of one checkout attempt."""
+
+    def __init__(self, status_code, body, loan=None, replayed=False):
+        self.status_code = status_code
+        self.body = body
+        self.loan = loan
+        self.replayed = replayed
+
+
+def _stored_result(user_id, key, fingerprint, ttl):
+    """The stored result for an idempotency key, or None. Expired keys are deleted."""
+    stored = db.session.get(IdempotencyKey, (user_id, key))
+    if stored is None:
+        return None
+    if ttl and stored.created_at and stored.created_at < datetime.utcnow() - ttl:
+        db.session.delete(stored)
+        db.session.commit()
+        return None
+    if stored.request_fingerprint != fingerprint:
+        return CheckoutResult(422, {"error": "Idempotency-Key was already used for a different request"})
+    return CheckoutResult(stored.status_code, json.loads(stored.response_body), replayed=True)
+
+
+def _claim(book_id, due_date):
+    """Flip the book's availability row from Available to On Loan. True if this call won."""
+    result = db.session.execute(
+        update(BookAvailability)
+        .where(BookAvailability.book_id == book_id,
+               BookAvailability.availability_status == STATUS_AVAILABLE)
+        .values(availability_status=STATUS_ON_LOAN, return_date=due_date)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def checkout_book(cust_id, book_id, loan_date=None, idempotency_key=None, key_owner=None, key_ttl=None):
+    """
+    Lend a book to a customer if it is available.
+
+    idempotency_key is scoped to key_owner (the caller's user id, defaulting to
+    cust_id); a repeated key with the same request returns the stored result.
+    Returns a CheckoutResult: 201 with the loan, 404 for unknown or inactive books,
+    409 when the copy is already on loan, 422 for a reused key.
+    """
+    key_owner = key_owner if key_owner is not None else cust_id
+    fingerprint = f"checkout:{cust_id}:{book_id}"
+    if idempotency_key:
+        stored = _stored_result(key_owner, idempotency_key, fingerprint, key_ttl)
+        if stored is not None:
+            return stored
+
+    try:
+        book = Book.query.options(joinedload(Book.loan_type)).filter(Book.id == book_id).first()
+        if not book or not book.active:
+            return CheckoutResult(404, {"error": "Book not found"})
+        loan_date = loan_date or datetime.utcnow()
+        due_date = loan_date + timedelta(days=book.loan_type.max_days)
+
+        claimed = _claim(book_id, due_date)
+        if not claimed and db.session.get(BookAvailability, book_id) is None:
+            # No projection row yet (e.g. a book inserted outside DBManager); build it and retry
+            refresh_availability(book_id)
+            db.session.flush()
+            claimed = _claim(book_id, due_date)
+        if not claimed:
+            db.session.rollback()
+            if idempotency_key:
+                # A concurrent request with the same key may be the one that claimed the copy;
+                # the claim waited for it to commit, so its stored result is visible now
+                stored = _stored_result(key_owner, idempotency_key, fingerprint, None)
+                if stored is not None:
+                    return stored
+            return CheckoutResult(409, {"error": "Book is already on loan"})
+
+        loan = Loan(cust_id=cust_id, book_id=book_id, loan_date=loan_date, due_date=due_date)
+        db.session.add(loan)
+        db.session.flush()
+        add_my_loan(loan, book)
+        body = loan.to_dict()
+        if idempotency_key:
+            db.session.add(IdempotencyKey(
+                user_id=key_owner,
+                key=idempotency_key,
+                request_fingerprint=fingerprint,
+                loan_id=loan.id,
+                status_code=201,
+                response_body=json.dumps(body)
+            ))
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if idempotency_key:
+            # A concurrent retry with the same key committed first
+            stored = _stored_result(key_owner, idempotency_key, fingerprint, None)
+            if stored is not None:
+                return stored
+        log_warning(f"Checkout of book ID {book_id} for customer ID {cust_id} rejected: {str(e.orig)}")
+        return CheckoutResult(400, {"error": "Invalid customer or book"})
+    except Exception as e:
+        db.session.rollback()
+        log_error(f"Error checking out book ID {book_id} for customer ID {cust_id}: {str(e)}")
+        return CheckoutResult(500, {"error": "Internal server error"})
+
+    catalog_cache.invalidate('availability')
+    log_info(f"Book ID {book_id} checked out to customer ID {cust_id} (loan ID {loan.id})")
+    return CheckoutResult(201, body, loan=loan)
+
+
+def purge_idempotency_keys(older_than):
+    """Delete idempotency keys created before `older_than`. Returns the number deleted."""
+    result = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < older_than))
+    db.session.commit()
+    return result.rowcount
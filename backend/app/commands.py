@@ -0,0 +1,79 @@
+import json
+import click
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from app.availability import rebuild_availability
+from app.importer import import_records, FORMATS
+from app.late_loans import materialize_late_loans
+from app.my_loans import rebuild_my_loans
+from app.checkout import purge_idempotency_keys
+from app.schema import init_database
+
+# ------------------------------------------------------------
+# Flask CLI commands (run with `flask <command>`)
+# ------------------------------------------------------------
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Apply the pending migrations (as `flask db upgrade` does) and add missing loan types."""
+    applied, added = init_database()
+    for message in applied:
+        click.echo(message)
+    click.echo(f"Applied {len(applied)} migrations, added {added} loan types.")
+
+@click.command('rebuild-availability')
+@with_appcontext
+def rebuild_availability_command():
+    """Recompute the bookavailability table from books, loan types and loans."""
+    count = rebuild_availability()
+    click.echo(f"Rebuilt availability for {count} books.")
+
+@click.command('rebuild-my-loans')
+@click.option('--recreate', is_flag=True,
+              help='Drop and recreate the my_loans table first (databases created before it had cust_id).')
+@with_appcontext
+def rebuild_my_loans_command(recreate):
+    """Recompute the my_loans customer feed from loans and books."""
+    count = rebuild_my_loans(recreate)
+    click.echo(f"Rebuilt the loan feed with {count} loans.")
+
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(['books', 'customers']))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None,
+              help='Input format (defaults from the file extension).')
+@click.option('--batch-size', type=int, default=None, help='Rows per INSERT/transaction.')
+@with_appcontext
+def import_data_command(kind, source, fmt, batch_size):
+    """Bulk import books or customers from a CSV or JSON-lines file ('-' for stdin)."""
+    if fmt is None:
+        fmt = 'csv' if source.name.endswith('.csv') else 'jsonl'
+    report = import_records(kind, source, fmt,
+                            batch_size or current_app.config.get('IMPORT_BATCH_SIZE', 1000),
+                            current_app.config.get('IMPORT_MAX_REPORTED_ERRORS', 1000))
+    click.echo(json.dumps(report, indent=2))
+
+@click.command('refresh-late-loans')
+@with_appcontext
+def refresh_late_loans_command():
+    """Rebuild the late_loans summary table now."""
+    count = materialize_late_loans()
+    click.echo(f"{count} loans are overdue.")
+
+@click.command('purge-idempotency-keys')
+@with_appcontext
+def purge_idempotency_keys_command():
+    """Delete checkout idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS."""
+    cutoff = datetime.utcnow() - timedelta(hours=current_app.config.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    count = purge_idempotency_keys(cutoff)
+    click.echo(f"Deleted {count} idempotency keys.")
+
+def register_commands(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(rebuild_availability_command)
+    app.cli.add_command(rebuild_my_loans_command)
+    app.cli.add_command(import_data_command)
+    app.cli.add_command(refresh_late_loans_command)
+    app.cli.add_command(purge_idempotency_keys_command)
@@ -0,0 +1,158 @@
+import threading
+import time
+from flask import has_app_context
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from app.LibModels import db
+from app.logger import log_info
+from app.routing import init_routing
+
+# ------------------------------------------------------------
+# Engine factory and connection pool
+#
+# Every entry point calls init_db(app), so app.py, create_app() and the benchmarks
+# all get the same pool settings. The pool is a QueuePool that also records how
+# long checkouts had to wait, which /metrics reports next to the pool occupancy.
+# DATABASE_REPLICA_URLS are added as replica binds for app/routing.py.
+# ------------------------------------------------------------
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that keeps checkout counts, wait times, timeouts and invalidations."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.invalidations = 0
+        event.listen(self, 'invalidate', self._count_invalidation)
+
+    def _count_invalidation(self, dbapi_connection, connection_record, exception):
+        with self._stats_lock:
+            self.invalidations += 1
+
+    def _do_get(self):
+        # Includes the time spent opening a new connection when the pool grows
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'size': self.size(),
+                'checked_out': self.checkedout(),
+                'checked_in': self.checkedin(),
+                'overflow': max(0, self.overflow()),
+                'max_overflow': self._max_overflow,
+                'checkouts': self.checkouts,
+                'wait_seconds': round(self.wait_seconds, 6),
+                'max_wait_seconds': round(self.max_wait_seconds, 6),
+                'timeouts': self.timeouts,
+                'invalidations': self.invalidations
+            }
+
+
+def pool_options(config, uri):
+    """Engine keyword arguments for the pool, from the DB_POOL_* settings."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # In-memory SQLite needs a single shared connection (Flask-SQLAlchemy uses StaticPool)
+        return {}
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True)
+    }
+
+
+def init_db(app):
+    """Apply the pool settings and bind the shared `db` to the app."""
+    options = pool_options(app.config, app.config['SQLALCHEMY_DATABASE_URI'])
+    # Anything set explicitly in SQLALCHEMY_ENGINE_OPTIONS wins over the DB_POOL_* defaults
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    # Each replica URL becomes a bind the RoutingSession can send reads to
+    replicas = [url for url in app.config.get('DATABASE_REPLICA_URLS') or () if url]
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for i, url in enumerate(replicas):
+        binds[f'replica_{i}'] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.config['DB_REPLICA_BINDS'] = [f'replica_{i}' for i in range(len(replicas))]
+    db.init_app(app)
+    # init_app registers an (empty) metadata per bind; replicas are never create_all/drop_all targets
+    for key in app.config['DB_REPLICA_BINDS']:
+        db.metadatas.pop(key, None)
+    init_routing(app, db)
+
+    from app.instrumentation import metrics
+    if pool_metrics not in metrics.collectors:
+        metrics.collectors.append(pool_metrics)
+
+    if options.get('poolclass') is TimedQueuePool:
+        log_info(f"Connection pool: size {options['pool_size']}, overflow {options['max_overflow']}, "
+                 f"timeout {options['pool_timeout']}s, recycle {options['pool_recycle']}s, "
+                 f"pre-ping {options['pool_pre_ping']}")
+    if replicas:
+        log_info(f"Routing read-only queries to {len(replicas)} replica(s)")
+    return db
+
+
+def dispose_engines(app, close=True):
+    """
+    Drop every engine's pooled connections. After fork() call it with close=False: the
+    child gets fresh pools and leaves the sockets it inherited to the parent.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def pool_stats():
+    """Stats for every engine with a TimedQueuePool, keyed by bind name ('default' for the primary)."""
+    if not has_app_context():
+        return {}
+    return {bind or 'default': engine.pool.stats()
+            for bind, engine in db.engines.items()
+            if isinstance(engine.pool, TimedQueuePool)}
+
+
+def pool_metrics():
+    stats = pool_stats()
+    if not stats:
+        return []
+    series = (
+        ('db_pool_size', 'size', 'gauge', 'Connections the pool keeps open.'),
+        ('db_pool_checked_out', 'checked_out', 'gauge', 'Connections currently in use.'),
+        ('db_pool_overflow', 'overflow', 'gauge', 'Connections open beyond pool_size.'),
+        ('db_pool_checkouts_total', 'checkouts', 'counter', 'Connection checkouts.'),
+        ('db_pool_wait_seconds_total', 'wait_seconds', 'counter', 'Time spent waiting for a connection.'),
+        ('db_pool_max_wait_seconds', 'max_wait_seconds', 'gauge', 'Longest single wait for a connection.'),
+        ('db_pool_timeouts_total', 'timeouts', 'counter', 'Checkouts that gave up after pool_timeout.'),
+        ('db_pool_invalidations_total', 'invalidations', 'counter', 'Connections discarded as broken or stale.'),
+    )
+    lines = []
+    for name, key, kind, help_text in series:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for bind, values in stats.items():
+            lines.append(f'{name}{{bind="{bind}"}} {values[key]}')
+    return lines
@@ -1,8 +1,20 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select, update, and_, or_
+from sqlalchemy.orm import joinedload, selectinload
 from app.logger import log_info, log_error, log_debug
-from app.LibModels import db, Book, LoanType, Customer, Loan, BookAvailability
-from datetime import datetime
-from app.auth import auth_bp, init_auth
+from app.LibModels import db, Book, LoanType, Customer, Loan, BookAvailability, LateLoan, MyLoan
+from app.availability import (refresh_availability, refresh_availability_rows, release_books, set_return_dates,
+                              LISTED_STATUSES)
+from app.cache import catalog_cache
+from app.late_loans import forget_late_loans
+from app.my_loans import refresh_my_loans, return_my_loans, set_my_loan_due_dates
+from app.patching import (CUSTOMER_FIELDS, BOOK_FIELDS, LOAN_FIELDS, LOAN_OPENING_FIELDS, parse_changes,
+                          check_references, check_open_loans, apply_updates, patch_results)
+from app.routing import replica_read
+from app.search import search_index
+from app.checkout import checkout_book
+from app.serializers import BOOK, AVAILABLE_BOOK, LOAN_DETAIL, MY_LOAN, LOAN_TYPE
+from datetime import datetime, timedelta
 
 class DBManager:
 
@@ -33,6 +45,7 @@ class DBManager:
             return None
 
    @staticmethod
+   @replica_read
    def get_customer_by_id(customer_id):
       try:
             return Customer.query.get(customer_id)
@@ -40,22 +53,46 @@ class DBManager:
             log_error(f"Error fetching customer by ID: {str(e)}")
             return None
 
+   @staticmethod
+   @replica_read
+   def get_customer_with_loans(customer_id):
+      """Customer plus all their loans and each loan's book, in three queries total."""
+      try:
+            return Customer.query \
+               .options(selectinload(Customer.loans).joinedload(Loan.book)) \
+               .filter(Customer.id == customer_id) \
+               .first()
+      except Exception as e:
+            log_error(f"Error fetching customer with loans: {str(e)}")
+            return None
+
    @staticmethod
    def update_customer(customer_id, update_data):
+      """
+      Partial update of one customer (see update_customers). Returns its result dict, or
+      None if the transaction failed; raises ValueError for an invalid body.
+      """
+      results = DBManager.update_customers({customer_id: parse_changes(CUSTOMER_FIELDS, update_data)})
+      return results[0] if results else None
+
+   @staticmethod
+   def update_customers(updates):
+      """
+      Apply {id: changes} (from app.patching) in one transaction, writing only the columns
+      that differ. Returns per-item results, or None if the transaction failed.
+      """
       try:
-            customer = Customer.query.get(customer_id)
-            if not customer:
-               log_error(f"Customer ID {customer_id} not found")
-               return None
-            for key, value in update_data.items():
-               if hasattr(customer, key):
-                  setattr(customer, key, value)
-            db.session.commit()
-            log_info(f"Customer ID {customer_id} updated successfully")
-            return customer
+            found, diffs = apply_updates(Customer, updates)
+            if diffs:
+               db.session.commit()
+            else:
+               # Nothing changed: end the read transaction without a write
+               db.session.rollback()
+            log_info(f"Updated {len(diffs)} of {len(updates)} customers")
+            return patch_results(list(updates), found, diffs)
       except Exception as e:
             db.session.rollback()
-            log_error(f"Error updating customer: {str(e)}")
+            log_error(f"Error updating customers: {str(e)}")
             return None
 
    @staticmethod
@@ -78,18 +115,37 @@ class DBManager:
    #        Book Operations         #
    # -------------------------------#
 
+   @staticmethod
+   def _resolve_loan_type_id(loan_type):
+      """Accept a loan type ID (int or numeric string) or a loan type name."""
+      if isinstance(loan_type, int) or (isinstance(loan_type, str) and loan_type.isdigit()):
+            return int(loan_type)
+      found = LoanType.query.filter_by(type_name=loan_type).first()
+      if not found:
+            raise ValueError(f"Unknown loan type '{loan_type}'")
+      return found.id
+
    @staticmethod
    def create_book(book_data):
       try:
-            new_book = BookAvailability(
-               book_name=book_data['book_name'],
+            # Accept both the model field names and the catalog form names (book_name / loan_type)
+            name = book_data.get('name', book_data.get('book_name'))
+            new_book = Book(
+               name=name,
                author=book_data['author'],
-               year_published=book_data['year_published'],
-               loan_type=book_data['loan_type']
+               year_published=int(book_data['year_published']),
+               image_url=book_data.get('image_url'),
+               loan_type_id=DBManager._resolve_loan_type_id(
+                  book_data.get('loan_type_id', book_data.get('loan_type'))),
+               active=True
             )
             db.session.add(new_book)
+            db.session.flush()
+            refresh_availability(new_book.id)
             db.session.commit()
-            log_info(f"Book {book_data['book_name']} added to database")
+            catalog_cache.invalidate('books', 'availability')
+            search_index.update_book(new_book)
+            log_info(f"Book {name} added to database")
             return new_book
       except Exception as e:
             db.session.rollback()
@@ -97,41 +153,143 @@ class DBManager:
             return None
 
    @staticmethod
-   def get_books():
+   def _filter_books(query, author=None, year_from=None, year_to=None, loan_type_id=None, active=None):
+      """Apply the optional catalog filters to a query over Book."""
+      if author is not None:
+            query = query.filter(Book.author == author)
+      if year_from is not None:
+            query = query.filter(Book.year_published >= year_from)
+      if year_to is not None:
+            query = query.filter(Book.year_published <= year_to)
+      if loan_type_id is not None:
+            query = query.filter(Book.loan_type_id == loan_type_id)
+      if active is not None:
+            query = query.filter(Book.active == active)
+      return query
+
+   @staticmethod
+   def _keyset_page(query, after_id, limit, key=Book.id):
+      """Fetch one page ordered by the key column, returning (rows, has_more)."""
+      if after_id is not None:
+            query = query.filter(key > after_id)
+      rows = query.order_by(key).limit(limit + 1).all()
+      return rows[:limit], len(rows) > limit
+
+   @staticmethod
+   def _filter_available(query, author=None, year_from=None, year_to=None, loan_type_id=None):
+      """Restrict a query over BookAvailability to listed books matching the catalog filters."""
+      query = query.filter(BookAvailability.availability_status.in_(LISTED_STATUSES))
+      if author is not None:
+            query = query.filter(BookAvailability.author == author)
+      if year_from is not None:
+            query = query.filter(BookAvailability.year_published >= year_from)
+      if year_to is not None:
+            query = query.filter(BookAvailability.year_published <= year_to)
+      if loan_type_id is not None:
+            query = query.filter(BookAvailability.loan_type_id == loan_type_id)
+      return query
+
+   @staticmethod
+   @replica_read
+   def get_book_availability(book_id):
+      """Primary key lookup on the availability projection."""
+      try:
+            return db.session.get(BookAvailability, book_id)
+      except Exception as e:
+            log_error(f"Error fetching availability for book ID {book_id}: {str(e)}")
+            return None
+
+   @staticmethod
+   @replica_read
+   def get_book_by_id(book_id):
+      try:
+            return db.session.get(Book, book_id)
+      except Exception as e:
+            log_error(f"Error fetching book by ID: {str(e)}")
+            return None
+
+   @staticmethod
+   @replica_read
+   def get_book_with_loans(book_id):
+      """Book with its loan type, loans and the customer of each loan, without per-row queries."""
       try:
-            log_info("Fetching all books from database")
-            return Book.query.all()
+            return Book.query \
+               .options(joinedload(Book.loan_type),
+                        selectinload(Book.loans).joinedload(Loan.customer)) \
+               .filter(Book.id == book_id) \
+               .first()
       except Exception as e:
-            log_error(f"Error fetching books: {str(e)}")
+            log_error(f"Error fetching book with loans: {str(e)}")
+            return None
+
+   @staticmethod
+   @replica_read
+   def get_loan_types_with_books():
+      """All loan types with their books loaded by one extra IN query."""
+      try:
+            return LoanType.query.options(selectinload(LoanType.books)).order_by(LoanType.id).all()
+      except Exception as e:
+            log_error(f"Error fetching loan types: {str(e)}")
             return []
 
    @staticmethod
    def update_book(book_id, update_data):
+      """
+      Partial update of one book (see update_books). Returns its result dict, or None if
+      the transaction failed; raises ValueError for an invalid body.
+      """
+      results = DBManager.update_books({book_id: parse_changes(BOOK_FIELDS, update_data)})
+      return results[0] if results else None
+
+   @staticmethod
+   def update_books(updates):
+      """
+      Apply {id: changes} (from app.patching) in one transaction, with one UPDATE per
+      distinct change, then refresh the availability rows, loan feed copies and search
+      entries of the books that changed. Returns per-item results, or None if the
+      transaction failed; raises ValueError for an unknown loan type.
+      """
       try:
-            book = BookAvailability.query.get(book_id)
-            if not book:
-               log_error(f"Book ID {book_id} not found")
-               return None
-            for key, value in update_data.items():
-               if hasattr(book, key):
-                  setattr(book, key, value)
+            check_references(Book, updates)
+            found, diffs = apply_updates(Book, updates)
+            if not diffs:
+               db.session.rollback()
+               log_info(f"Updated 0 of {len(updates)} books")
+               return patch_results(list(updates), found, diffs)
+            refresh_availability_rows(list(diffs))
+            # The loan feed carries a copy of the title and author
+            refresh_my_loans(book_ids=[book_id for book_id, diff in diffs.items() if {'name', 'author'} & diff.keys()])
+            reindexed = [book_id for book_id, diff in diffs.items() if {'name', 'author', 'active'} & diff.keys()]
+            indexed_rows = db.session.execute(
+               select(Book.id, Book.name, Book.author, Book.active).where(Book.id.in_(reindexed))
+            ).all() if reindexed else []
             db.session.commit()
-            log_info(f"Book ID {book_id} updated successfully")
-            return book
+            catalog_cache.invalidate('books', 'availability')
+            for row in indexed_rows:
+               search_index.update_book(row)
+            log_info(f"Updated {len(diffs)} of {len(updates)} books")
+            return patch_results(list(updates), found, diffs)
+      except ValueError:
+            db.session.rollback()
+            raise
       except Exception as e:
             db.session.rollback()
-            log_error(f"Error updating book: {str(e)}")
+            log_error(f"Error updating books: {str(e)}")
             return None
 
    @staticmethod
    def deactivate_book(book_id):
       try:
-            book = BookAvailability.query.get(book_id)
+            book = db.session.get(Book, book_id)
             if not book:
                log_error(f"Book ID {book_id} not found")
                return None
-            book.active = False
+            book.deactivate()
+            db.session.flush()
+            refresh_availability(book_id)
             db.session.commit()
+            catalog_cache.invalidate('books', 'availability')
+            search_index.update_book(book)
             log_info(f"Book ID {book_id} deactivated successfully")
             return book
       except Exception as e:
@@ -139,30 +297,90 @@ class DBManager:
             log_error(f"Error deactivating book: {str(e)}")
             return None
 
+   # -------------------------------#
+   #      Cached Catalog Reads      #
+   # -------------------------------#
+   # These return plain dicts so they can be shared across requests through catalog_cache.
+   # Book writes invalidate the 'books' and 'availability' namespaces, loan writes 'availability'.
+   # Listings select only the serialized columns (app/serializers.py), not ORM entities.
+
+   @staticmethod
+   @replica_read
+   def get_loan_types():
+      def load():
+            return LOAN_TYPE.dump_rows(db.session.execute(LOAN_TYPE.select().order_by(LoanType.id)))
+      try:
+            return catalog_cache.get_or_load(('loan_types',), load)
+      except Exception as e:
+            log_error(f"Error fetching loan types: {str(e)}")
+            return []
+
+   @staticmethod
+   @replica_read
+   def get_book_dict(book_id):
+      def load():
+            row = db.session.execute(BOOK.select().where(Book.id == book_id)).first()
+            return BOOK.dump_row(row) if row else None
+      try:
+            return catalog_cache.get_or_load(('books', 'id', book_id), load)
+      except Exception as e:
+            log_error(f"Error fetching book by ID: {str(e)}")
+            return None
+
+   @staticmethod
+   @replica_read
+   def get_books_page_dicts(after_id=None, limit=50, **filters):
+      """Cached keyset page of the catalog as (book dicts, last_id); last_id is None on the final page."""
+      def load():
+            log_info(f"Fetching books page after ID {after_id} (limit {limit})")
+            query = DBManager._filter_books(db.session.query(*BOOK.columns), **filters)
+            rows, has_more = DBManager._keyset_page(query, after_id, limit)
+            return BOOK.dump_rows(rows), (rows[-1].id if has_more else None)
+      key = ('books', 'page', after_id, limit, tuple(sorted(filters.items())))
+      return catalog_cache.get_or_load(key, load)
+
+   @staticmethod
+   @replica_read
+   def get_availability_dict(book_id):
+      def load():
+            row = db.session.execute(AVAILABLE_BOOK.select().where(BookAvailability.book_id == book_id)).first()
+            return AVAILABLE_BOOK.dump_row(row) if row else None
+      return catalog_cache.get_or_load(('availability', 'id', book_id), load)
+
+   @staticmethod
+   @replica_read
+   def get_available_books_page_dicts(after_id=None, limit=50, **filters):
+      """Cached page of the customer catalog as (availability dicts, last_id)."""
+      def load():
+            log_info(f"Fetching available books page after ID {after_id} (limit {limit})")
+            query = DBManager._filter_available(db.session.query(*AVAILABLE_BOOK.columns), **filters)
+            rows, has_more = DBManager._keyset_page(query, after_id, limit, key=BookAvailability.book_id)
+            return AVAILABLE_BOOK.dump_rows(rows), (rows[-1].book_id if has_more else None)
+      key = ('availability', 'page', after_id, limit, tuple(sorted(filters.items())))
+      return catalog_cache.get_or_load(key, load)
+
    # -------------------------------#
    #         Loan Operations        #
    # -------------------------------#
 
    @staticmethod
    def create_loan(loan_data):
+      """Lend a book via checkout_book(), which refuses a copy that is already on loan."""
       try:
-            new_loan = Loan(
-               customer_id=loan_data['customer_id'],
-               book_id=loan_data['book_id'],
-               loan_date=loan_data['loan_date'],
-               due_date=loan_data['due_date'],
-               returned=loan_data.get('returned', False)
-            )
-            db.session.add(new_loan)
-            db.session.commit()
-            log_info(f"Loan for customer ID {loan_data['customer_id']} created successfully")
-            return new_loan
+            loan_date = loan_data.get('loan_date')
+            if isinstance(loan_date, str):
+               loan_date = datetime.fromisoformat(loan_date)
+            result = checkout_book(loan_data['cust_id'], loan_data['book_id'], loan_date=loan_date)
+            if not result.loan:
+               log_error(f"Loan of book ID {loan_data['book_id']} not created: {result.body['error']}")
+               return None
+            return result.loan
       except Exception as e:
-            db.session.rollback()
             log_error(f"Error creating loan: {str(e)}")
             return None
 
    @staticmethod
+   @replica_read
    def get_loan_by_id(loan_id):
       try:
             return Loan.query.get(loan_id)
@@ -170,22 +388,136 @@ class DBManager:
             log_error(f"Error fetching loan by ID: {str(e)}")
             return None
 
+   @staticmethod
+   @replica_read
+   def get_loan_with_details(loan_id):
+      """Loan with its book and customer joined into the same query."""
+      try:
+            return Loan.query \
+               .options(joinedload(Loan.book), joinedload(Loan.customer)) \
+               .filter(Loan.id == loan_id) \
+               .first()
+      except Exception as e:
+            log_error(f"Error fetching loan with details: {str(e)}")
+            return None
+
+   @staticmethod
+   @replica_read
+   def get_loans_page_dicts(after_id=None, limit=50, active=None):
+      """Keyset page of loans as (dicts with book and customer names, last_id), from one joined SELECT."""
+      try:
+            query = db.session.query(*LOAN_DETAIL.columns) \
+               .join(Book, Loan.book_id == Book.id) \
+               .join(Customer, Loan.cust_id == Customer.id)
+            if active is not None:
+               query = query.filter(Loan.active == active)
+            rows, has_more = DBManager._keyset_page(query, after_id, limit, key=Loan.id)
+            return LOAN_DETAIL.dump_rows(rows), (rows[-1].id if has_more else None)
+      except Exception as e:
+            log_error(f"Error fetching loans: {str(e)}")
+            return [], None
+
+   # Values of the my-loans `status` filter and the is_loaned value each one selects
+   MY_LOAN_STATUSES = {'all': None, 'current': True, 'history': False}
+
+   @staticmethod
+   def _my_loans_select(customer_id, status='all', after=None, limit=50):
+      """
+      One page (plus one row) of a customer's loan feed, newest first. With a status
+      filter this is a single range scan on the (cust_id, is_loaned, loan_date) index.
+      `after` is the (loan_date, loan_id) of the previous page's last row.
+      """
+      query = MY_LOAN.select().where(MyLoan.cust_id == customer_id)
+      is_loaned = DBManager.MY_LOAN_STATUSES[status]
+      if is_loaned is not None:
+            query = query.where(MyLoan.is_loaned == is_loaned)
+      if after is not None:
+            loan_date, loan_id = after
+            query = query.where(or_(MyLoan.loan_date < loan_date,
+                                    and_(MyLoan.loan_date == loan_date, MyLoan.loan_id < loan_id)))
+      return query.order_by(MyLoan.loan_date.desc(), MyLoan.loan_id.desc()).limit(limit + 1)
+
+   @staticmethod
+   def _my_loans_page(rows, limit):
+      """(loan dicts, (loan_date, loan_id) to continue after, or None on the last page)."""
+      if len(rows) <= limit:
+            return MY_LOAN.dump_rows(rows), None
+      last = rows[limit - 1]
+      return MY_LOAN.dump_rows(rows[:limit]), (last.loan_date, last.loan_id)
+
+   @staticmethod
+   @replica_read
+   def get_my_loans_page_dicts(customer_id, status='all', after=None, limit=50):
+      """A page of the customer's loans from the my_loans feed; see _my_loans_select()."""
+      try:
+            rows = db.session.execute(DBManager._my_loans_select(customer_id, status, after, limit)).all()
+            return DBManager._my_loans_page(rows, limit)
+      except Exception as e:
+            log_error(f"Error fetching loans for customer ID {customer_id}: {str(e)}")
+            return [], None
+
+   @staticmethod
+   @replica_read
+   def get_customer_loans(customer_id):
+      """A customer's loans, newest first, with the book joined in."""
+      try:
+            return Loan.query \
+               .options(joinedload(Loan.book)) \
+               .filter(Loan.cust_id == customer_id) \
+               .order_by(Loan.loan_date.desc()) \
+               .all()
+      except Exception as e:
+            log_error(f"Error fetching loans for customer ID {customer_id}: {str(e)}")
+            return []
+
    @staticmethod
    def update_loan(loan_id, update_data):
+      """
+      Partial update of one loan (see update_loans). Returns its result dict, or None if
+      the transaction failed; raises ValueError for an invalid body.
+      """
+      results = DBManager.update_loans({loan_id: parse_changes(LOAN_FIELDS, update_data)})
+      return results[0] if results else None
+
+   @staticmethod
+   def update_loans(updates):
+      """
+      Apply {id: changes} (from app.patching) in one transaction, with one UPDATE per
+      distinct change, then refresh the availability of every book involved (including
+      the previous book of a moved loan) and the feed rows of the loans that changed.
+      Returns per-item results, or None if the transaction failed; raises ValueError for
+      an unknown customer or book, or for a change that would give a book a second open
+      loan (checkout is the way to lend a copy).
+      """
       try:
-            loan = Loan.query.get(loan_id)
-            if not loan:
-               log_error(f"Loan ID {loan_id} not found")
-               return None
-            for key, value in update_data.items():
-               if hasattr(loan, key):
-                  setattr(loan, key, value)
+            check_references(Loan, updates)
+            found, diffs = apply_updates(Loan, updates)
+            if not diffs:
+               db.session.rollback()
+               log_info(f"Updated 0 of {len(updates)} loans")
+               return patch_results(list(updates), found, diffs)
+            book_ids = set(db.session.scalars(select(Loan.book_id).where(Loan.id.in_(list(diffs)))))
+            # Moving or reopening a loan must not put a second open loan on a copy
+            opening = [loan_id for loan_id, diff in diffs.items() if set(diff) & set(LOAN_OPENING_FIELDS)]
+            if opening:
+               check_open_loans(set(db.session.scalars(select(Loan.book_id).where(Loan.id.in_(opening)))))
+            book_ids.update(diff['book_id'][0] for diff in diffs.values() if 'book_id' in diff)
+            refresh_availability_rows(book_ids)
+            refresh_my_loans(list(diffs))
+            # Loans closed by the update are no longer overdue
+            closed = [loan_id for loan_id, diff in diffs.items()
+                      if any(column in diff and diff[column][1] is False for column in ('is_loaned', 'active'))]
+            forget_late_loans(closed)
             db.session.commit()
-            log_info(f"Loan ID {loan_id} updated successfully")
-            return loan
+            catalog_cache.invalidate('availability')
+            log_info(f"Updated {len(diffs)} of {len(updates)} loans")
+            return patch_results(list(updates), found, diffs)
+      except ValueError:
+            db.session.rollback()
+            raise
       except Exception as e:
             db.session.rollback()
-            log_error(f"Error updating loan: {str(e)}")
+            log_error(f"Error updating loans: {str(e)}")
             return None
 
    @staticmethod
@@ -196,7 +528,12 @@ class DBManager:
                log_error(f"Loan ID {loan_id} not found")
                return None
             loan.active = False
+            db.session.flush()
+            refresh_availability(loan.book_id)
+            forget_late_loans([loan_id])
+            refresh_my_loans([loan_id])
             db.session.commit()
+            catalog_cache.invalidate('availability')
             log_info(f"Loan ID {loan_id} deactivated successfully")
             return loan
       except Exception as e:
@@ -205,10 +542,126 @@ class DBManager:
             return None
 
    @staticmethod
+   def return_loan(loan_id):
+      try:
+            loan = db.session.get(Loan, loan_id)
+            if not loan:
+               log_error(f"Loan ID {loan_id} not found")
+               return None
+            loan.mark_returned()
+            db.session.flush()
+            refresh_availability(loan.book_id)
+            forget_late_loans([loan_id])
+            return_my_loans([loan_id], loan.return_date)
+            db.session.commit()
+            catalog_cache.invalidate('availability')
+            log_info(f"Loan ID {loan_id} returned successfully")
+            return loan
+      except Exception as e:
+            db.session.rollback()
+            log_error(f"Error returning loan: {str(e)}")
+            return None
+
+   @staticmethod
+   def _lock_loans(loan_ids):
+      """Load the listed loans with their loan type's max_days, locking the rows (FOR UPDATE)."""
+      rows = db.session.query(Loan.id, Loan.book_id, Loan.is_loaned, Loan.active, LoanType.max_days) \
+         .join(Book, Loan.book_id == Book.id) \
+         .join(LoanType, Book.loan_type_id == LoanType.id) \
+         .filter(Loan.id.in_(loan_ids)) \
+         .with_for_update(of=Loan) \
+         .all()
+      return {row.id: row for row in rows}
+
+   @staticmethod
+   def _batch_results(loan_ids, loans, done_status, extra=None):
+      """Per-item results in request order: done_status for open loans, else why they were skipped."""
+      results = []
+      for loan_id in loan_ids:
+            loan = loans.get(loan_id)
+            if loan is None:
+               results.append({'loan_id': loan_id, 'status': 'not_found'})
+            elif not (loan.is_loaned and loan.active):
+               results.append({'loan_id': loan_id, 'status': 'not_on_loan'})
+            else:
+               results.append(dict({'loan_id': loan_id, 'status': done_status}, **(extra(loan) if extra else {})))
+      return results
+
+   @staticmethod
+   def return_loans(loan_ids):
+      """
+      Return many loans with one UPDATE and one commit (Loan.mark_returned semantics).
+      Returns per-item results, or None if the transaction failed.
+      """
+      try:
+            loans = DBManager._lock_loans(loan_ids)
+            open_loans = [loan for loan in loans.values() if loan.is_loaned and loan.active]
+            open_ids = [loan.id for loan in open_loans]
+            if open_ids:
+               returned_at = datetime.utcnow()
+               db.session.execute(
+                  update(Loan)
+                  .where(Loan.id.in_(open_ids), Loan.is_loaned == True, Loan.active == True)
+                  .values(is_loaned=False, active=False, return_date=returned_at)
+                  .execution_options(synchronize_session=False)
+               )
+               release_books({loan.book_id for loan in open_loans})
+               forget_late_loans(open_ids)
+               return_my_loans(open_ids, returned_at)
+            db.session.commit()
+            if open_ids:
+               catalog_cache.invalidate('availability')
+            log_info(f"Returned {len(open_ids)} of {len(loan_ids)} loans in one batch")
+            return DBManager._batch_results(loan_ids, loans, 'returned')
+      except Exception as e:
+            db.session.rollback()
+            log_error(f"Error returning loans: {str(e)}")
+            return None
+
+   @staticmethod
+   def renew_loans(loan_ids):
+      """
+      Extend many open loans to today + their loan type's max_days, with one UPDATE per
+      distinct max_days and one commit. Returns per-item results, or None on failure.
+      """
+      try:
+            now = datetime.utcnow()
+            loans = DBManager._lock_loans(loan_ids)
+            by_max_days = {}
+            for loan in loans.values():
+               if loan.is_loaned and loan.active:
+                  by_max_days.setdefault(loan.max_days, []).append(loan)
+            for max_days, group in by_max_days.items():
+               due_date = now + timedelta(days=max_days)
+               db.session.execute(
+                  update(Loan)
+                  .where(Loan.id.in_([loan.id for loan in group]))
+                  .values(due_date=due_date)
+                  .execution_options(synchronize_session=False)
+               )
+               set_return_dates({loan.book_id for loan in group}, due_date)
+               set_my_loan_due_dates([loan.id for loan in group], due_date)
+            renewed_ids = [loan.id for group in by_max_days.values() for loan in group]
+            # Renewed loans are no longer overdue
+            forget_late_loans(renewed_ids)
+            db.session.commit()
+            if renewed_ids:
+               catalog_cache.invalidate('availability')
+            log_info(f"Renewed {len(renewed_ids)} of {len(loan_ids)} loans in one batch")
+            due = lambda loan: {'due_date': (now + timedelta(days=loan.max_days)).strftime("%Y-%m-%d")}
+            return DBManager._batch_results(loan_ids, loans, 'renewed', due)
+      except Exception as e:
+            db.session.rollback()
+            log_error(f"Error renewing loans: {str(e)}")
+            return None
+
+   @staticmethod
+   @replica_read
    def get_late_loans():
+      """Overdue loans from the late_loans summary table (refreshed on a schedule), oldest due first."""
       try:
             log_info("Fetching late loans")
-            return Loan.query.filter(Loan.due_date < datetime.utcnow(), Loan.returned == False).all()
+            return LateLoan.query.order_by(LateLoan.due_date).all()
       except Exception as e:
             log_error(f"Error fetching late loans: {str(e)}")
             return []
@@ -0,0 +1,123 @@
+import json
+from datetime import date, datetime
+from flask import Response, stream_with_context
+from sqlalchemy import select
+from app.LibModels import db, Book, Customer, Loan, LoanType, LateLoan
+from app.logger import log_info, log_error
+
+# ------------------------------------------------------------
+# Streaming exports
+#
+# Rows are fetched with yield_per (a server-side cursor on MySQL) and written to the
+# response as they arrive, so memory stays flat and the first byte goes out before
+# the whole result has been read.
+# ------------------------------------------------------------
+
+FORMATS = ('ndjson', 'json')
+
+MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json'
+}
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+
+def row_to_dict(row):
+    """Plain dict from a column-only result row, with dates formatted as strings."""
+    return {key: _json_value(value) for key, value in row._mapping.items()}
+
+
+def _generate(statement, fmt, batch_size, name):
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    count = 0
+    try:
+        if fmt == 'json':
+            yield '['
+        for partition in result.partitions():
+            lines = [json.dumps(row_to_dict(row)) for row in partition]
+            if fmt == 'json':
+                chunk = ','.join(lines)
+                yield (',' + chunk) if count else chunk
+            else:
+                yield '\n'.join(lines) + '\n'
+            count += len(lines)
+        if fmt == 'json':
+            yield ']'
+        log_info(f"Streamed {count} rows of {name} export")
+    except Exception as e:
+        # Headers are already sent, so the best we can do is stop and log
+        log_error(f"Error streaming {name} export after {count} rows: {str(e)}")
+        raise
+    finally:
+        result.close()
+
+
+def export_response(statement, fmt='ndjson', batch_size=1000, name='export'):
+    """Stream a column-only SELECT as NDJSON or as one chunked JSON array."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}' (expected one of {', '.join(FORMATS)})")
+    response = Response(stream_with_context(_generate(statement, fmt, batch_size, name)),
+                        mimetype=MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
+
+
+def loans_statement(active=None):
+    """All loans with customer and book names, ordered by loan ID."""
+    statement = select(
+        Loan.id,
+        Loan.cust_id,
+        Customer.name.label('customer_name'),
+        Loan.book_id,
+        Book.name.label('book_name'),
+        Book.author,
+        Loan.loan_date,
+        Loan.due_date,
+        Loan.return_date,
+        Loan.is_loaned,
+        Loan.active
+    ).join(Customer, Loan.cust_id == Customer.id) \
+     .join(Book, Loan.book_id == Book.id) \
+     .order_by(Loan.id)
+    if active is not None:
+        statement = statement.where(Loan.active == active)
+    return statement
+
+
+def books_statement(active=None):
+    """All books with their loan type name, ordered by book ID."""
+    statement = select(
+        Book.id,
+        Book.name,
+        Book.author,
+        Book.year_published,
+        Book.image_url,
+        Book.loan_type_id,
+        LoanType.type_name.label('loan_type'),
+        Book.active
+    ).join(LoanType, Book.loan_type_id == LoanType.id) \
+     .order_by(Book.id)
+    if active is not None:
+        statement = statement.where(Book.active == active)
+    return statement
+
+
+def late_loans_statement():
+    """The materialized late loans, oldest due date first."""
+    return select(
+        LateLoan.loan_id,
+        LateLoan.cust_id,
+        LateLoan.customer_name,
+        LateLoan.book_id,
+        LateLoan.book_name,
+        LateLoan.loan_date,
+        LateLoan.due_date,
+        LateLoan.refreshed_at
+    ).order_by(LateLoan.due_date)
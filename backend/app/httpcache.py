@@ -0,0 +1,122 @@
+import functools
+import gzip
+import hashlib
+import os
+import time
+from flask import request, current_app, make_response
+from flask_jwt_extended import get_jwt
+from app.cache import catalog_cache
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it responses are gzip-compressed only
+    brotli = None
+
+# ------------------------------------------------------------
+# HTTP caching and compression
+#
+# Catalog endpoints get a weak ETag built from the catalog_cache versions of the
+# namespaces they read. The version is bumped by every invalidate() on a book or
+# loan write, so a matching If-None-Match is answered with 304 before the view
+# (and the database) runs. Writes made in another worker process are not seen
+# by this process's counters, so the ETag also changes every CACHE_TTL_SECONDS,
+# which keeps it exactly as fresh as the in-process cache it describes.
+# ------------------------------------------------------------
+
+# (pid, tag): differs per process, so ETags from different workers never falsely match.
+# Made on first use in each process, not at import: gunicorn's master imports this
+# module once and forks every worker from it.
+_process_tag = (None, None)
+
+
+def _tag():
+    global _process_tag
+    pid = os.getpid()
+    if _process_tag[0] != pid:
+        _process_tag = (pid, os.urandom(4).hex())
+    return _process_tag[1]
+
+
+def catalog_etag(namespaces):
+    ttl = max(int(current_app.config.get('CACHE_TTL_SECONDS', 30)), 1)
+    window = int(time.time() // ttl)
+    path = hashlib.blake2b(request.full_path.encode(), digest_size=6).hexdigest()
+    return f'{_tag()}-{catalog_cache.version(*namespaces)}-{window}-{path}'
+
+
+def _etag_matches(etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = {tag.strip().removeprefix('W/').strip('"') for tag in header.split(',')}
+    return etag in candidates
+
+
+def conditional(namespaces=(), cache_control='private, no-cache', roles=None):
+    """
+    ETag / If-None-Match handling for a GET view whose data lives in the given
+    catalog_cache namespaces, plus its Cache-Control policy. Place it below
+    @jwt_required() so the token is still checked before a 304. For a view limited
+    to some roles, list them in `roles`: other callers never get a 304, the view
+    runs and refuses them itself.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            if roles is not None and get_jwt().get('role') not in roles:
+                return view(*args, **kwargs)
+            etag = catalog_etag(namespaces)
+            if _etag_matches(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
+
+
+def _accepted_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def init_http_cache(app):
+    """Compress large JSON and text responses with brotli or gzip, per Accept-Encoding."""
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    gzip_level = app.config.get('COMPRESS_GZIP_LEVEL', 5)
+    brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', 4)
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or not (response.mimetype == 'application/json' or response.mimetype.startswith('text/'))):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = _accepted_encoding()
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        if encoding == 'br':
+            data = brotli.compress(data, quality=brotli_quality)
+        else:
+            data = gzip.compress(data, compresslevel=gzip_level)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,259 @@
+import csv
+import json
+from datetime import date
+from sqlalchemy import select, insert, func
+from app.LibModels import db, Book, Customer, LoanType
+from app.passwords import password_hasher
+from app.availability import refresh_availability_rows
+from app.search import search_index
+from app.cache import catalog_cache
+from app.logger import log_info, log_error
+
+# ------------------------------------------------------------
+# Bulk import of books and customers
+#
+# Input is parsed as a stream (one row at a time), validated, and inserted with one
+# executemany INSERT per batch. Each batch is its own transaction; if a batch fails
+# it is retried row by row so the report can point at the rows that broke it. New
+# books get their availability rows in the same transaction as their batch. A stream
+# that breaks part way (bad encoding, malformed CSV) stops the import, and the report
+# still counts the batches committed before it.
+#
+# Plain customer passwords are hashed a batch at a time on the password hashing pool.
+# At production hash costs that is still tens of milliseconds per row per pool thread,
+# so an HTTP import takes at most max_plain_passwords of them; load more with
+# `flask import-data`, or send precomputed password_hash values.
+# ------------------------------------------------------------
+
+FORMATS = ('csv', 'jsonl')
+
+
+def iter_rows(stream, fmt):
+    """Yield (row_number, dict or Exception) for each record of a text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for number, row in enumerate(reader, start=1):
+            yield number, row
+    elif fmt == 'jsonl':
+        number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("each line must be a JSON object")
+                yield number, row
+            except ValueError as e:
+                yield number, e
+    else:
+        raise ValueError(f"Unsupported import format '{fmt}' (expected one of {', '.join(FORMATS)})")
+
+
+def _required(row, *names):
+    for name in names:
+        value = row.get(name)
+        if value not in (None, ''):
+            return value
+    raise ValueError(f"missing field '{names[0]}'")
+
+
+def _optional_int(value, field):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{field}' must be an integer")
+
+
+def validate_book(row, loan_types):
+    """Turn an input row into Book column values. loan_types maps names and IDs to IDs."""
+    loan_type = str(_required(row, 'loan_type_id', 'loan_type'))
+    if loan_type not in loan_types:
+        raise ValueError(f"unknown loan type '{loan_type}'")
+    name = str(_required(row, 'name', 'book_name'))
+    author = str(_required(row, 'author'))
+    if len(name) > 50 or len(author) > 50:
+        raise ValueError("name and author must be at most 50 characters")
+    return {
+        'name': name,
+        'author': author,
+        'year_published': _optional_int(_required(row, 'year_published'), 'year_published'),
+        'image_url': row.get('image_url') or None,
+        'loan_type_id': loan_types[loan_type],
+        'active': True
+    }
+
+
+def validate_customer(row):
+    """
+    Turn an input row into Customer column values.
+    Rows may carry a precomputed password_hash, which must be in a format login can
+    verify; a plain password is left under 'password' for _hash_passwords().
+    """
+    if row.get('password_hash'):
+        if not password_hasher.is_hash(row['password_hash']):
+            raise ValueError("'password_hash' is not a supported password hash")
+        password_hash, password = row['password_hash'], None
+    else:
+        password_hash, password = None, str(_required(row, 'password'))
+    birth_date = row.get('birth_date') or None
+    if birth_date:
+        try:
+            birth_date = date.fromisoformat(birth_date)
+        except (TypeError, ValueError):
+            raise ValueError("'birth_date' must be YYYY-MM-DD")
+    return {
+        'name': str(_required(row, 'name', 'username')),
+        'city': row.get('city') or '',
+        'age': _optional_int(row.get('age'), 'age'),
+        'phone_number': row.get('phone_number') or None,
+        'birth_date': birth_date,
+        'password_hash': password_hash,
+        'active': True,
+        'password': password
+    }
+
+
+def _hash_passwords(batch):
+    """Replace the plain passwords of a validated customer batch with their hashes, on the hashing pool."""
+    values = [values for _, values in batch]
+    pending = [row for row in values if row['password'] is not None]
+    hashes = password_hasher.hash_many([row['password'] for row in pending])
+    for row, password_hash in zip(pending, hashes):
+        row['password_hash'] = password_hash
+    for row in values:
+        del row['password']
+
+
+class ImportReport:
+    """Counts and per-row errors for one import run."""
+
+    def __init__(self, kind, max_errors):
+        self.kind = kind
+        self.max_errors = max_errors
+        self.processed = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.aborted = None
+
+    def add_error(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'error': message})
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'processed': self.processed,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'aborted': self.aborted
+        }
+
+
+def _insert_batch(model, batch, report, after_insert=None):
+    """
+    Insert a batch of (row_number, values) in one transaction, falling back to row by row.
+    after_insert(last_id), if given, runs in each of those transactions with the highest
+    id that existed before its INSERT; what it returns is collected once committed.
+    """
+    def write(rows):
+        last_id = (db.session.scalar(select(func.max(model.id))) or 0) if after_insert else None
+        db.session.execute(insert(model), [values for _, values in rows])
+        result = after_insert(last_id) if after_insert else None
+        db.session.commit()
+        report.inserted += len(rows)
+        return [result] if after_insert else []
+
+    try:
+        return write(batch)
+    except Exception as e:
+        db.session.rollback()
+        log_error(f"Import batch of {len(batch)} {report.kind} failed, retrying row by row: {str(e)}")
+
+    results = []
+    for row in batch:
+        try:
+            results += write([row])
+        except Exception as e:
+            db.session.rollback()
+            report.add_error(row[0], str(getattr(e, 'orig', e)))
+    return results
+
+
+def _add_book_availability(last_id):
+    """Availability rows for the books just inserted (ids above last_id); returns their search fields."""
+    books = db.session.execute(select(Book.id, Book.name, Book.author).where(Book.id > last_id)).all()
+    refresh_availability_rows([book.id for book in books])
+    return books
+
+
+def import_records(kind, stream, fmt, batch_size=1000, max_errors=1000, max_plain_passwords=None):
+    """
+    Import 'books' or 'customers' from a CSV or JSON-lines text stream.
+    max_plain_passwords, if set, caps how many customer rows may carry a plain password
+    (each costs a full password hash); rows beyond it are reported as errors.
+    Returns the ImportReport as a dict.
+    """
+    if kind == 'books':
+        loan_types = {}
+        for loan_type in LoanType.query.all():
+            loan_types[loan_type.type_name] = loan_type.id
+            loan_types[str(loan_type.id)] = loan_type.id
+        model, validate = Book, lambda row: validate_book(row, loan_types)
+    elif kind == 'customers':
+        model, validate = Customer, validate_customer
+    else:
+        raise ValueError(f"Unsupported import kind '{kind}' (expected books or customers)")
+
+    after_insert = _add_book_availability if kind == 'books' else None
+    report = ImportReport(kind, max_errors)
+    inserted = []
+    batch = []
+    plain_passwords = 0
+
+    def flush(batch):
+        if kind == 'customers':
+            _hash_passwords(batch)
+        return _insert_batch(model, batch, report, after_insert)
+    try:
+        for row_number, row in iter_rows(stream, fmt):
+            report.processed += 1
+            if isinstance(row, Exception):
+                report.add_error(row_number, f"invalid JSON: {row}")
+                continue
+            try:
+                values = validate(row)
+                if kind == 'customers' and values['password'] is not None:
+                    plain_passwords += 1
+                    if max_plain_passwords is not None and plain_passwords > max_plain_passwords:
+                        raise ValueError(f"more than {max_plain_passwords} plain passwords; send password_hash "
+                                         f"values or use `flask import-data`")
+                batch.append((row_number, values))
+            except ValueError as e:
+                report.add_error(row_number, str(e))
+                continue
+            if len(batch) >= batch_size:
+                inserted += flush(batch)
+                batch = []
+    except (csv.Error, UnicodeDecodeError) as e:
+        # Rows read before the break are still imported; nothing after it is
+        report.aborted = f"input unreadable after row {report.processed}: {e}"
+        log_error(f"Import of {kind} stopped: {report.aborted}")
+    if batch:
+        inserted += flush(batch)
+
+    if kind == 'books' and report.inserted:
+        catalog_cache.invalidate('books', 'availability')
+        for books in inserted:
+            for book in books:
+                search_index.add(book.id, book.name, book.author)
+
+    log_info(f"Imported {report.inserted}/{report.processed} {kind} ({report.failed} failed)")
+    return report.to_dict()
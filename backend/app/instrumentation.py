@@ -0,0 +1,224 @@
+import hmac
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from flask import g, request, Response
+from app.querycount import start_request_tracking
+from app.logger import log_info, log_warning
+
+# ------------------------------------------------------------
+# Request instrumentation
+#
+# Every request records wall time, SQL statement count and SQL time per endpoint.
+# A sampled share of requests runs under cProfile, and the profile is written out
+# only when the request turns out to be slow. /metrics serves everything in the
+# Prometheus text format. It is off by default; when METRICS_ENABLED is set it only
+# answers requests carrying `Authorization: Bearer <METRICS_TOKEN>` (Prometheus'
+# bearer_token setting), and without a token the route is not registered at all.
+# ------------------------------------------------------------
+
+# Histogram buckets for request latency, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class EndpointStats:
+    __slots__ = ('requests', 'seconds', 'sql_statements', 'sql_seconds', 'buckets', 'statuses')
+
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.statuses = {}
+
+
+class MetricsRegistry:
+    """Thread-safe per-endpoint request statistics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        # Extra collectors, each returning Prometheus text lines (cache, pool, ...)
+        self.collectors = []
+
+    def record(self, endpoint, method, status, seconds, sql_statements, sql_seconds):
+        key = (endpoint, method)
+        with self._lock:
+            stats = self._endpoints.get(key)
+            if stats is None:
+                stats = self._endpoints[key] = EndpointStats()
+            stats.requests += 1
+            stats.seconds += seconds
+            stats.sql_statements += sql_statements
+            stats.sql_seconds += sql_seconds
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (stats.requests, stats.seconds, stats.sql_statements,
+                          stats.sql_seconds, list(stats.buckets), dict(stats.statuses))
+                    for key, stats in self._endpoints.items()}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP http_requests_total Requests handled, by endpoint, method and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        snapshot = sorted(self.snapshot().items(), key=lambda item: (str(item[0][0]), item[0][1]))
+        for (endpoint, method), (_, _, _, _, _, statuses) in snapshot:
+            for status, count in sorted(statuses.items()):
+                labels = f'endpoint="{endpoint}",method="{method}",status="{status}"'
+                lines.append(f'http_requests_total{{{labels}}} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Request wall time, by endpoint.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (endpoint, method), (requests, seconds, _, _, buckets, _) in snapshot:
+            labels = f'endpoint="{endpoint}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {requests}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {seconds:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {requests}')
+
+        lines += [
+            '# HELP sql_statements_total SQL statements executed while handling requests, by endpoint.',
+            '# TYPE sql_statements_total counter',
+        ]
+        for (endpoint, method), (_, _, sql_statements, _, _, _) in snapshot:
+            lines.append(f'sql_statements_total{{endpoint="{endpoint}",method="{method}"}} {sql_statements}')
+
+        lines += [
+            '# HELP sql_duration_seconds_total Time spent in SQL while handling requests, by endpoint.',
+            '# TYPE sql_duration_seconds_total counter',
+        ]
+        for (endpoint, method), (_, _, _, sql_seconds, _, _) in snapshot:
+            lines.append(f'sql_duration_seconds_total{{endpoint="{endpoint}",method="{method}"}} {sql_seconds:.6f}')
+
+        for collector in self.collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def cache_metrics():
+    from app.cache import catalog_cache
+    stats = catalog_cache.stats()
+    return [
+        '# HELP cache_hits_total Catalog cache hits.',
+        '# TYPE cache_hits_total counter',
+        f"cache_hits_total {stats['hits']}",
+        '# HELP cache_misses_total Catalog cache misses.',
+        '# TYPE cache_misses_total counter',
+        f"cache_misses_total {stats['misses']}",
+        '# HELP cache_entries Entries currently in the catalog cache.',
+        '# TYPE cache_entries gauge',
+        f"cache_entries {stats['size']}",
+    ]
+
+
+class SlowRequestProfiler:
+    """Profiles a random sample of requests and keeps the profiles of slow ones."""
+
+    def __init__(self, threshold_ms, sample_rate, directory, max_files):
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.max_files = max_files
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate or self._written >= self.max_files:
+            return None
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Only one profiler can be active at a time on newer Pythons; skip this sample
+            return None
+        return profiler
+
+    def finish(self, profiler, endpoint, seconds):
+        profiler.disable()
+        if seconds < self.threshold:
+            return
+        with self._lock:
+            if self._written >= self.max_files:
+                return
+            self._written += 1
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        path = os.path.join(self.directory, f"{endpoint or 'unknown'}-{stamp}-{int(seconds * 1000)}ms.prof")
+        profiler.dump_stats(path)
+        log_warning(f"Slow request {endpoint} took {seconds * 1000:.0f} ms, profile written to {path}")
+
+
+def init_instrumentation(app):
+    """Install the timing hooks, the slow request profiler and the /metrics endpoint."""
+    profiler = SlowRequestProfiler(
+        threshold_ms=app.config.get('PROFILE_SLOW_REQUEST_MS', 500),
+        sample_rate=app.config.get('PROFILE_SAMPLE_RATE', 0.0),
+        directory=app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles'),
+        max_files=app.config.get('PROFILE_MAX_FILES', 100)
+    )
+    if cache_metrics not in metrics.collectors:
+        metrics.collectors.append(cache_metrics)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        start_request_tracking()
+        g.profiler = profiler.start()
+
+    @app.after_request
+    def add_timing_header(response):
+        g.response_status = response.status_code
+        elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+        response.headers['Server-Timing'] = (f"app;dur={elapsed * 1000:.1f}, "
+                                             f"db;dur={g.get('sql_time', 0.0) * 1000:.1f}")
+        return response
+
+    @app.teardown_request
+    def record_request(exc):
+        started = g.get('request_started')
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if g.get('profiler') is not None:
+            profiler.finish(g.profiler, request.endpoint, elapsed)
+        metrics.record(request.endpoint or 'unmatched', request.method,
+                       g.get('response_status', 500), elapsed,
+                       g.get('sql_count', 0), g.get('sql_time', 0.0))
+
+    token = app.config.get('METRICS_TOKEN')
+    if app.config.get('METRICS_ENABLED', False) and not token:
+        log_warning("METRICS_ENABLED is set without METRICS_TOKEN; /metrics is not served")
+    elif app.config.get('METRICS_ENABLED', False):
+        expected = f"Bearer {token}".encode()
+
+        @app.route('/metrics')
+        def prometheus_metrics():
+            if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected):
+                return Response("Unauthorized\n", status=401, mimetype='text/plain')
+            return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    log_info("Request instrumentation enabled")
@@ -0,0 +1,54 @@
+from flask.json.provider import DefaultJSONProvider
+from app.logger import log_info, log_warning
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; without it Flask's json module is used
+    orjson = None
+
+# ------------------------------------------------------------
+# orjson-backed JSON for jsonify() and request.get_json()
+#
+# Output follows Flask's default provider: sorted keys, dates through Flask's own
+# default() (HTTP date strings) and a trailing newline. The one difference is that
+# non-ASCII text is sent as UTF-8 instead of \u escapes. Pretty-printed output
+# (debug mode) still goes through the default provider.
+# ------------------------------------------------------------
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes and decodes with orjson."""
+
+    def _options(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get('indent') or kwargs.get('cls') or kwargs.get('sort_keys') is False:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json(app):
+    """Use orjson for JSON when JSON_PROVIDER is 'orjson' and the package is installed."""
+    if app.config.get('JSON_PROVIDER') != 'orjson':
+        return
+    if orjson is None:
+        log_warning("JSON_PROVIDER is 'orjson' but orjson is not installed; using Flask's default JSON provider")
+        return
+    app.json = OrjsonProvider(app)
+    log_info("Using orjson for JSON responses")
@@ -0,0 +1,141 @@
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import select, insert, delete, literal
+from app.LibModels import db, Book, Customer, Loan, LateLoan
+from app.logger import log_info, log_error
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; there every process refreshes on its own
+    fcntl = None
+
+# ------------------------------------------------------------
+# Late loan detection
+#
+# Overdue loans are found with a range scan on the (is_loaned, due_date) index and
+# copied into the late_loans summary table, so the librarian dashboard reads a small
+# pre-joined table instead of scanning loans. A background thread refreshes it every
+# LATE_LOANS_REFRESH_SECONDS; returning a loan also removes its row right away.
+# ------------------------------------------------------------
+
+
+def overdue_loans_statement(now):
+    """Open loans whose due date has passed, with customer and book names."""
+    return select(
+        Loan.id,
+        Loan.cust_id,
+        Customer.name,
+        Loan.book_id,
+        Book.name,
+        Loan.loan_date,
+        Loan.due_date,
+        literal(now)
+    ).join(Customer, Loan.cust_id == Customer.id) \
+     .join(Book, Loan.book_id == Book.id) \
+     .where(Loan.is_loaned == True, Loan.due_date < now, Loan.active == True)
+
+
+def materialize_late_loans(now=None):
+    """Replace the late_loans table with the currently overdue loans. Returns the row count."""
+    now = now or datetime.utcnow()
+    try:
+        db.session.execute(delete(LateLoan))
+        result = db.session.execute(
+            insert(LateLoan).from_select([
+                'loan_id', 'cust_id', 'customer_name', 'book_id', 'book_name',
+                'loan_date', 'due_date', 'refreshed_at'
+            ], overdue_loans_statement(now))
+        )
+        db.session.commit()
+        log_info(f"Materialized {result.rowcount} late loans")
+        return result.rowcount
+    except Exception as e:
+        db.session.rollback()
+        log_error(f"Error materializing late loans: {str(e)}")
+        raise
+
+
+def forget_late_loans(loan_ids):
+    """Drop summary rows for loans that were just returned. Runs in the caller's transaction."""
+    if loan_ids:
+        db.session.execute(delete(LateLoan).where(LateLoan.loan_id.in_(loan_ids)))
+
+
+class LateLoanScheduler:
+    """
+    Daemon thread that calls materialize_late_loans() on a fixed interval.
+
+    With a lock_path, only the process holding an exclusive lock on that file does the
+    refresh, so several worker processes on one host do not rebuild the table at the
+    same time; when the holder exits another worker takes the lock on its next tick.
+    """
+
+    def __init__(self, app, interval, lock_path=None):
+        self.app = app
+        self.interval = interval
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _holds_lock(self):
+        if self.lock_path is None or fcntl is None:
+            return True
+        if self._lock_file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+            lock_file = open(self.lock_path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        return True
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='late-loan-scheduler', daemon=True)
+        self._thread.start()
+        log_info(f"Late loan scheduler started (every {self.interval}s)")
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._lock_file is not None:
+            self._lock_file.close()  # releases the lock
+            self._lock_file = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._holds_lock():
+                    with self.app.app_context():
+                        materialize_late_loans()
+                        db.session.remove()
+            except Exception as e:
+                log_error(f"Late loan refresh failed: {str(e)}")
+            self._stop.wait(self.interval)
+
+
+scheduler = None
+
+
+def start_late_loan_scheduler(app):
+    """Start the background refresh if LATE_LOANS_SCHEDULER_ENABLED is set."""
+    global scheduler
+    if not app.config.get('LATE_LOANS_SCHEDULER_ENABLED'):
+        return None
+    if scheduler is None:
+        lock_path = app.config.get('LATE_LOANS_LOCK_PATH') or os.path.join(app.instance_path, 'late_loans.lock')
+        scheduler = LateLoanScheduler(app, app.config.get('LATE_LOANS_REFRESH_SECONDS', 300), lock_path)
+    scheduler.start()
+    return scheduler
+
+
+def stop_late_loan_scheduler():
+    if scheduler is not None:
+        scheduler.stop()
@@ -1,33 +1,233 @@
 import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
 import logging
+from logging.handlers import (QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler,
+                              WatchedFileHandler)
+from flask import g, has_request_context, request
 
-# Define log directory and file path
+# Define log directory and file path (app/logs is not tracked by git)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 LOG_DIR = os.path.join(BASE_DIR, 'logs')
 LOG_FILE_PATH = os.path.join(LOG_DIR, 'app.log')
 
-# Ensure logs directory exists
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# ------------------------------------------------------------
+# Logging pipeline
+#
+# Request threads only put records on a bounded in-memory queue (dropping them if it
+# is full); a QueueListener thread does the formatting and the file/console I/O. The
+# log file rotates by size or by time, and INFO/DEBUG records can be sampled.
+# Nothing is configured at import time: create_app() (or create_async_app()) calls
+# configure_logging(), which starts the listener thread.
+#
+# Size and time rotation assume one writing process. Under several worker processes
+# use rotation='watched' (WatchedFileHandler: every process appends, and logrotate
+# or similar moves the file away) or path='-' (console only, e.g. for a container).
+# ------------------------------------------------------------
 
 # Create a logger instance
 logger = logging.getLogger(__name__)
 
-# Prevent duplicate handlers
-if not logger.hasHandlers():
-    logging.basicConfig(
-        filename=LOG_FILE_PATH,
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
+# Record attributes copied into JSON lines when present
+CONTEXT_FIELDS = ('request_id', 'ip', 'latency_ms', 'method', 'path', 'status')
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the request id, client IP and time since the request started."""
+
+    def filter(self, record):
+        if has_request_context():
+            if getattr(record, 'request_id', None) is None:
+                record.request_id = g.get('request_id')
+            if getattr(record, 'ip', None) is None:
+                record.ip = request.remote_addr
+            started = g.get('request_started')
+            if started is not None and getattr(record, 'latency_ms', None) is None:
+                record.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only `rate` of the INFO and DEBUG records; warnings and errors always pass."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any request context."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, DATE_FORMAT),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_queue_handler = None
+_listener = None
+_settings = {}
+
+
+def _file_handler(path, rotation, max_bytes, backup_count, when):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if rotation == 'watched':
+        return WatchedFileHandler(path, encoding='utf-8', delay=True)
+    if rotation == 'time':
+        return TimedRotatingFileHandler(path, when=when, backupCount=backup_count, encoding='utf-8', delay=True)
+    return RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+
+
+def configure_logging(level=logging.INFO, fmt='json', path=LOG_FILE_PATH, rotation='size',
+                      max_bytes=10 * 1024 * 1024, backup_count=5, when='midnight',
+                      info_sample_rate=1.0, queue_size=10000, console=True):
+    """
+    (Re)build the pipeline on the root logger and start the listener thread.
+    rotation is 'size', 'time' or 'watched'; path '-' writes to the console only.
+    """
+    global _queue_handler, _listener, _settings
+    stop_logging()
+    _settings = dict(level=level, fmt=fmt, path=path, rotation=rotation, max_bytes=max_bytes,
+                     backup_count=backup_count, when=when, info_sample_rate=info_sample_rate,
+                     queue_size=queue_size, console=console)
+
+    formatter = JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT, DATE_FORMAT)
+    if path == '-':
+        # Console only: the formatted records go to stdout for the process manager to collect
+        main_handler = logging.StreamHandler(sys.stdout)
+    else:
+        main_handler = _file_handler(path, rotation, max_bytes, backup_count, when)
+    main_handler.setFormatter(formatter)
+    handlers = [main_handler]
+    if console and path != '-':
+        # Add console handler for debugging
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console_handler)
+
+    log_queue = queue.Queue(queue_size)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    # Sampling runs first so dropped records cost no further work
+    _queue_handler.addFilter(SamplingFilter(info_sample_rate))
+    _queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_queue_handler)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Flush whatever is queued, stop the listener thread and close the handlers."""
+    global _queue_handler, _listener
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def _restart_in_child():
+    """
+    The listener thread does not survive fork() (e.g. gunicorn workers forked from a
+    preloaded master), so a child would queue records nobody writes. Give it its own
+    queue and listener; the parent's thread and files are left to the parent.
+    """
+    global _queue_handler, _listener
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _queue_handler = _listener = None
+    configure_logging(**_settings)
+
+
+def dropped_records():
+    """Records dropped because the queue was full (since the pipeline was configured)."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def logging_options(config):
+    """configure_logging() arguments from the LOG_* settings of a config mapping."""
+    return dict(
+        level=config.get('LOG_LEVEL', 'INFO'),
+        fmt=config.get('LOG_FORMAT', 'json'),
+        path=config.get('LOG_FILE') or LOG_FILE_PATH,
+        rotation=config.get('LOG_ROTATION', 'size'),
+        max_bytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+        backup_count=config.get('LOG_BACKUP_COUNT', 5),
+        when=config.get('LOG_ROTATE_WHEN', 'midnight'),
+        info_sample_rate=config.get('LOG_INFO_SAMPLE_RATE', 1.0),
+        queue_size=config.get('LOG_QUEUE_SIZE', 10000)
     )
 
-    # Add console handler for debugging
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.DEBUG)
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+
+def init_logging(app):
+    """
+    Configure the pipeline from the LOG_* settings and add request ids and access lines.
+
+    Every request gets an id (the incoming X-Request-ID header, or a new one) that is
+    attached to all of its log records and echoed back in the response.
+    """
+    configure_logging(**logging_options(app.config))
+    access_log = app.config.get('LOG_ACCESS_ENABLED', True)
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        if 'request_started' not in g:
+            g.request_started = time.perf_counter()
+
+    @app.after_request
+    def log_access(response):
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+        if access_log:
+            logger.info(f"{request.method} {request.path} {response.status_code}",
+                        extra={'method': request.method, 'path': request.path, 'status': response.status_code})
+        return response
+
+
+atexit.register(stop_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_in_child)
 
 def log_info(message):
     logger.info(message)
@@ -0,0 +1,96 @@
+from sqlalchemy import select, insert, update, delete
+from app.LibModels import db, Book, Loan, MyLoan
+from app.logger import log_info, log_error
+
+# ------------------------------------------------------------
+# Customer loan feed
+#
+# my_loans holds one row per loan with the book's name and author copied in, so
+# GET /api/my-loans reads a single table through the (cust_id, is_loaned, loan_date)
+# index instead of joining loans to books. Write paths update it in their own
+# transaction: checkout adds the row, returns and renewals patch it with set-based
+# UPDATEs, and other loan or book edits re-copy the affected rows.
+# rebuild_my_loans() recomputes the whole table (e.g. after a bulk load).
+# ------------------------------------------------------------
+
+FEED_COLUMNS = ['loan_id', 'cust_id', 'book_id', 'book_name', 'author',
+                'loan_date', 'due_date', 'return_date', 'is_loaned', 'active']
+
+
+def _feed_rows():
+    return select(Loan.id, Loan.cust_id, Loan.book_id, Book.name, Book.author, Loan.loan_date,
+                  Loan.due_date, Loan.return_date, Loan.is_loaned, Loan.active) \
+        .join(Book, Loan.book_id == Book.id)
+
+
+def add_my_loan(loan, book):
+    """Add the feed row for a new loan. Runs in the caller's session and does not commit."""
+    db.session.add(MyLoan(loan_id=loan.id, cust_id=loan.cust_id, book_id=book.id, book_name=book.name,
+                          author=book.author, loan_date=loan.loan_date, due_date=loan.due_date,
+                          return_date=loan.return_date, is_loaned=loan.is_loaned, active=loan.active))
+
+
+def return_my_loans(loan_ids, return_date):
+    """Move loans to the history side of the feed. Runs in the caller's session and does not commit."""
+    if not loan_ids:
+        return 0
+    result = db.session.execute(
+        update(MyLoan)
+        .where(MyLoan.loan_id.in_(loan_ids))
+        .values(is_loaned=False, active=False, return_date=return_date)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def set_my_loan_due_dates(loan_ids, due_date):
+    """Copy a renewal's new due date. Runs in the caller's session and does not commit."""
+    if not loan_ids:
+        return 0
+    result = db.session.execute(
+        update(MyLoan)
+        .where(MyLoan.loan_id.in_(loan_ids))
+        .values(due_date=due_date)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def refresh_my_loans(loan_ids=None, book_ids=None):
+    """
+    Re-copy the feed rows of the given loans, or of every loan of the given books, from
+    loans and books. Runs in the caller's session and does not commit.
+    """
+    if loan_ids is not None:
+        if not loan_ids:
+            return 0
+        loan_ids = list(loan_ids)
+        db.session.execute(delete(MyLoan).where(MyLoan.loan_id.in_(loan_ids)))
+        rows = _feed_rows().where(Loan.id.in_(loan_ids))
+    else:
+        if not book_ids:
+            return 0
+        book_ids = list(book_ids)
+        db.session.execute(delete(MyLoan).where(MyLoan.book_id.in_(book_ids)))
+        rows = _feed_rows().where(Loan.book_id.in_(book_ids))
+    return db.session.execute(insert(MyLoan).from_select(FEED_COLUMNS, rows)).rowcount
+
+
+def rebuild_my_loans(recreate=False):
+    """
+    Recompute the whole feed with one DELETE and one INSERT ... SELECT. recreate drops
+    and recreates the table first (for databases created before it had cust_id).
+    """
+    try:
+        if recreate:
+            MyLoan.__table__.drop(db.engine, checkfirst=True)
+            MyLoan.__table__.create(db.engine)
+        db.session.execute(delete(MyLoan))
+        result = db.session.execute(insert(MyLoan).from_select(FEED_COLUMNS, _feed_rows()))
+        db.session.commit()
+        log_info(f"Rebuilt customer loan feed ({result.rowcount} rows)")
+        return result.rowcount
+    except Exception as e:
+        db.session.rollback()
+        log_error(f"Error rebuilding customer loan feed: {str(e)}")
+        raise
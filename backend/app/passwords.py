@@ -0,0 +1,161 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+try:
+    import bcrypt
+except ImportError:  # bcrypt is optional; only needed for PASSWORD_HASH_SCHEME = 'bcrypt'
+    bcrypt = None
+
+# ------------------------------------------------------------
+# Password hashing
+#
+# One configurable hasher for customers and users. Stored hashes keep the scheme and
+# cost they were made with, so verify() accepts every supported format and
+# needs_rehash() tells login when a hash should be upgraded to the current setting.
+# Verification runs on a small bounded thread pool. The hash functions release the
+# GIL, so the pool caps how many hashes run at once (the request thread still waits
+# for its own result). Once the pool and its queue are full, a login burst gets a
+# quick "busy" answer instead of piling every request thread up behind the hashing.
+# ------------------------------------------------------------
+
+SCHEMES = ('pbkdf2', 'scrypt', 'bcrypt')
+
+# Stored hash formats verify() understands: werkzeug's "method$salt$hexdigest" and bcrypt's
+_WERKZEUG_HASH = re.compile(r'(pbkdf2:sha(1|224|256|384|512)(:\d+)?|scrypt(:\d+:\d+:\d+)?)\$[^$]+\$[0-9a-f]+')
+_BCRYPT_HASH = re.compile(r'\$2[aby]?\$\d{2}\$[./A-Za-z0-9]{53}')
+
+
+class HasherBusy(Exception):
+    """Raised when the verification pool and its queue are full."""
+
+
+class PasswordHasher:
+
+    def __init__(self, scheme='scrypt', pbkdf2_iterations=1_000_000, scrypt_n=32768, scrypt_r=8,
+                 scrypt_p=1, bcrypt_rounds=12, workers=4, queue_size=32, wait_timeout=0.5):
+        self.configure(scheme, pbkdf2_iterations, scrypt_n, scrypt_r, scrypt_p, bcrypt_rounds,
+                       workers, queue_size, wait_timeout)
+
+    def configure(self, scheme='scrypt', pbkdf2_iterations=1_000_000, scrypt_n=32768, scrypt_r=8,
+                  scrypt_p=1, bcrypt_rounds=12, workers=4, queue_size=32, wait_timeout=0.5):
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown password hash scheme '{scheme}' (expected one of {', '.join(SCHEMES)})")
+        if scheme == 'bcrypt' and bcrypt is None:
+            raise RuntimeError("PASSWORD_HASH_SCHEME is 'bcrypt' but the bcrypt package is not installed")
+        self.scheme = scheme
+        self.pbkdf2_iterations = pbkdf2_iterations
+        self.scrypt_params = (scrypt_n, scrypt_r, scrypt_p)
+        self.bcrypt_rounds = bcrypt_rounds
+        self.wait_timeout = wait_timeout
+        self.workers = workers
+        old_pool = getattr(self, '_pool', None)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        if old_pool:
+            old_pool.shutdown(wait=False)
+
+    # --- hashing ------------------------------------------------
+
+    def _werkzeug_method(self):
+        if self.scheme == 'pbkdf2':
+            return f"pbkdf2:sha256:{self.pbkdf2_iterations}"
+        n, r, p = self.scrypt_params
+        return f"scrypt:{n}:{r}:{p}"
+
+    def hash(self, password):
+        if self.scheme == 'bcrypt':
+            return bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.bcrypt_rounds)).decode()
+        return generate_password_hash(password, method=self._werkzeug_method())
+
+    def verify(self, password, hashed):
+        if not hashed:
+            return False
+        if hashed.startswith('$2'):
+            if bcrypt is None:
+                return False
+            return bcrypt.checkpw(password.encode(), hashed.encode())
+        return check_password_hash(hashed, password)
+
+    def is_hash(self, hashed):
+        """True if hashed is a stored hash in a format verify() accepts."""
+        return isinstance(hashed, str) and bool(_WERKZEUG_HASH.fullmatch(hashed) or _BCRYPT_HASH.fullmatch(hashed))
+
+    def needs_rehash(self, hashed):
+        """True if the hash was made with a different scheme or cost than the current setting."""
+        if self.scheme == 'bcrypt':
+            if not hashed.startswith('$2'):
+                return True
+            return int(hashed.split('$')[2]) != self.bcrypt_rounds
+        return hashed.split('$', 1)[0] != self._werkzeug_method()
+
+    # --- bounded offloading ------------------------------------
+
+    def run(self, fn, *args):
+        """Run fn on the hashing pool and wait for it. Raises HasherBusy if the pool is saturated."""
+        # Release the semaphore this call acquired, even if configure() replaces it meanwhile
+        slots = self._slots
+        if not slots.acquire(timeout=self.wait_timeout):
+            raise HasherBusy("Too many password operations in progress")
+        try:
+            future = self._pool.submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future.result()
+
+    def verify_offloaded(self, password, hashed):
+        return self.run(self.verify, password, hashed)
+
+    def hash_offloaded(self, password):
+        return self.run(self.hash, password)
+
+    def hash_many(self, passwords):
+        """
+        Hash a list of passwords on the pool (bulk imports), one pool's worth at a time.
+        Waits for slots instead of raising HasherBusy, and never holds more than
+        `workers` of them, so logins keep the queue slots meanwhile.
+        """
+        hashes = []
+        for start in range(0, len(passwords), self.workers):
+            chunk = passwords[start:start + self.workers]
+            slots = self._slots
+            for _ in chunk:
+                slots.acquire()
+            try:
+                hashes += self._pool.map(self.hash, chunk)
+            finally:
+                for _ in chunk:
+                    slots.release()
+        return hashes
+
+
+password_hasher = PasswordHasher()
+
+# A real hash to verify against when the user does not exist, so a failed login
+# takes the same time whether or not the username is valid
+_dummy_hash = None
+
+
+def dummy_hash():
+    global _dummy_hash
+    if _dummy_hash is None or password_hasher.needs_rehash(_dummy_hash):
+        _dummy_hash = password_hasher.hash('not-a-real-password')
+    return _dummy_hash
+
+
+def init_password_hasher(app):
+    config = app.config
+    password_hasher.configure(
+        scheme=config.get('PASSWORD_HASH_SCHEME', 'scrypt'),
+        pbkdf2_iterations=config.get('PASSWORD_PBKDF2_ITERATIONS', 1_000_000),
+        scrypt_n=config.get('PASSWORD_SCRYPT_N', 32768),
+        scrypt_r=config.get('PASSWORD_SCRYPT_R', 8),
+        scrypt_p=config.get('PASSWORD_SCRYPT_P', 1),
+        bcrypt_rounds=config.get('PASSWORD_BCRYPT_ROUNDS', 12),
+        workers=config.get('PASSWORD_HASH_WORKERS', 4),
+        queue_size=config.get('PASSWORD_HASH_QUEUE_SIZE', 32),
+        wait_timeout=config.get('PASSWORD_HASH_WAIT_TIMEOUT', 0.5)
+    )
@@ -0,0 +1,217 @@
+from datetime import date, datetime, timezone
+from sqlalchemy import select, update
+from app.LibModels import db, Book, BookAvailability, Customer, Loan, LoanType
+from app.availability import open_loan_filter
+
+# ------------------------------------------------------------
+# Partial updates (PATCH)
+#
+# A PATCH body names only the columns it changes. Values are checked against a
+# per-model whitelist, compared with the stored row, and only the columns that
+# really differ are written; an update that changes nothing writes nothing. Bulk
+# bodies are lists of {"id": ..., <columns>}: the listed rows are read with one
+# SELECT ... FOR UPDATE, and rows receiving the same change (e.g. 10k books moved
+# to one loan type) share a single UPDATE ... WHERE id IN (...).
+# ------------------------------------------------------------
+
+
+def _text(max_length, nullable=False):
+    def coerce(value, field):
+        if value is None and nullable:
+            return None
+        if not isinstance(value, str) or not (value or nullable):
+            raise ValueError(f"'{field}' must be a non-empty string")
+        if len(value) > max_length:
+            raise ValueError(f"'{field}' must be at most {max_length} characters")
+        return value
+    return coerce
+
+
+def _int(nullable=False):
+    def coerce(value, field):
+        if value is None and nullable:
+            return None
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"'{field}' must be an integer")
+        return value
+    return coerce
+
+
+def _bool(value, field):
+    if not isinstance(value, bool):
+        raise ValueError(f"'{field}' must be true or false")
+    return value
+
+
+def _date(nullable=False):
+    def coerce(value, field):
+        if value is None and nullable:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{field}' must be YYYY-MM-DD")
+    return coerce
+
+
+def _datetime(nullable=False):
+    def coerce(value, field):
+        if value is None and nullable:
+            return None
+        try:
+            parsed = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{field}' must be an ISO 8601 date or datetime")
+        # Stored datetimes are naive UTC
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    return coerce
+
+
+# Updatable columns per model and how their values are checked
+CUSTOMER_FIELDS = {
+    'name': _text(255),
+    'city': _text(100, nullable=True),
+    'age': _int(nullable=True),
+    'phone_number': _text(20, nullable=True),
+    'birth_date': _date(nullable=True),
+    'active': _bool
+}
+
+BOOK_FIELDS = {
+    'name': _text(50),
+    'author': _text(50),
+    'year_published': _int(),
+    'image_url': _text(500, nullable=True),
+    'loan_type_id': _int(),
+    'active': _bool
+}
+
+LOAN_FIELDS = {
+    'cust_id': _int(),
+    'book_id': _int(),
+    'loan_date': _datetime(),
+    'due_date': _datetime(nullable=True),
+    'return_date': _datetime(nullable=True),
+    'is_loaned': _bool,
+    'active': _bool
+}
+
+# Loan columns whose change can open a loan on a book (see check_open_loans)
+LOAN_OPENING_FIELDS = ('book_id', 'is_loaned', 'active')
+
+# Foreign key columns whose new values must point at an existing row
+REFERENCES = {
+    Book: {'loan_type_id': LoanType},
+    Loan: {'cust_id': Customer, 'book_id': Book}
+}
+
+
+def parse_changes(fields, data):
+    """Checked column values of one PATCH body ('id' is ignored). Raises ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError("an update must be a JSON object")
+    changes = {}
+    for key, value in data.items():
+        if key == 'id':
+            continue
+        if key not in fields:
+            raise ValueError(f"'{key}' cannot be updated")
+        changes[key] = fields[key](value, key)
+    return changes
+
+
+def parse_bulk(fields, items, max_size):
+    """{id: changes} from a list of {"id": ..., <columns>}. Raises ValueError naming the bad item."""
+    if not isinstance(items, list) or not items:
+        raise ValueError("body must be a non-empty list of updates")
+    if len(items) > max_size:
+        raise ValueError(f"At most {max_size} updates per request")
+    updates = {}
+    for index, item in enumerate(items):
+        try:
+            row_id = item.get('id') if isinstance(item, dict) else None
+            if isinstance(row_id, bool) or not isinstance(row_id, int):
+                raise ValueError("'id' must be an integer")
+            if row_id in updates:
+                raise ValueError(f"id {row_id} is listed more than once")
+            updates[row_id] = parse_changes(fields, item)
+        except ValueError as e:
+            raise ValueError(f"item {index}: {e}")
+    return updates
+
+
+def check_references(model, updates):
+    """Raise ValueError if a new foreign key value points at no row (one query per column)."""
+    for column, target in REFERENCES.get(model, {}).items():
+        wanted = {changes[column] for changes in updates.values() if column in changes}
+        if not wanted:
+            continue
+        missing = wanted - set(db.session.scalars(select(target.id).where(target.id.in_(wanted))))
+        if missing:
+            raise ValueError(f"'{column}' {min(missing)} does not exist")
+
+
+def check_open_loans(book_ids):
+    """
+    Raise ValueError if a book now has more than one open loan. Call after the loan
+    UPDATEs, in the same transaction: the books' availability rows are locked first, the
+    same rows checkout's conditional claim updates, so the two cannot interleave.
+    """
+    if not book_ids:
+        return
+    book_ids = sorted(book_ids)
+    db.session.execute(select(BookAvailability.book_id)
+                       .where(BookAvailability.book_id.in_(book_ids)).with_for_update()).all()
+    open_books = db.session.scalars(
+        select(Loan.book_id).where(Loan.book_id.in_(book_ids), open_loan_filter()).with_for_update()
+    ).all()
+    for book_id in book_ids:
+        if open_books.count(book_id) > 1:
+            raise ValueError(f"book {book_id} is already on loan")
+
+
+def apply_updates(model, updates):
+    """
+    Write {id: changes} to the model's table, skipping values that are already stored.
+    Returns (ids found, {id: {column: (old, new)}} for the rows that changed).
+    Runs in the caller's session and does not commit.
+    """
+    columns = sorted({column for changes in updates.values() for column in changes})
+    rows = db.session.execute(
+        select(model.id, *[getattr(model, column) for column in columns])
+        .where(model.id.in_(list(updates)))
+        .with_for_update()
+    ).all()
+
+    diffs, groups = {}, {}
+    for row in rows:
+        diff = {column: (getattr(row, column), value)
+                for column, value in updates[row.id].items() if getattr(row, column) != value}
+        if diff:
+            diffs[row.id] = diff
+            groups.setdefault(tuple((column, new) for column, (_, new) in sorted(diff.items())), []).append(row.id)
+
+    # One UPDATE per distinct change, naming only the changed columns
+    for values, ids in groups.items():
+        db.session.execute(
+            update(model)
+            .where(model.id.in_(ids))
+            .values(dict(values))
+            .execution_options(synchronize_session=False)
+        )
+    return {row.id for row in rows}, diffs
+
+
+def patch_results(ids, found, diffs):
+    """Per-item results in request order: updated (with the changed columns), unchanged or not_found."""
+    results = []
+    for row_id in ids:
+        if row_id not in found:
+            results.append({'id': row_id, 'status': 'not_found'})
+        elif row_id in diffs:
+            results.append({'id': row_id, 'status': 'updated', 'changed': sorted(diffs[row_id])})
+        else:
+            results.append({'id': row_id, 'status': 'unchanged'})
+    return results
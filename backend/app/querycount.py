@@ -0,0 +1,116 @@
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.logger import log_warning
+
+# ------------------------------------------------------------
+# SQL statement counting
+#
+# One listener on every SQLAlchemy engine counts statements into any active
+# QueryCounter on the current thread, and into flask.g (sql_count / sql_time) for
+# the current request once start_request_tracking() has run.
+# ------------------------------------------------------------
+
+_local = threading.local()
+_installed = False
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a block or request runs more SQL statements than allowed."""
+
+
+class QueryCounter:
+    """Context manager that counts the SQL statements run on this thread."""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __enter__(self):
+        install_query_counter()
+        if not hasattr(_local, 'counters'):
+            _local.counters = []
+        _local.counters.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.counters.remove(self)
+        return False
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_local, 'counters', ()):
+        counter.count += 1
+        counter.statements.append(statement)
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+
+def _time_statement(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is not None and has_request_context() and 'sql_time' in g:
+        g.sql_time += time.perf_counter() - started
+
+
+def install_query_counter():
+    """Attach the counting listeners to all engines (safe to call more than once)."""
+    global _installed
+    if not _installed:
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+        event.listen(Engine, 'after_cursor_execute', _time_statement)
+        _installed = True
+
+
+def start_request_tracking():
+    """Start counting SQL statements and time for the current request."""
+    install_query_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """
+    Fail with QueryBudgetExceeded if the block runs more than `limit` statements.
+
+        with assert_max_queries(2):
+            DBManager.get_customer_loans(customer_id)
+    """
+    with QueryCounter() as counter:
+        yield counter
+    if counter.count > limit:
+        listing = '\n'.join(counter.statements)
+        raise QueryBudgetExceeded(f"Expected at most {limit} SQL statements, got {counter.count}:\n{listing}")
+
+
+def init_query_guard(app):
+    """
+    Count SQL statements per request and enforce the configured budget.
+
+    SQL_QUERY_BUDGET is the default per-request limit (None disables the guard) and
+    SQL_QUERY_BUDGETS maps endpoint names (e.g. 'api.get_my_loans') to their own limit.
+    In TESTING mode (or with SQL_QUERY_BUDGET_STRICT) going over the budget raises
+    QueryBudgetExceeded; otherwise it is logged as a warning.
+    """
+    install_query_counter()
+
+    @app.before_request
+    def start_query_count():
+        start_request_tracking()
+
+    @app.after_request
+    def check_query_budget(response):
+        budget = app.config.get('SQL_QUERY_BUDGETS', {}).get(request.endpoint,
+                                                              app.config.get('SQL_QUERY_BUDGET'))
+        count = g.get('sql_count', 0)
+        if budget is not None and count > budget:
+            message = f"Endpoint {request.endpoint} ran {count} SQL statements (budget {budget})"
+            if app.config.get('TESTING') or app.config.get('SQL_QUERY_BUDGET_STRICT'):
+                raise QueryBudgetExceeded(message)
+            log_warning(message)
+        return response
@@ -0,0 +1,196 @@
+import math
+import threading
+import time
+from flask import request, jsonify
+from flask_jwt_extended import decode_token
+from app.logger import log_info, log_warning
+
+try:
+    import redis
+except ImportError:  # redis is optional; without it buckets live in process memory
+    redis = None
+
+# ------------------------------------------------------------
+# Rate limiting
+#
+# Token buckets keyed by the caller: the token's subject when the request carries a
+# valid access token, otherwise the client IP. Routes listed in RATELIMIT_RULES get
+# their own bucket per caller; every other route draws from one shared bucket at
+# RATELIMIT_DEFAULT. A bucket holds up to N tokens and refills at N per period, so
+# short bursts pass and a sustained flood is held to the average rate. An empty
+# bucket answers 429 with Retry-After before the view (or the database) runs.
+# ------------------------------------------------------------
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(limit):
+    """'10/minute' -> (rate per second, burst). Raises ValueError if malformed."""
+    count, _, period = limit.partition('/')
+    if not count.strip().isdigit() or period.strip() not in PERIODS or int(count) < 1:
+        raise ValueError(f"Invalid rate limit '{limit}', expected e.g. '10/minute'")
+    burst = int(count)
+    return burst / PERIODS[period.strip()], burst
+
+
+class MemoryBucketStore:
+    """
+    Per-process token buckets in a dict. Keys are spread over a few locks so threads
+    rarely wait on each other, and idle buckets (ones that would be full again
+    anyway) are swept once the dict grows past max_keys.
+    """
+
+    def __init__(self, max_keys=100000, stripes=16):
+        self._buckets = {}  # key -> (tokens, updated_at, full_at)
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self.max_keys = max_keys
+
+    def take(self, key, rate, burst):
+        """Spend one token; returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        with self._locks[hash(key) % len(self._locks)]:
+            bucket = self._buckets.get(key)
+            tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        if bucket is None and len(self._buckets) > self.max_keys:
+            self._sweep(now)
+        return wait
+
+    def _sweep(self, now):
+        for key, bucket in list(self._buckets.items()):
+            if bucket[2] <= now:
+                self._buckets.pop(key, None)
+
+    def reset(self):
+        self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RedisBucketStore:
+    """
+    Token buckets shared by every worker and host through Redis. The refill and
+    spend run in one Lua script, so concurrent requests cannot both take the last
+    token. Any client with register_script() works, e.g. fakeredis in place of a server.
+    """
+
+    SCRIPT = """
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens, ts = tonumber(bucket[1]), tonumber(bucket[2])
+    if tokens == nil then tokens = burst else tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) end
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+    return tostring(wait)
+    """
+
+    def __init__(self, client, prefix='ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    @classmethod
+    def from_url(cls, url):
+        return cls(redis.Redis.from_url(url))
+
+    def take(self, key, rate, burst):
+        return float(self._script(keys=[self.prefix + key], args=[rate, burst, time.time()]))
+
+    def reset(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+
+bucket_store = MemoryBucketStore()
+
+
+def get_bucket_store():
+    return bucket_store
+
+
+# Verified token -> (subject, expiry); a client sends the same token for many
+# requests, so the signature is checked once instead of on every request
+_subjects = {}
+_SUBJECT_CACHE_SIZE = 10000
+
+
+def _identity():
+    """'user:<id>' for a request with a valid access token, else 'ip:<address>'."""
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        token = header[7:]
+        entry = _subjects.get(token)
+        if entry is None:
+            try:
+                claims = decode_token(token)
+            except Exception:
+                claims = None  # invalid or expired: the view rejects it, count it against the IP
+            if claims is not None:
+                if len(_subjects) >= _SUBJECT_CACHE_SIZE:
+                    _subjects.clear()
+                entry = _subjects[token] = ('user:' + claims['sub'], claims.get('exp', math.inf))
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+    return 'ip:' + (request.remote_addr or 'unknown')
+
+
+def create_bucket_store(url):
+    """RedisBucketStore for a redis:// RATELIMIT_STORAGE_URL (if redis is installed), else MemoryBucketStore."""
+    if url and url.startswith(('redis://', 'rediss://')):
+        if redis is None:
+            log_warning("RATELIMIT_STORAGE_URL is set but redis is not installed; rate limits are per process")
+            return MemoryBucketStore()
+        log_info("Rate limit buckets are shared through Redis")
+        return RedisBucketStore.from_url(url)
+    return MemoryBucketStore()
+
+
+def parse_rules(config):
+    """(default (rate, burst), {endpoint: (rate, burst)}) from RATELIMIT_DEFAULT and RATELIMIT_RULES."""
+    default = parse_limit(config.get('RATELIMIT_DEFAULT', '300/minute'))
+    rules = {endpoint: parse_limit(limit) for endpoint, limit in config.get('RATELIMIT_RULES', {}).items()}
+    return default, rules
+
+
+def check_limit(store, endpoint, identity, default, rules):
+    """Spend a token from the caller's bucket for this endpoint; returns the Retry-After seconds, or 0 if allowed."""
+    rule = rules.get(endpoint)
+    rate, burst = rule or default
+    try:
+        wait = store.take(f"{endpoint if rule else '*'}:{identity}", rate, burst)
+    except Exception as e:
+        # A shared store that is down must not take the API down with it
+        log_warning(f"Rate limit check skipped: {str(e)}")
+        return 0
+    return max(math.ceil(wait), 1) if wait else 0
+
+
+def init_rate_limit(app):
+    """Pick the bucket store (RATELIMIT_STORAGE_URL) and check budgets before each request."""
+    global bucket_store
+    bucket_store = create_bucket_store(app.config.get('RATELIMIT_STORAGE_URL'))
+
+    if not app.config.get('RATELIMIT_ENABLED', True):
+        return
+    default, rules = parse_rules(app.config)
+    exempt = set(app.config.get('RATELIMIT_EXEMPT', ())) | {'static'}
+
+    @app.before_request
+    def check_rate_limit():
+        endpoint = request.endpoint
+        if endpoint is None or endpoint in exempt or request.method == 'OPTIONS':
+            return None
+        retry_after = check_limit(bucket_store, endpoint, _identity(), default, rules)
+        if not retry_after:
+            return None
+        response = jsonify({"error": "Too many requests"})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import threading
+import time
+
+# ------------------------------------------------------------
+# JWT revocation list
+#
+# Access tokens are verified from their signature alone; the only state is this list of
+# revoked token IDs (jti) and per-user cutoffs ("every token issued before T"). Entries
+# carry the token's own expiry and are dropped once it passes, so the list only ever
+# holds tokens that would otherwise still be valid.
+# ------------------------------------------------------------
+
+
+class MemoryRevocationStore:
+    """Per-process revocation list kept in dicts."""
+
+    def __init__(self, purge_interval=60):
+        self._tokens = {}   # jti -> expires_at
+        self._users = {}    # user id -> (revoked_before, expires_at)
+        self._lock = threading.Lock()
+        self._purge_interval = purge_interval
+        self._next_purge = time.time() + purge_interval
+
+    def _purge(self, now):
+        if now < self._next_purge:
+            return
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+        self._users = {uid: entry for uid, entry in self._users.items() if entry[1] > now}
+        self._next_purge = now + self._purge_interval
+
+    def revoke_token(self, jti, expires_at):
+        with self._lock:
+            self._tokens[jti] = expires_at
+            self._purge(time.time())
+
+    def revoke_user(self, user_id, revoked_before, expires_at):
+        with self._lock:
+            self._users[str(user_id)] = (revoked_before, expires_at)
+            self._purge(time.time())
+
+    def is_revoked(self, jti, user_id, issued_at):
+        # Plain dict reads are atomic, so the hot path takes no lock
+        if jti in self._tokens:
+            return True
+        entry = self._users.get(str(user_id))
+        return entry is not None and issued_at <= entry[0]
+
+    def __len__(self):
+        return len(self._tokens) + len(self._users)
+
+
+class SQLiteRevocationStore:
+    """
+    Revocation list in a local SQLite file, shared by every worker process on the host.
+    Use this when running more than one process (JWT_REVOCATION_DB_PATH).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS revoked_tokens (jti TEXT PRIMARY KEY, expires_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS revoked_users "
+                         "(user_id TEXT PRIMARY KEY, revoked_before REAL, expires_at REAL)")
+
+    def _connect(self):
+        # One connection per thread and process: a connection opened before a fork (e.g. in
+        # gunicorn's preloading master) must never be used by the child
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def revoke_token(self, jti, expires_at):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO revoked_tokens VALUES (?, ?)", (jti, expires_at))
+        conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (time.time(),))
+
+    def revoke_user(self, user_id, revoked_before, expires_at):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO revoked_users VALUES (?, ?, ?)",
+                     (str(user_id), revoked_before, expires_at))
+        conn.execute("DELETE FROM revoked_users WHERE expires_at <= ?", (time.time(),))
+
+    def is_revoked(self, jti, user_id, issued_at):
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM revoked_tokens WHERE jti = ?", (jti,)).fetchone():
+            return True
+        row = conn.execute("SELECT revoked_before FROM revoked_users WHERE user_id = ?",
+                           (str(user_id),)).fetchone()
+        return row is not None and issued_at <= row[0]
+
+    def __len__(self):
+        conn = self._connect()
+        return (conn.execute("SELECT COUNT(*) FROM revoked_tokens").fetchone()[0] +
+                conn.execute("SELECT COUNT(*) FROM revoked_users").fetchone()[0])
+
+
+revocation_store = MemoryRevocationStore()
+
+
+def init_revocation(app):
+    """Pick the revocation store from JWT_REVOCATION_DB_PATH (None keeps it in memory)."""
+    global revocation_store
+    path = app.config.get('JWT_REVOCATION_DB_PATH')
+    revocation_store = SQLiteRevocationStore(path) if path else MemoryRevocationStore()
+    return revocation_store
+
+
+def get_revocation_store():
+    return revocation_store
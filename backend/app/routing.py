@@ -0,0 +1,74 @@
+import functools
+import random
+from flask import current_app, request
+from flask_sqlalchemy.session import Session
+
+# ------------------------------------------------------------
+# Read replica routing
+#
+# DATABASE_REPLICA_URLS become the binds replica_0, replica_1, ... (see init_db).
+# SELECTs issued inside a @replica_read method go to a random replica; everything
+# else goes to the primary. Once a session has written (flush, UPDATE, DELETE, ...)
+# it is pinned to the primary until it is removed at the end of the request, so a
+# request always reads its own writes.
+#
+# A replica may lag the primary, so the caller's next requests must not read from
+# one either (GET /api/my-loans right after a checkout has to show the loan). A
+# request that wrote sets a short-lived cookie, and requests carrying it start out
+# pinned to the primary for DB_PRIMARY_STICKY_SECONDS. Clients that drop cookies
+# only get the per-request guarantee.
+# ------------------------------------------------------------
+
+STICKY_COOKIE = 'db_primary'
+
+
+def _is_plain_select(clause):
+    return (clause is not None and getattr(clause, 'is_select', False)
+            and getattr(clause, '_for_update_arg', None) is None)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that can send read-only SELECTs to a replica bind."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or not _is_plain_select(clause):
+                self.info['primary_pinned'] = True
+            elif self.info.get('replica_reads') and not (self.info.get('primary_pinned') or self.info.get('sticky')):
+                replicas = current_app.config.get('DB_REPLICA_BINDS')
+                if replicas:
+                    return self._db.engines[random.choice(replicas)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_read(func):
+    """Let the SELECTs of a query-only method run on a replica when one is configured."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        from app.LibModels import db
+        info = db.session.info
+        info['replica_reads'] = info.get('replica_reads', 0) + 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            info['replica_reads'] -= 1
+    return wrapper
+
+
+
+def init_routing(app, db):
+    """Keep a caller that just wrote on the primary for DB_PRIMARY_STICKY_SECONDS (replicas only)."""
+    seconds = app.config.get('DB_PRIMARY_STICKY_SECONDS', 5)
+    if not app.config.get('DB_REPLICA_BINDS') or not seconds:
+        return
+
+    @app.before_request
+    def pin_recent_writers():
+        if request.cookies.get(STICKY_COOKIE):
+            db.session.info['sticky'] = True
+
+    @app.after_request
+    def mark_writers(response):
+        if db.session.info.get('primary_pinned'):
+            response.set_cookie(STICKY_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,70 @@
+import os
+import sqlalchemy as sa
+from alembic import op
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from flask_migrate import Migrate, upgrade
+from app.LibModels import db, LoanType
+from app.logger import log_info
+
+# ------------------------------------------------------------
+# Schema migrations
+#
+# The schema is versioned with Alembic through Flask-Migrate: the revisions live in
+# backend/migrations/versions, one per schema change, and `flask db upgrade` (also
+# part of `flask init-db`) applies the pending ones. Databases built by db.create_all()
+# before there were migrations have no alembic_version table, so every revision only
+# creates the tables, columns and indexes that are missing (has_table/has_column/
+# has_index below): on such a database the first upgrade adds just what it lacks.
+# ------------------------------------------------------------
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+migrate = Migrate()
+
+
+def init_migrations(app):
+    """Register Flask-Migrate (the `flask db` commands) for the shared `db`."""
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR, render_as_batch=True)
+
+
+# ------------------------------------------------------------
+# Checks for revisions (call inside upgrade()/downgrade())
+# ------------------------------------------------------------
+
+def has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def has_column(table, column):
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def has_index(table, index):
+    return index in {i['name'] for i in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+# ------------------------------------------------------------
+# Running the migrations
+# ------------------------------------------------------------
+
+def upgrade_database():
+    """Apply the pending revisions (`flask db upgrade`). Returns their messages, oldest first."""
+    script = ScriptDirectory.from_config(migrate.get_config(MIGRATIONS_DIR))
+    with db.engine.connect() as conn:
+        current = MigrationContext.configure(conn).get_current_revision()
+    upgrade(directory=MIGRATIONS_DIR)
+    pending = [revision.doc for revision in script.iterate_revisions('heads', current)]
+    for message in reversed(pending):
+        log_info(f"Schema migration: {message}")
+    return pending[::-1]
+
+
+def init_database():
+    """
+    Bring a database up to date: apply the pending migrations and add missing loan
+    types (`flask init-db`, and the development server at startup).
+    Returns (messages of the migrations applied, number of loan types added).
+    """
+    applied = upgrade_database()
+    return applied, LoanType.seed_loan_types()
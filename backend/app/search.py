@@ -0,0 +1,322 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from flask import current_app
+from app.logger import log_info, log_error
+
+# ------------------------------------------------------------
+# Catalog search
+#
+# An in-memory inverted index over the names and authors of active books. Terms are
+# kept in a sorted list for prefix lookups (bisect) and in a deletion-neighbourhood
+# map for typo-tolerant lookups (one edit away), so a query never touches the
+# database. DBManager updates the index when books are created, updated or
+# deactivated; it is built on first use (or at startup) and rebuilt every
+# SEARCH_INDEX_REBUILD_SECONDS, which also picks up writes made by other worker
+# processes. Periodic rebuilds run in a background thread while searches keep using
+# the current index; updates made during a rebuild are replayed onto the new one.
+# ------------------------------------------------------------
+
+FIELD_WEIGHTS = {'name': 2.0, 'author': 1.0}
+
+# Score multipliers for how a query token matched a term
+EXACT, PREFIX, FUZZY = 1.0, 0.6, 0.4
+
+MIN_PREFIX_LENGTH = 2
+MIN_FUZZY_LENGTH = 4
+MAX_PREFIX_EXPANSIONS = 50
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercased, accent-free word tokens."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _deletions(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    """True if a and b differ by at most one insertion, deletion, substitution or transposition."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diffs = [i for i in range(la) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        return (len(diffs) == 2 and diffs[1] == diffs[0] + 1
+                and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]])
+    if la > lb:
+        a, b = b, a
+    # b is one character longer than a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class SearchIndex:
+    """Thread-safe inverted index of book names and authors."""
+
+    def __init__(self, rebuild_seconds=None):
+        self.rebuild_seconds = rebuild_seconds
+        self._lock = threading.RLock()
+        # Held for the whole of a rebuild, so only one runs at a time
+        self._build_lock = threading.Lock()
+        # (book_id, (name, author) or None) for every update made while a rebuild loads
+        self._pending = None
+        self._reset()
+
+    def _reset(self):
+        self._docs = {}                        # book_id -> (name, author)
+        self._postings = defaultdict(dict)     # term -> {book_id: weight}
+        self._terms = []                       # sorted terms, for prefix lookups
+        self._neighbours = defaultdict(set)    # deletion variant -> terms
+        self._built_at = None
+
+    # -- maintenance --------------------------------------------
+
+    def _add_term(self, term, book_id, weight):
+        postings = self._postings[term]
+        if not postings:
+            bisect.insort(self._terms, term)
+            if len(term) >= MIN_FUZZY_LENGTH:
+                for variant in _deletions(term):
+                    self._neighbours[variant].add(term)
+        postings[book_id] = postings.get(book_id, 0.0) + weight
+
+    def _remove_term(self, term, book_id):
+        postings = self._postings.get(term)
+        if postings is None:
+            return
+        postings.pop(book_id, None)
+        if not postings:
+            del self._postings[term]
+            i = bisect.bisect_left(self._terms, term)
+            if i < len(self._terms) and self._terms[i] == term:
+                del self._terms[i]
+            if len(term) >= MIN_FUZZY_LENGTH:
+                for variant in _deletions(term):
+                    terms = self._neighbours.get(variant)
+                    if terms is not None:
+                        terms.discard(term)
+                        if not terms:
+                            del self._neighbours[variant]
+
+    def _fields(self, name, author):
+        return (('name', tokenize(name)), ('author', tokenize(author)))
+
+    def _add(self, book_id, name, author):
+        self._remove(book_id)
+        self._docs[book_id] = (name, author)
+        for field, tokens in self._fields(name, author):
+            for token in tokens:
+                self._add_term(token, book_id, FIELD_WEIGHTS[field])
+
+    def add(self, book_id, name, author):
+        """Index (or re-index) one active book."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((book_id, (name, author)))
+            if self._built_at is not None:
+                self._add(book_id, name, author)
+
+    def _remove(self, book_id):
+        doc = self._docs.pop(book_id, None)
+        if doc is None:
+            return
+        for _, tokens in self._fields(*doc):
+            for token in set(tokens):
+                self._remove_term(token, book_id)
+
+    def remove(self, book_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((book_id, None))
+            self._remove(book_id)
+
+    def update_book(self, book):
+        """Mirror a Book row: indexed while active, dropped once deactivated."""
+        if book.active:
+            self.add(book.id, book.name, book.author)
+        else:
+            self.remove(book.id)
+
+    def invalidate(self):
+        """Drop everything; the next search rebuilds from the database."""
+        with self._lock:
+            self._reset()
+
+    def _load(self):
+        from app.LibModels import db, Book
+        return db.session.execute(
+            db.select(Book.id, Book.name, Book.author).where(Book.active == True)
+        ).all()
+
+    def _rebuild(self):
+        """Load all active books into a new index and swap it in; the caller holds _build_lock."""
+        started = time.perf_counter()
+        with self._lock:
+            self._pending = []
+        try:
+            rows = self._load()
+            fresh = SearchIndex()
+            for book_id, name, author in rows:
+                fresh._add(book_id, name, author)
+            with self._lock:
+                # Updates made while the rows were loading may be missing from them
+                for book_id, doc in self._pending:
+                    fresh._remove(book_id)
+                    if doc is not None:
+                        fresh._add(book_id, *doc)
+                self._docs, self._postings, self._terms = fresh._docs, fresh._postings, fresh._terms
+                self._neighbours, self._built_at = fresh._neighbours, time.monotonic()
+        finally:
+            with self._lock:
+                self._pending = None
+        log_info(f"Search index built with {len(rows)} books and {len(fresh._terms)} terms "
+                 f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def build(self):
+        """(Re)load all active books. Needs an app context; searches keep using the old index meanwhile."""
+        with self._build_lock:
+            self._rebuild()
+
+    def _rebuild_in_background(self):
+        if not self._build_lock.acquire(blocking=False):
+            return  # a rebuild is already running
+        try:
+            app = current_app._get_current_object()
+
+            def run():
+                try:
+                    with app.app_context():
+                        self._rebuild()
+                        from app.LibModels import db
+                        db.session.remove()
+                except Exception as e:
+                    # The current index stays in use; the next search tries again
+                    log_error(f"Rebuilding the search index failed: {str(e)}")
+                finally:
+                    self._build_lock.release()
+
+            threading.Thread(target=run, name='search-index-rebuild', daemon=True).start()
+        except Exception:
+            self._build_lock.release()
+            raise
+
+    def ensure_built(self):
+        """
+        Build the index on first use (callers wait for it). Once it is older than
+        rebuild_seconds, start a background rebuild and keep answering from it meanwhile.
+        """
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self._rebuild()
+        elif self.rebuild_seconds and time.monotonic() - self._built_at > self.rebuild_seconds:
+            self._rebuild_in_background()
+
+    # -- queries ------------------------------------------------
+
+    def _matches(self, token):
+        """Index terms matching one query token, with the match multiplier."""
+        matches = {}
+        if token in self._postings:
+            matches[token] = EXACT
+        if len(token) >= MIN_PREFIX_LENGTH:
+            i = bisect.bisect_left(self._terms, token)
+            expansions = 0
+            while i < len(self._terms) and self._terms[i].startswith(token) and expansions < MAX_PREFIX_EXPANSIONS:
+                matches.setdefault(self._terms[i], PREFIX)
+                i += 1
+                expansions += 1
+        if len(token) >= MIN_FUZZY_LENGTH and len(matches) < MAX_PREFIX_EXPANSIONS:
+            candidates = set(self._neighbours.get(token, ()))
+            for variant in _deletions(token):
+                candidates.update(self._neighbours.get(variant, ()))
+                if variant in self._postings:
+                    candidates.add(variant)
+            for term in candidates:
+                if term not in matches and _within_one_edit(token, term):
+                    matches[term] = FUZZY
+        return matches
+
+    def search(self, query, limit=20):
+        """
+        Books ranked by how well their name and author match the query.
+
+        Every query token can match a term exactly, as a prefix or with one typo; a
+        book's score adds up idf * field weight * match multiplier over the tokens,
+        and books matching more of the tokens always rank first.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        self.ensure_built()
+        with self._lock:
+            total = max(len(self._docs), 1)
+            scores = defaultdict(float)
+            matched = defaultdict(int)
+            for token in tokens:
+                best = {}
+                for term, multiplier in self._matches(token).items():
+                    postings = self._postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    for book_id, weight in postings.items():
+                        score = idf * weight * multiplier
+                        if score > best.get(book_id, 0.0):
+                            best[book_id] = score
+                for book_id, score in best.items():
+                    scores[book_id] += score
+                    matched[book_id] += 1
+            top = heapq.nlargest(limit, scores, key=lambda book_id: (matched[book_id], scores[book_id], -book_id))
+            return [
+                {'id': book_id, 'name': self._docs[book_id][0], 'author': self._docs[book_id][1],
+                 'score': round(scores[book_id], 4)}
+                for book_id in top
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'built': self._built_at is not None,
+                'books': len(self._docs),
+                'terms': len(self._terms)
+            }
+
+
+search_index = SearchIndex()
+
+
+def init_search(app):
+    """Configure the index and, if SEARCH_INDEX_BUILD_ON_STARTUP is set, build it in the background."""
+    search_index.rebuild_seconds = app.config.get('SEARCH_INDEX_REBUILD_SECONDS')
+    if not app.config.get('SEARCH_INDEX_BUILD_ON_STARTUP'):
+        return
+
+    def build():
+        try:
+            with app.app_context():
+                search_index.ensure_built()
+                from app.LibModels import db
+                db.session.remove()
+        except Exception as e:
+            # The first search will try again
+            log_error(f"Building the search index at startup failed: {str(e)}")
+
+    threading.Thread(target=build, name='search-index-build', daemon=True).start()
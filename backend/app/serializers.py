@@ -0,0 +1,121 @@
+from sqlalchemy import select
+from app.LibModels import Book, Customer, Loan, LoanType, BookAvailability, MyLoan
+
+# ------------------------------------------------------------
+# Declarative serializers
+#
+# Each serializer lists its output keys, the column each one is read from and an
+# optional formatter. Listing queries select just those columns (no ORM entities,
+# no identity map) and rows are turned into dicts positionally, with the formatter
+# applied only where one is declared. The models' to_dict() methods go through the
+# same serializers (dump()), so an object and a row of it always serialize alike.
+# ------------------------------------------------------------
+
+
+def iso_date(value):
+    """'YYYY-MM-DD' for a date or datetime (the format the API has always returned)."""
+    return value.isoformat()[:10]
+
+
+class Serializer:
+    """Row-to-dict mapping declared as (key, column) or (key, column, formatter) fields."""
+
+    def __init__(self, *fields):
+        self.keys = tuple(field[0] for field in fields)
+        self.columns = tuple(field[1] for field in fields)
+        self._formatters = tuple((i, field[2]) for i, field in enumerate(fields) if len(field) > 2)
+
+    def select(self):
+        """SELECT of exactly the serialized columns; add joins/filters to it as needed."""
+        return select(*self.columns)
+
+    def dump_row(self, row):
+        if self._formatters:
+            row = list(row)
+            for i, formatter in self._formatters:
+                if row[i] is not None:
+                    row[i] = formatter(row[i])
+        return dict(zip(self.keys, row))
+
+    def dump_rows(self, rows):
+        keys, formatters = self.keys, self._formatters
+        if not formatters:
+            return [dict(zip(keys, row)) for row in rows]
+        result = []
+        for row in rows:
+            row = list(row)
+            for i, formatter in formatters:
+                if row[i] is not None:
+                    row[i] = formatter(row[i])
+            result.append(dict(zip(keys, row)))
+        return result
+
+    def dump(self, obj):
+        """Serialize a mapped object of the serializer's own model (columns read as attributes)."""
+        return self.dump_row([getattr(obj, column.key) for column in self.columns])
+
+
+BOOK = Serializer(
+    ('id', Book.id),
+    ('name', Book.name),
+    ('author', Book.author),
+    ('year_published', Book.year_published),
+    ('image_url', Book.image_url),
+    ('loan_type_id', Book.loan_type_id),
+    ('active', Book.active)
+)
+
+AVAILABLE_BOOK = Serializer(
+    ('book_id', BookAvailability.book_id),
+    ('book_name', BookAvailability.book_name),
+    ('author', BookAvailability.author),
+    ('year_published', BookAvailability.year_published),
+    ('loan_type', BookAvailability.loan_type),
+    ('availability_status', BookAvailability.availability_status),
+    ('return_date', BookAvailability.return_date, iso_date)
+)
+
+CUSTOMER = Serializer(
+    ('id', Customer.id),
+    ('name', Customer.name),
+    ('active', Customer.active)
+)
+
+LOAN_FIELDS = (
+    ('id', Loan.id),
+    ('cust_id', Loan.cust_id),
+    ('book_id', Loan.book_id),
+    ('loan_date', Loan.loan_date, iso_date),
+    ('due_date', Loan.due_date, iso_date),
+    ('return_date', Loan.return_date, iso_date),
+    ('is_loaned', Loan.is_loaned),
+    ('active', Loan.active)
+)
+
+LOAN = Serializer(*LOAN_FIELDS)
+
+# LOAN plus book and customer names; select from Loan joined to Book and Customer
+LOAN_DETAIL = Serializer(
+    *LOAN_FIELDS,
+    ('book_name', Book.name),
+    ('author', Book.author),
+    ('customer_name', Customer.name)
+)
+
+# A customer's own loans (GET /api/my-loans), read from the my_loans feed
+MY_LOAN = Serializer(
+    ('loan_id', MyLoan.loan_id),
+    ('book_id', MyLoan.book_id),
+    ('book_name', MyLoan.book_name),
+    ('author', MyLoan.author),
+    ('loan_date', MyLoan.loan_date, iso_date),
+    ('due_date', MyLoan.due_date, iso_date),
+    ('return_date', MyLoan.return_date, iso_date),
+    ('is_loaned', MyLoan.is_loaned)
+)
+
+LOAN_TYPE = Serializer(
+    ('id', LoanType.id),
+    ('type_name', LoanType.type_name),
+    ('max_days', LoanType.max_days)
+)
@@ -0,0 +1,23 @@
+"""
+ASGI entry point for the async read-only API (see app/async_api.py).
+
+    LOG_ROTATION=watched uvicorn asgi:app --port 8001 --workers 2
+
+It serves GET /api/books, /api/books/available, /api/my-loans and /auth/customers/<id>;
+have the proxy send those paths here and everything else to the WSGI app (wsgi.py).
+With several workers, log with LOG_ROTATION=watched (or LOG_FILE=-) so the processes
+do not rotate the shared log file under each other.
+
+Token revocations are read from JWT_REVOCATION_DB_PATH, which defaults to the same
+instance/revocations.db file as the gunicorn workers (gunicorn.conf.py), so a token
+revoked by the Flask app is refused here too. Both apps must run on the same host
+(or share that file) for this to hold.
+"""
+import os
+
+os.environ.setdefault('JWT_REVOCATION_DB_PATH',
+                      os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'revocations.db'))
+
+from app.async_api import create_async_app
+
+app = create_async_app()
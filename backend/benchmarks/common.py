@@ -0,0 +1,30 @@
+"""Shared setup for the benchmark scripts: the create_app() app, pointed at any database URI."""
+import os
+
+DEFAULT_DB_URI = 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench.db')
+
+BENCH_PASSWORD = 'bench-password'
+LIBRARIAN_NAME = 'Ran'
+
+
+def customer_name(i):
+    return f"bench_customer_{i}"
+
+
+def build_app(db_uri=DEFAULT_DB_URI, **overrides):
+    """The app from create_app(), pointed at `db_uri`, without background jobs or rate limits."""
+    from app import create_app
+
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': db_uri,
+        'LATE_LOANS_SCHEDULER_ENABLED': False,
+        # Load generators send every request from one address and a handful of users
+        'RATELIMIT_ENABLED': False,
+        # One console line per request would time the terminal, not the API
+        'LOG_ACCESS_ENABLED': False
+    }
+    if db_uri.startswith('sqlite'):
+        # Concurrent writers wait for the file lock instead of failing immediately
+        settings['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    settings.update(overrides)
+    return create_app(**settings)
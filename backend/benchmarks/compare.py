@@ -0,0 +1,40 @@
+"""
+Compare two benchmark result files scenario by scenario.
+
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import json
+
+METRICS = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'sql_per_request_mean')
+
+
+def change(old, new):
+    if old in (None, 0) or new is None:
+        return ''
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('old')
+    parser.add_argument('new')
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+    for name in sorted(set(old['scenarios']) | set(new['scenarios'])):
+        print(name)
+        before = old['scenarios'].get(name, {})
+        after = new['scenarios'].get(name, {})
+        for metric in METRICS:
+            a, b = before.get(metric), after.get(metric)
+            print(f"  {metric:22} {str(a):>10} {str(b):>10} {change(a, b):>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Logins per second for each password hashing setting.
+
+Each setting verifies the same password `--logins` times from `--concurrency` client
+threads through the bounded hashing pool, the same path /auth/login takes.
+
+    python -m benchmarks.password_hashing --logins 40 --concurrency 8 --workers 4
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.passwords import PasswordHasher, HasherBusy, bcrypt
+
+SETTINGS = [
+    {'scheme': 'pbkdf2', 'pbkdf2_iterations': 260_000},
+    {'scheme': 'pbkdf2', 'pbkdf2_iterations': 600_000},
+    {'scheme': 'pbkdf2', 'pbkdf2_iterations': 1_000_000},
+    {'scheme': 'scrypt', 'scrypt_n': 16384},
+    {'scheme': 'scrypt', 'scrypt_n': 32768},
+    {'scheme': 'bcrypt', 'bcrypt_rounds': 10},
+    {'scheme': 'bcrypt', 'bcrypt_rounds': 12},
+]
+
+
+def run_setting(setting, logins, concurrency, workers):
+    hasher = PasswordHasher(workers=workers, queue_size=concurrency, wait_timeout=60, **setting)
+    hashed = hasher.hash('correct horse battery staple')
+    busy = 0
+
+    def login(_):
+        nonlocal busy
+        try:
+            return hasher.verify_offloaded('correct horse battery staple', hashed)
+        except HasherBusy:
+            busy += 1
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        ok = sum(clients.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    return {
+        **setting,
+        'logins': logins,
+        'verified': ok,
+        'busy_rejections': busy,
+        'seconds': round(elapsed, 3),
+        'logins_per_sec': round(logins / elapsed, 2),
+        'ms_per_login': round(elapsed / logins * 1000 * min(concurrency, workers), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads issuing logins.')
+    parser.add_argument('--workers', type=int, default=4, help='PASSWORD_HASH_WORKERS.')
+    parser.add_argument('--json', dest='json_path', help='Also write the results to this file.')
+    args = parser.parse_args()
+
+    results = []
+    for setting in SETTINGS:
+        if setting['scheme'] == 'bcrypt' and bcrypt is None:
+            continue
+        result = run_setting(setting, args.logins, args.concurrency, args.workers)
+        results.append(result)
+        cost = {k: v for k, v in setting.items() if k != 'scheme'}
+        print(f"{setting['scheme']:7} {json.dumps(cost):32} {result['logins_per_sec']:9.2f} logins/s "
+              f"{result['ms_per_login']:8.1f} ms/login")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
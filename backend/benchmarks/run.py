@@ -0,0 +1,244 @@
+"""
+Drive the API at a fixed concurrency and report latency percentiles, throughput and SQL counts.
+
+    python -m benchmarks.seed --reset
+    python -m benchmarks.run --concurrency 8 --requests 400
+    python -m benchmarks.run --scenarios catalog,my_loans --url http://localhost:5000
+
+By default requests go through the Flask test client in this process, which also lets
+every request be tagged with the number of SQL statements it ran. With --url the same
+scenarios hit a running server over HTTP (SQL counts are then not available).
+Results are written to benchmarks/results/<timestamp>-<commit>.json; compare two runs
+with `python -m benchmarks.compare old.json new.json`.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from benchmarks.common import build_app, DEFAULT_DB_URI, BENCH_PASSWORD, LIBRARIAN_NAME, customer_name
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SCENARIOS = ('login', 'catalog', 'my_loans', 'create_loan')
+
+
+class InProcessClient:
+    """Flask test client that also counts SQL statements per request."""
+
+    def __init__(self, app):
+        from app.querycount import QueryCounter
+        self._client_local = threading.local()
+        self._app = app
+        self._counter_cls = QueryCounter
+
+    def _client(self):
+        client = getattr(self._client_local, 'client', None)
+        if client is None:
+            client = self._client_local.client = self._app.test_client()
+        return client
+
+    def request(self, method, path, token=None, json_body=None):
+        headers = {'Authorization': f"Bearer {token}"} if token else {}
+        with self._counter_cls() as counter:
+            response = self._client().open(path, method=method, headers=headers, json=json_body)
+        return response.status_code, response.get_json(silent=True), counter.count
+
+
+class HttpClient:
+    """requests-based client for a running server."""
+
+    def __init__(self, base_url):
+        import requests
+        self._base_url = base_url.rstrip('/')
+        self._local = threading.local()
+        self._requests = requests
+
+    def request(self, method, path, token=None, json_body=None):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        headers = {'Authorization': f"Bearer {token}"} if token else {}
+        response = session.request(method, self._base_url + path, headers=headers, json=json_body)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body, None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(s[0] for s in samples)
+    errors = sum(1 for s in samples if s[1] >= 400)
+    sql_counts = [s[2] for s in samples if s[2] is not None]
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+        'sql_per_request_mean': round(sum(sql_counts) / len(sql_counts), 2) if sql_counts else None,
+        'sql_per_request_max': max(sql_counts) if sql_counts else None
+    }
+
+
+def login(client, username):
+    status, body, _ = client.request('POST', '/auth/login', json_body={'username': username, 'password': BENCH_PASSWORD})
+    if status != 200:
+        raise RuntimeError(f"Login for {username} failed with {status}: {body}")
+    return body['access_token']
+
+
+def make_operation(name, client, customers, librarian_token, customer_tokens, max_book_id, rng_seed):
+    """Return a function(i) -> (status, sql_count) issuing one request of the scenario."""
+    rng = random.Random(rng_seed)
+    lock = threading.Lock()
+
+    def pick(values):
+        with lock:
+            return rng.choice(values)
+
+    def randint(a, b):
+        with lock:
+            return rng.randint(a, b)
+
+    if name == 'login':
+        def op(i):
+            username = customer_name(randint(0, customers - 1))
+            status, _, sql = client.request('POST', '/auth/login',
+                                            json_body={'username': username, 'password': BENCH_PASSWORD})
+            return status, sql
+    elif name == 'catalog':
+        def op(i):
+            # First page most of the time, sometimes a deeper page via an author filter
+            path = '/api/books/available?limit=50'
+            if i % 4 == 3:
+                path += f"&author=Author%20{randint(1, max(1, max_book_id // 20))}"
+            status, _, sql = client.request('GET', path, token=pick(customer_tokens))
+            return status, sql
+    elif name == 'my_loans':
+        def op(i):
+            status, _, sql = client.request('GET', '/api/my-loans', token=pick(customer_tokens))
+            return status, sql
+    elif name == 'create_loan':
+        def op(i):
+            body = {'cust_id': randint(2, customers + 1), 'book_id': randint(1, max_book_id)}
+            status, _, sql = client.request('POST', '/auth/loans', token=librarian_token, json_body=body)
+            return status, sql
+    else:
+        raise ValueError(f"Unknown scenario '{name}' (expected one of {', '.join(SCENARIOS)})")
+    return op
+
+
+def run_scenario(op, requests, concurrency, warmup):
+    for i in range(warmup):
+        op(i)
+
+    samples = []
+    samples_lock = threading.Lock()
+
+    def timed(i):
+        started = time.perf_counter()
+        status, sql = op(i)
+        elapsed = time.perf_counter() - started
+        with samples_lock:
+            samples.append((elapsed, status, sql))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(requests)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DB_URI, help='Database URI for in-process runs.')
+    parser.add_argument('--url', help='Benchmark a running server instead of an in-process app.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=400, help='Requests per scenario.')
+    parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario.')
+    parser.add_argument('--customers', type=int, default=2000,
+                        help='Customer count used when seeding (for picking random users).')
+    parser.add_argument('--users', type=int, default=50, help='Distinct customers logged in for read scenarios.')
+    parser.add_argument('--max-book-id', type=int, default=20000)
+    parser.add_argument('--fast-hash', action='store_true',
+                        help='Use a cheap password hash so login measures the API rather than the KDF '
+                             '(seed with --fast-hash too).')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/<timestamp>-<commit>.json).')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    if args.url:
+        client = HttpClient(args.url)
+    else:
+        overrides = {}
+        if args.fast_hash:
+            overrides.update(PASSWORD_HASH_SCHEME='pbkdf2', PASSWORD_PBKDF2_ITERATIONS=1000)
+        client = InProcessClient(build_app(args.db, **overrides))
+
+    librarian_token = login(client, LIBRARIAN_NAME)
+    customer_tokens = [login(client, customer_name(i)) for i in range(min(args.users, args.customers))]
+
+    commit = git_commit()
+    results = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'target': args.url or args.db,
+            'concurrency': args.concurrency,
+            'requests_per_scenario': args.requests,
+            'fast_hash': args.fast_hash
+        },
+        'scenarios': {}
+    }
+    for number, name in enumerate(scenarios):
+        op = make_operation(name, client, args.customers, librarian_token, customer_tokens,
+                            args.max_book_id, args.seed + number)
+        result = run_scenario(op, args.requests, args.concurrency, args.warmup)
+        results['scenarios'][name] = result
+        print(f"{name:12} {result['throughput_rps']:9.1f} req/s  p50 {result['p50_ms']:8.2f} ms  "
+              f"p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+              f"sql/req {result['sql_per_request_mean']}  errors {result['errors']}")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{commit}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Rows per second serialized to a JSON response body, old approach versus new.
+
+Fills an in-memory SQLite database with loans and serializes them four ways:
+
+    orm+to_dict+json       ORM entities with the book joined in, hand-built dicts with
+                           strftime, Flask's default JSON provider (the previous routes)
+    orm+to_dict+orjson     the same dicts encoded by the orjson provider
+    columns+json           app.serializers: only the needed columns, positional rows
+    columns+orjson         the same with the orjson provider
+
+    python -m benchmarks.serialization --rows 20000 --repeat 5
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
+from benchmarks.common import build_app
+
+
+def seed(db, rows):
+    from app.LibModels import LoanType, Book, Customer, Loan
+    LoanType.seed_loan_types()
+    db.session.add(Customer(name='bench', password_hash='x'))
+    books = max(rows // 10, 1)
+    db.session.add_all([Book(name=f"Book {i}", author=f"Author {i % 500}", year_published=1950 + i % 70,
+                             loan_type_id=1 + i % 3) for i in range(books)])
+    db.session.flush()
+    start = datetime(2024, 1, 1)
+    db.session.add_all([Loan(cust_id=1, book_id=1 + i % books, loan_date=start + timedelta(hours=i),
+                             due_date=start + timedelta(hours=i, days=10)) for i in range(rows)])
+    db.session.commit()
+
+
+def orm_dicts(db):
+    from app.LibModels import Loan
+    loans = Loan.query.options(joinedload(Loan.book)).order_by(Loan.loan_date.desc()).all()
+    result = [
+        {
+            "loan_id": loan.id,
+            "book_id": loan.book_id,
+            "book_name": loan.book.name,
+            "author": loan.book.author,
+            "loan_date": loan.loan_date.strftime("%Y-%m-%d"),
+            "due_date": loan.due_date.strftime("%Y-%m-%d") if loan.due_date else None,
+            "return_date": loan.return_date.strftime("%Y-%m-%d") if loan.return_date else None,
+            "is_loaned": loan.is_loaned
+        } for loan in loans
+    ]
+    db.session.expunge_all()
+    return result
+
+
+def column_dicts(db):
+    from app.LibModels import Book, Loan
+    from app.serializers import MY_LOAN
+    rows = db.session.execute(MY_LOAN.select().join(Book, Loan.book_id == Book.id).order_by(Loan.loan_date.desc()))
+    return MY_LOAN.dump_rows(rows)
+
+
+def measure(app, build, repeat):
+    """Best wall time over `repeat` runs of query + serialize + encode."""
+    best = None
+    for _ in range(repeat):
+        with app.test_request_context():
+            started = time.perf_counter()
+            body = app.json.response(build()).get_data()
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for provider in ('default', 'orjson'):
+        app = build_app('sqlite://', JSON_PROVIDER=provider)
+        from app.LibModels import db
+        with app.app_context():
+            db.create_all()
+            seed(db, args.rows)
+            for name, build in (('orm+to_dict', orm_dicts), ('columns', column_dicts)):
+                label = f"{name}+{'json' if provider == 'default' else provider}"
+                seconds, size = measure(app, lambda: build(db), args.repeat)
+                results[label] = {
+                    'seconds': round(seconds, 4),
+                    'rows_per_second': round(args.rows / seconds),
+                    'bytes': size
+                }
+                print(f"{label:22} {args.rows / seconds:12,.0f} rows/s  {seconds * 1000:8.1f} ms  {size:,} bytes")
+            db.session.remove()
+            db.drop_all()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
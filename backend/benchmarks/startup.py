@@ -0,0 +1,67 @@
+"""
+Cold start of a worker process: a fresh interpreter importing the app and building it.
+
+Each run starts a new Python process (as a gunicorn worker without --preload does)
+and times three phases:
+
+    import       `import app` plus the config
+    create_app   create_app(): extensions, blueprints, engine (no connection, no DDL)
+    first        the first request through the test client (GET /, no database)
+
+The median total is compared with --target-ms and the exit status is 1 when it is
+over, so the check can run in CI.
+
+    python -m benchmarks.startup --runs 10 --target-ms 600
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app(LOG_ACCESS_ENABLED=False)
+created = time.perf_counter()
+flask_app.test_client().get('/')
+served = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first': served - created, 'total': served - started}))
+"""
+
+
+def run_once():
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=BACKEND_DIR, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--target-ms', type=float, default=600)
+    args = parser.parse_args()
+
+    run_once()  # warm the OS file cache and the bytecode cache
+    runs = [run_once() for _ in range(args.runs)]
+    results = {}
+    for phase in ('import', 'create_app', 'first', 'total'):
+        values = sorted(run[phase] * 1000 for run in runs)
+        results[phase] = {'median_ms': round(statistics.median(values), 1), 'max_ms': round(values[-1], 1)}
+        print(f"{phase:12} median {results[phase]['median_ms']:8.1f} ms   max {results[phase]['max_ms']:8.1f} ms")
+
+    median = results['total']['median_ms']
+    verdict = 'within' if median <= args.target_ms else 'OVER'
+    print(f"cold start {median:.1f} ms is {verdict} the {args.target_ms:.0f} ms target")
+    print(json.dumps(results, indent=2))
+    return 0 if median <= args.target_ms else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
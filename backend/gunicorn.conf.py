@@ -0,0 +1,98 @@
+"""
+gunicorn settings for the API:  gunicorn -c gunicorn.conf.py wsgi:app
+
+The master imports and builds the app once (preload_app) and forks the workers from
+it, so each worker starts in milliseconds and shares the imported code pages. Every
+worker gets its own connection pools after the fork and runs its own background
+jobs. Most settings can be changed with the GUNICORN_* environment variable beside them.
+
+Workers are sync (one request at a time) by default: they recycle without dropping
+connections, which gthread workers can do when they restart at max_requests.
+GUNICORN_THREADS above 1 switches to gthread. Database connections per host can
+reach workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW); keep that below MySQL's
+max_connections. A worker needs one connection per thread plus one for its
+background jobs, so that is what DB_POOL_SIZE defaults to here (with one overflow
+connection), instead of the 10 + 20 meant for a single threaded process.
+
+State that lives in a process is not shared between workers:
+  - Token revocation (logout, deactivated customers) must be: JWT_REVOCATION_DB_PATH
+    defaults to instance/revocations.db, a SQLite file every worker on this host
+    uses. Across several hosts, point it at shared storage or run one host.
+  - Rate limit buckets are per worker unless RATELIMIT_STORAGE_URL names a Redis
+    server, so a caller gets up to workers x the configured budget; a warning is
+    logged at startup when it is not set.
+  - Each worker has its own search index. A book write updates the index of the
+    worker that served it at once, and the others at their next rebuild
+    (SEARCH_INDEX_REBUILD_SECONDS, 600 by default), so search can lag that long.
+  - Each worker has its own catalog cache (app/cache.py). A write clears it in the
+    worker that served it; the others keep serving their entries until they expire
+    (CACHE_TTL_SECONDS, 30 by default).
+
+Shutdown: on SIGTERM (or SIGHUP for a reload, or a worker reaching max_requests) a
+worker stops accepting connections and gets graceful_timeout seconds to finish the
+requests it is serving before it is killed.
+"""
+import multiprocessing
+import os
+
+# Every worker writes the same log file, so size/time rotation (one process renaming the
+# file under the others) is replaced by appending; rotate it with logrotate, or set
+# LOG_FILE=- to log to stdout instead
+os.environ.setdefault('LOG_ROTATION', 'watched')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = True
+
+# Sized for one worker: a connection per thread plus one for the background jobs
+os.environ.setdefault('DB_POOL_SIZE', str(threads + 1))
+os.environ.setdefault('DB_MAX_OVERFLOW', '1')
+
+# Revoked tokens must be rejected by every worker, not only the one that revoked them
+os.environ.setdefault('JWT_REVOCATION_DB_PATH',
+                      os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'revocations.db'))
+if workers > 1 and not os.environ['JWT_REVOCATION_DB_PATH']:
+    raise SystemExit("JWT_REVOCATION_DB_PATH is empty: with more than one worker, a token revoked "
+                     "in one worker would still be accepted by the others")
+
+# Recycle each worker after about this many requests; the jitter keeps workers from
+# restarting all at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '500'))
+
+# A sync worker cannot report in while it serves a request, so a request running longer
+# than this is killed. Streamed exports of large tables take minutes, not seconds.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+accesslog = None  # the app writes its own access lines (LOG_ACCESS_ENABLED)
+errorlog = '-'
+
+
+def when_ready(server):
+    from wsgi import app
+
+    if workers > 1 and app.config.get('RATELIMIT_ENABLED', True) and not app.config.get('RATELIMIT_STORAGE_URL'):
+        server.log.warning("RATELIMIT_STORAGE_URL is not set: each of the %d workers keeps its own rate "
+                           "limit buckets, so a caller can make up to %d times the configured requests",
+                           workers, workers)
+
+
+def post_fork(server, worker):
+    from wsgi import app
+    from app import start_background_jobs
+    from app.database import dispose_engines
+
+    # Pooled connections opened in the master must not be shared between processes
+    dispose_engines(app, close=False)
+    start_background_jobs(app)
+
+
+def worker_exit(server, worker):
+    from wsgi import app
+    from app import stop_background_jobs
+
+    stop_background_jobs(app)
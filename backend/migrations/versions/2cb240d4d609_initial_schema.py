@@ -0,0 +1,112 @@
+"""initial schema
+
+Revision ID: 2cb240d4d609
+Revises:
+Create Date: 2026-10-18 10:02:11.402913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.schema import has_table
+
+
+# revision identifiers, used by Alembic.
+revision = '2cb240d4d609'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# The tables as db.create_all() made them before the schema was versioned
+def upgrade():
+    if not has_table('users'):
+        op.create_table('users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=80), nullable=False),
+            sa.Column('password_hash', sa.String(length=200), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('username')
+        )
+    if not has_table('loantypes'):
+        op.create_table('loantypes',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('type_name', sa.String(length=100), nullable=False),
+            sa.Column('max_days', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('type_name')
+        )
+    if not has_table('customers'):
+        op.create_table('customers',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=255), nullable=False),
+            sa.Column('city', sa.String(length=100), nullable=True),
+            sa.Column('age', sa.Integer(), nullable=True),
+            sa.Column('phone_number', sa.String(length=20), nullable=True),
+            sa.Column('birth_date', sa.Date(), nullable=True),
+            sa.Column('password_hash', sa.String(length=200), nullable=False),
+            sa.Column('token', sa.String(length=500), nullable=True),
+            sa.Column('active', sa.Boolean(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name')
+        )
+    if not has_table('books'):
+        op.create_table('books',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('author', sa.String(length=50), nullable=False),
+            sa.Column('year_published', sa.Integer(), nullable=False),
+            sa.Column('image_url', sa.String(length=500), nullable=True),
+            sa.Column('active', sa.Boolean(), nullable=True),
+            sa.Column('loan_type_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['loan_type_id'], ['loantypes.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if not has_table('loans'):
+        op.create_table('loans',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('cust_id', sa.Integer(), nullable=False),
+            sa.Column('book_id', sa.Integer(), nullable=False),
+            sa.Column('loan_date', sa.DateTime(), nullable=False),
+            sa.Column('return_date', sa.DateTime(), nullable=True),
+            sa.Column('is_loaned', sa.Boolean(), nullable=True),
+            sa.Column('active', sa.Boolean(), nullable=True),
+            sa.ForeignKeyConstraint(['book_id'], ['books.id']),
+            sa.ForeignKeyConstraint(['cust_id'], ['customers.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if not has_table('my_loans'):
+        op.create_table('my_loans',
+            sa.Column('loan_id', sa.Integer(), nullable=False),
+            sa.Column('book_id', sa.Integer(), nullable=True),
+            sa.Column('book_name', sa.String(length=255), nullable=True),
+            sa.Column('author', sa.String(length=255), nullable=True),
+            sa.Column('loan_date', sa.DateTime(), nullable=True),
+            sa.Column('return_date', sa.DateTime(), nullable=True),
+            sa.Column('is_loaned', sa.Boolean(), nullable=True),
+            sa.Column('active', sa.Boolean(), nullable=True),
+            sa.ForeignKeyConstraint(['book_id'], ['books.id']),
+            sa.PrimaryKeyConstraint('loan_id')
+        )
+    if not has_table('bookavailability'):
+        op.create_table('bookavailability',
+            sa.Column('book_id', sa.Integer(), nullable=False),
+            sa.Column('book_name', sa.String(length=255), nullable=True),
+            sa.Column('author', sa.String(length=255), nullable=True),
+            sa.Column('year_published', sa.Integer(), nullable=True),
+            sa.Column('image_url', sa.String(length=500), nullable=True),
+            sa.Column('loan_type', sa.String(length=100), nullable=True),
+            sa.Column('return_date', sa.DateTime(), nullable=True),
+            sa.Column('availability_status', sa.String(length=50), nullable=True),
+            sa.ForeignKeyConstraint(['book_id'], ['books.id']),
+            sa.PrimaryKeyConstraint('book_id')
+        )
+
+
+def downgrade():
+    op.drop_table('bookavailability')
+    op.drop_table('my_loans')
+    op.drop_table('loans')
+    op.drop_table('books')
+    op.drop_table('customers')
+    op.drop_table('loantypes')
+    op.drop_table('users')
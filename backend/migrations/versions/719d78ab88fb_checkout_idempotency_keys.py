@@ -0,0 +1,40 @@
+"""checkout idempotency keys
+
+Revision ID: 719d78ab88fb
+Revises: 7e1537f5020a
+Create Date: 2026-10-18 10:11:48.260193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.schema import has_index, has_table
+
+
+# revision identifiers, used by Alembic.
+revision = '719d78ab88fb'
+down_revision = '7e1537f5020a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_table('idempotency_keys'):
+        op.create_table('idempotency_keys',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('key', sa.String(length=128), nullable=False),
+            sa.Column('request_fingerprint', sa.String(length=255), nullable=False),
+            sa.Column('loan_id', sa.Integer(), nullable=True),
+            sa.Column('status_code', sa.Integer(), nullable=False),
+            sa.Column('response_body', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['loan_id'], ['loans.id']),
+            sa.PrimaryKeyConstraint('user_id', 'key')
+        )
+    # flask purge-idempotency-keys deletes by age
+    if not has_index('idempotency_keys', 'ix_idempotency_keys_created_at'):
+        op.create_index('ix_idempotency_keys_created_at', 'idempotency_keys', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_keys_created_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
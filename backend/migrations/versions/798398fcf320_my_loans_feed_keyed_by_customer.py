@@ -0,0 +1,71 @@
+"""my_loans feed keyed by customer
+
+Revision ID: 798398fcf320
+Revises: 719d78ab88fb
+Create Date: 2026-10-18 10:14:03.557841
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.schema import has_column, has_index
+
+
+# revision identifiers, used by Alembic.
+revision = '798398fcf320'
+down_revision = '719d78ab88fb'
+branch_labels = None
+depends_on = None
+
+
+FEED_INDEX = 'ix_my_loans_cust_id_is_loaned_loan_date'
+
+loans = sa.table('loans', sa.column('id', sa.Integer), sa.column('cust_id', sa.Integer),
+                 sa.column('book_id', sa.Integer), sa.column('loan_date', sa.DateTime),
+                 sa.column('due_date', sa.DateTime), sa.column('return_date', sa.DateTime),
+                 sa.column('is_loaned', sa.Boolean), sa.column('active', sa.Boolean))
+books = sa.table('books', sa.column('id', sa.Integer), sa.column('name', sa.String),
+                 sa.column('author', sa.String))
+
+
+def _create_feed():
+    return op.create_table('my_loans',
+        sa.Column('loan_id', sa.Integer(), nullable=False),
+        sa.Column('cust_id', sa.Integer(), nullable=False),
+        sa.Column('book_id', sa.Integer(), nullable=True),
+        sa.Column('book_name', sa.String(length=255), nullable=True),
+        sa.Column('author', sa.String(length=255), nullable=True),
+        sa.Column('loan_date', sa.DateTime(), nullable=True),
+        sa.Column('due_date', sa.DateTime(), nullable=True),
+        sa.Column('return_date', sa.DateTime(), nullable=True),
+        sa.Column('is_loaned', sa.Boolean(), nullable=True),
+        sa.Column('active', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['book_id'], ['books.id']),
+        sa.ForeignKeyConstraint(['cust_id'], ['customers.id']),
+        sa.ForeignKeyConstraint(['loan_id'], ['loans.id']),
+        sa.PrimaryKeyConstraint('loan_id')
+    )
+
+
+def upgrade():
+    # The feed is a projection of loans + books: rather than altering the old table
+    # (no cust_id, no due_date), drop it and refill a new one from its sources
+    if not (has_column('my_loans', 'cust_id') and has_column('my_loans', 'due_date')):
+        op.drop_table('my_loans')
+        my_loans = _create_feed()
+        op.execute(my_loans.insert().from_select(
+            ['loan_id', 'cust_id', 'book_id', 'book_name', 'author',
+             'loan_date', 'due_date', 'return_date', 'is_loaned', 'active'],
+            sa.select(loans.c.id, loans.c.cust_id, loans.c.book_id, books.c.name, books.c.author,
+                      loans.c.loan_date, loans.c.due_date, loans.c.return_date, loans.c.is_loaned,
+                      loans.c.active)
+            .join(books, loans.c.book_id == books.c.id)
+        ))
+    if not has_index('my_loans', FEED_INDEX):
+        op.create_index(FEED_INDEX, 'my_loans', ['cust_id', 'is_loaned', 'loan_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index(FEED_INDEX, table_name='my_loans')
+    with op.batch_alter_table('my_loans') as batch_op:
+        batch_op.drop_column('due_date')
+        batch_op.drop_column('cust_id')
@@ -0,0 +1,65 @@
+"""loan due dates and the late_loans summary
+
+Revision ID: 7e1537f5020a
+Revises: f61724aa669e
+Create Date: 2026-10-18 10:09:15.904377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.availability import add_days
+from app.schema import has_column, has_index, has_table
+
+
+# revision identifiers, used by Alembic.
+revision = '7e1537f5020a'
+down_revision = 'f61724aa669e'
+branch_labels = None
+depends_on = None
+
+
+loans = sa.table('loans', sa.column('book_id', sa.Integer), sa.column('loan_date', sa.DateTime),
+                 sa.column('due_date', sa.DateTime))
+books = sa.table('books', sa.column('id', sa.Integer), sa.column('loan_type_id', sa.Integer))
+loantypes = sa.table('loantypes', sa.column('id', sa.Integer), sa.column('max_days', sa.Integer))
+
+
+def upgrade():
+    if not has_column('loans', 'due_date'):
+        op.add_column('loans', sa.Column('due_date', sa.DateTime(), nullable=True))
+        # What checkout would have set: loan_date + the book's loan type max_days
+        max_days = sa.select(loantypes.c.max_days) \
+            .join(books, books.c.loan_type_id == loantypes.c.id) \
+            .where(books.c.id == loans.c.book_id) \
+            .scalar_subquery()
+        op.execute(loans.update().where(loans.c.due_date == None)
+                   .values(due_date=add_days(loans.c.loan_date, max_days)))
+    if not has_index('loans', 'ix_loans_is_loaned_due_date'):
+        op.create_index('ix_loans_is_loaned_due_date', 'loans', ['is_loaned', 'due_date'], unique=False)
+
+    # Filled in by the late-loan refresh (flask refresh-late-loans)
+    if not has_table('late_loans'):
+        op.create_table('late_loans',
+            sa.Column('loan_id', sa.Integer(), nullable=False),
+            sa.Column('cust_id', sa.Integer(), nullable=False),
+            sa.Column('customer_name', sa.String(length=255), nullable=True),
+            sa.Column('book_id', sa.Integer(), nullable=False),
+            sa.Column('book_name', sa.String(length=255), nullable=True),
+            sa.Column('loan_date', sa.DateTime(), nullable=True),
+            sa.Column('due_date', sa.DateTime(), nullable=True),
+            sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['book_id'], ['books.id']),
+            sa.ForeignKeyConstraint(['cust_id'], ['customers.id']),
+            sa.ForeignKeyConstraint(['loan_id'], ['loans.id']),
+            sa.PrimaryKeyConstraint('loan_id')
+        )
+    if not has_index('late_loans', 'ix_late_loans_due_date'):
+        op.create_index('ix_late_loans_due_date', 'late_loans', ['due_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_late_loans_due_date', table_name='late_loans')
+    op.drop_table('late_loans')
+    op.drop_index('ix_loans_is_loaned_due_date', table_name='loans')
+    with op.batch_alter_table('loans') as batch_op:
+        batch_op.drop_column('due_date')
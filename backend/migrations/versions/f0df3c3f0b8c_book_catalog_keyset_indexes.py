@@ -0,0 +1,37 @@
+"""book catalog keyset indexes
+
+Revision ID: f0df3c3f0b8c
+Revises: 2cb240d4d609
+Create Date: 2026-10-18 10:04:37.118250
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.schema import has_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'f0df3c3f0b8c'
+down_revision = '2cb240d4d609'
+branch_labels = None
+depends_on = None
+
+
+# Composite indexes for keyset pagination (filter column first, then id)
+INDEXES = {
+    'ix_books_active_id': ['active', 'id'],
+    'ix_books_author_id': ['author', 'id'],
+    'ix_books_year_id': ['year_published', 'id'],
+    'ix_books_loan_type_id': ['loan_type_id', 'id'],
+}
+
+
+def upgrade():
+    for name, columns in INDEXES.items():
+        if not has_index('books', name):
+            op.create_index(name, 'books', columns, unique=False)
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name='books')
@@ -0,0 +1,52 @@
+"""bookavailability loan_type_id and listing indexes
+
+Revision ID: f61724aa669e
+Revises: f0df3c3f0b8c
+Create Date: 2026-10-18 10:06:52.731604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.schema import has_column, has_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'f61724aa669e'
+down_revision = 'f0df3c3f0b8c'
+branch_labels = None
+depends_on = None
+
+
+# Composite indexes for keyset pagination of the available books listing
+INDEXES = {
+    'ix_bookavailability_status_book': ['availability_status', 'book_id'],
+    'ix_bookavailability_author_book': ['author', 'book_id'],
+    'ix_bookavailability_loan_type_book': ['loan_type_id', 'book_id'],
+}
+
+books = sa.table('books', sa.column('id', sa.Integer), sa.column('loan_type_id', sa.Integer))
+bookavailability = sa.table('bookavailability', sa.column('book_id', sa.Integer),
+                            sa.column('loan_type_id', sa.Integer))
+
+
+def upgrade():
+    if not has_column('bookavailability', 'loan_type_id'):
+        op.add_column('bookavailability', sa.Column('loan_type_id', sa.Integer(), nullable=True))
+        # Copy each book's loan type into its projection row
+        op.execute(
+            bookavailability.update().values(
+                loan_type_id=sa.select(books.c.loan_type_id)
+                .where(books.c.id == bookavailability.c.book_id)
+                .scalar_subquery()
+            )
+        )
+    for name, columns in INDEXES.items():
+        if not has_index('bookavailability', name):
+            op.create_index(name, 'bookavailability', columns, unique=False)
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name='bookavailability')
+    with op.batch_alter_table('bookavailability') as batch_op:
+        batch_op.drop_column('loan_type_id')
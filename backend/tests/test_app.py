@@ -0,0 +1,992 @@
+import asyncio
+import gzip
+import io
+import json
+import os
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from flask import Flask
+from config.config import Config
+from app.LibModels import db, LoanType, Book, Customer, Loan, BookAvailability, MyLoan, LateLoan
+from app.api import api_bp
+from app.auth import auth_bp, init_auth, create_tokens
+from app.dbmanager import DBManager
+from app.querycount import init_query_guard, assert_max_queries, QueryBudgetExceeded
+from app.cache import init_cache, catalog_cache, TTLCache
+from app.database import init_db
+from app.ratelimit import init_rate_limit
+from app.logger import init_logging
+from app import create_app
+from app.my_loans import rebuild_my_loans
+from app.availability import rebuild_availability
+from app.importer import import_records
+from app.late_loans import materialize_late_loans, LateLoanScheduler
+from app.passwords import password_hasher, init_password_hasher
+from app.search import SearchIndex
+from app import httpcache
+from werkzeug.security import generate_password_hash
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(TESTING=True, SQLALCHEMY_DATABASE_URI='sqlite://',
+                      PASSWORD_HASH_SCHEME='pbkdf2', PASSWORD_PBKDF2_ITERATIONS=1000)
+    init_auth(app)
+    db.init_app(app)
+    init_query_guard(app)
+    init_cache(app)
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(api_bp, url_prefix='/api')
+    with app.app_context():
+        db.create_all()
+        LoanType.seed_loan_types()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def customer_with_loans(app):
+    customer = Customer(name='reader', password_hash='x')
+    db.session.add(customer)
+    for i in range(10):
+        db.session.add(Book(name=f"Book {i}", author=f"Author {i}", year_published=2000 + i, loan_type_id=1))
+    db.session.flush()
+    for book_id in range(1, 11):
+        db.session.add(Loan(cust_id=customer.id, book_id=book_id))
+    db.session.commit()
+    rebuild_my_loans()
+    customer_id = customer.id
+    db.session.expunge_all()
+    return customer_id
+
+
+def auth_header(user_id, username, role):
+    access_token, _ = create_tokens(user_id, username, role)
+    return {'Authorization': f"Bearer {access_token}"}
+
+
+def test_customer_loans_load_books_in_one_query(customer_with_loans):
+    with assert_max_queries(1):
+        loans = DBManager.get_customer_loans(customer_with_loans)
+        names = [loan.book.name for loan in loans]
+    assert len(names) == 10
+
+
+def test_customer_with_loans_has_no_n_plus_one(customer_with_loans):
+    with assert_max_queries(2):
+        customer = DBManager.get_customer_with_loans(customer_with_loans)
+        details = [loan.to_detail_dict() for loan in customer.loans]
+    assert {d['customer_name'] for d in details} == {'reader'}
+
+
+def test_lazy_loading_is_caught_by_guard(customer_with_loans):
+    with pytest.raises(QueryBudgetExceeded):
+        with assert_max_queries(2):
+            for loan in Loan.query.all():
+                loan.book.name
+
+
+def test_request_guard_enforces_endpoint_budget(app, customer_with_loans):
+    client = app.test_client()
+    headers = auth_header(customer_with_loans, 'reader', 'customer')
+
+    app.config['SQL_QUERY_BUDGETS'] = {'api.get_my_loans': 1}
+    response = client.get('/api/my-loans', headers=headers)
+    assert response.status_code == 200
+    assert len(response.get_json()['loans']) == 10
+
+    app.config['SQL_QUERY_BUDGETS'] = {'api.get_my_loans': 0}
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/api/my-loans', headers=headers)
+
+
+
+
+def test_a_client_that_wrote_reads_from_the_primary_for_a_while(tmp_path):
+    from app.routing import replica_read
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(TESTING=True,
+                      SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+                      DATABASE_REPLICA_URLS=[f"sqlite:///{tmp_path / 'replica.db'}"])
+    init_db(app)
+
+    @replica_read
+    def book_name():
+        return db.session.query(Book.name).filter(Book.id == 1).scalar()
+
+    @app.post('/write')
+    def write():
+        db.session.add(Customer(name='writer', password_hash='x'))
+        db.session.commit()
+        return 'ok'
+
+    app.get('/read')(lambda: book_name())
+
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica_0'])
+        for engine, name in ((db.engine, 'Primary copy'), (db.engines['replica_0'], 'Replica copy')):
+            with engine.begin() as conn:
+                conn.execute(Book.__table__.insert().values(
+                    id=1, name=name, author='A', year_published=2000, loan_type_id=1, active=True))
+
+    client, other = app.test_client(), app.test_client()
+    assert client.get('/read').text == 'Replica copy'
+    response = client.post('/write')
+    assert 'db_primary=1' in response.headers['Set-Cookie'] and 'Max-Age=5' in response.headers['Set-Cookie']
+    # The writer's next request still sees the primary; other clients keep using the replica
+    assert client.get('/read').text == 'Primary copy'
+    assert other.get('/read').text == 'Replica copy'
+    client.delete_cookie('db_primary')
+    assert client.get('/read').text == 'Replica copy'
+
+
+def test_catalog_cache_counts_hits_and_is_cleared_by_book_and_loan_writes(app, customer_with_loans):
+    client = app.test_client()
+    reader = auth_header(customer_with_loans, 'reader', 'customer')
+    librarian = auth_header(0, 'Ran', 'librarian')
+    db.session.add(Book(name='Free', author='A', year_published=2000, loan_type_id=1))
+    db.session.commit()
+    rebuild_availability()
+
+    before = catalog_cache.stats()
+    first = client.get('/api/books', headers=reader).get_json()
+    assert client.get('/api/books', headers=reader).get_json() == first
+    after = catalog_cache.stats()
+    assert (after['misses'] - before['misses'], after['hits'] - before['hits']) == (1, 1)
+
+    # A book write drops the cached pages
+    client.patch('/auth/books/1', json={'name': 'Renamed'}, headers=librarian)
+    assert client.get('/api/books', headers=reader).get_json()['books'][0]['name'] == 'Renamed'
+
+    # A loan write drops the cached availability pages
+    status = lambda: {b['book_id']: b['availability_status']
+                      for b in client.get('/api/books/available', headers=reader).get_json()['books']}[11]
+    assert status() == 'Available'
+    assert client.post('/api/loans/checkout', json={'book_id': 11}, headers=reader).status_code == 201
+    assert status() == 'On Loan'
+
+
+def test_catalog_cache_does_not_store_a_value_loaded_across_an_invalidation():
+    cache = TTLCache()
+
+    def load_during_write():
+        cache.invalidate('books')  # a write commits while the loader is still reading
+        return 'stale'
+
+    assert cache.get_or_load(('books', 'page'), load_during_write) == 'stale'
+    assert cache.get_or_load(('books', 'page'), lambda: 'fresh') == 'fresh'
+    assert cache.get_or_load(('books', 'page'), lambda: 'later') == 'fresh'
+
+
+def test_reads_use_replica_until_session_writes(tmp_path):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(TESTING=True,
+                      SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+                      DATABASE_REPLICA_URLS=[f"sqlite:///{tmp_path / 'replica.db'}"])
+    init_db(app)
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica_0'])
+        for engine, name in ((db.engine, 'Primary copy'), (db.engines['replica_0'], 'Replica copy')):
+            with engine.begin() as conn:
+                conn.execute(Book.__table__.insert().values(
+                    id=1, name=name, author='A', year_published=2000, loan_type_id=1, active=True))
+
+        assert DBManager.get_book_by_id(1).name == 'Replica copy'
+        # Plain session reads outside @replica_read methods stay on the primary
+        assert db.session.query(Book.name).filter(Book.id == 1).scalar() == 'Primary copy'
+
+        db.session.add(Customer(name='writer', password_hash='x'))
+        db.session.commit()
+        assert DBManager.get_book_by_id(1).name == 'Primary copy'
+        db.session.remove()
+
+        assert DBManager.get_book_by_id(1).name == 'Replica copy'
+        db.session.remove()
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    """App on a SQLite file, so threads get their own connections and real locking."""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(TESTING=True,
+                      SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'library.db'}",
+                      SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}},
+                      DB_POOL_SIZE=20, DB_MAX_OVERFLOW=0, DB_POOL_TIMEOUT=30)
+    init_auth(app)
+    init_db(app)
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(api_bp, url_prefix='/api')
+    with app.app_context():
+        db.create_all()
+        LoanType.seed_loan_types()
+        DBManager.create_book({'name': 'Contended', 'author': 'A', 'year_published': 2000, 'loan_type_id': 1})
+        for i in range(200):
+            db.session.add(Customer(name=f"reader{i}", password_hash='x'))
+        db.session.commit()
+        db.session.remove()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+def test_parallel_checkouts_lend_a_copy_once(file_app):
+    def checkout(cust_id):
+        with file_app.app_context():
+            headers = auth_header(cust_id, f"reader{cust_id}", 'customer')
+        response = file_app.test_client().post('/api/loans/checkout', json={'book_id': 1}, headers=headers)
+        return response.status_code
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        statuses = list(pool.map(checkout, range(1, 201)))
+
+    assert statuses.count(201) == 1
+    assert statuses.count(409) == 199
+    with file_app.app_context():
+        assert Loan.query.count() == 1
+        assert db.session.get(BookAvailability, 1).availability_status == 'On Loan'
+
+
+def test_checkout_retry_with_idempotency_key_returns_first_loan(file_app):
+    client = file_app.test_client()
+    with file_app.app_context():
+        headers = dict(auth_header(1, 'reader1', 'customer'), **{'Idempotency-Key': 'retry-1'})
+
+    first = client.post('/api/loans/checkout', json={'book_id': 1}, headers=headers)
+    second = client.post('/api/loans/checkout', json={'book_id': 1}, headers=headers)
+    assert first.status_code == second.status_code == 201
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert first.get_json()['id'] == second.get_json()['id']
+
+    other = client.post('/api/loans/checkout', json={'book_id': 2}, headers=headers)
+    assert other.status_code == 422
+
+
+
+def test_parallel_retries_with_one_idempotency_key_all_get_the_loan(file_app):
+    with file_app.app_context():
+        headers = dict(auth_header(1, 'reader1', 'customer'), **{'Idempotency-Key': 'racing'})
+
+    def checkout(_):
+        response = file_app.test_client().post('/api/loans/checkout', json={'book_id': 1}, headers=headers)
+        return response.status_code, response.get_json().get('id')
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(checkout, range(8)))
+
+    assert {status for status, _ in results} == {201}
+    assert len({loan_id for _, loan_id in results}) == 1
+    with file_app.app_context():
+        assert Loan.query.count() == 1
+
+
+def test_rate_limit_per_caller_returns_retry_after(app, customer_with_loans):
+    app.config.update(RATELIMIT_RULES={'auth.login': '2/minute', 'api.get_my_loans': '1/minute'})
+    init_rate_limit(app)
+    client = app.test_client()
+
+    statuses = [client.post('/auth/login', json={}).status_code for _ in range(3)]
+    assert statuses == [400, 400, 429]
+
+    reader = auth_header(customer_with_loans, 'reader', 'customer')
+    other = auth_header(customer_with_loans + 1, 'other', 'customer')
+    assert client.get('/api/my-loans', headers=reader).status_code == 200
+    limited = client.get('/api/my-loans', headers=reader)
+    assert limited.status_code == 429
+    assert 1 <= int(limited.headers['Retry-After']) <= 60
+    # Each token subject has its own bucket
+    assert client.get('/api/my-loans', headers=other).status_code == 200
+
+
+def test_init_db_command_is_idempotent_and_migrates_to_the_models(tmp_path):
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+    app = create_app(TESTING=True, SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'fresh.db'}",
+                     LOG_ACCESS_ENABLED=False)
+    runner = app.test_cli_runner()
+    output = runner.invoke(args=['init-db']).output
+    assert 'initial schema' in output and 'Applied 6 migrations, added 3 loan types' in output
+    assert 'Applied 0 migrations, added 0 loan types' in runner.invoke(args=['init-db']).output
+    with app.app_context():
+        assert [t.type_name for t in LoanType.query.order_by(LoanType.id)] == ['Short Term', 'Medium Term', 'Long Term']
+        # The revisions build exactly what the models declare
+        with db.engine.connect() as conn:
+            assert compare_metadata(MigrationContext.configure(conn), db.metadata) == []
+        db.session.remove()
+
+
+def pre_migration_database(tmp_path):
+    """An app on a database built by create_all() before the schema was versioned."""
+    app = create_app(TESTING=True, SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'old.db'}",
+                     LOG_ACCESS_ENABLED=False)
+    with app.app_context():
+        db.create_all()
+        LoanType.seed_loan_types()
+        db.session.remove()
+    return app
+
+
+def alembic_revision(app):
+    from alembic.migration import MigrationContext
+    with app.app_context(), db.engine.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+
+def runner_exit_code(app, args):
+    result = app.test_cli_runner().invoke(args=args)
+    assert result.exception is None or isinstance(result.exception, SystemExit), result.exception
+    return result.exit_code
+
+
+def test_db_upgrade_adds_due_date_to_an_existing_loans_table(tmp_path):
+    app = pre_migration_database(tmp_path)
+    with app.app_context():
+        # The loans table as it was before due dates
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_loans_is_loaned_due_date")
+            conn.exec_driver_sql("ALTER TABLE loans DROP COLUMN due_date")
+            conn.exec_driver_sql("INSERT INTO customers (name, password_hash, active) VALUES ('reader', 'x', 1)")
+            conn.exec_driver_sql("INSERT INTO books (name, author, year_published, loan_type_id, active) "
+                                 "VALUES ('Book', 'Author', 2000, 2, 1)")
+            conn.exec_driver_sql("INSERT INTO loans (cust_id, book_id, loan_date, is_loaned, active) "
+                                 "VALUES (1, 1, '2024-01-01 10:00:00.000000', 1, 1)")
+
+    assert runner_exit_code(app, ['db', 'upgrade']) == 0
+    assert alembic_revision(app) == '798398fcf320'
+    with app.app_context():
+        assert db.session.get(Loan, 1).due_date == datetime(2024, 1, 6, 10, 0)
+        assert 'ix_loans_is_loaned_due_date' in {i['name'] for i in db.inspect(db.engine).get_indexes('loans')}
+        db.session.remove()
+
+
+def test_db_upgrade_recreates_a_my_loans_table_without_cust_id(tmp_path):
+    app = pre_migration_database(tmp_path)
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("INSERT INTO customers (name, password_hash, active) VALUES ('reader', 'x', 1)")
+            conn.exec_driver_sql("INSERT INTO books (name, author, year_published, loan_type_id, active) "
+                                 "VALUES ('Book', 'Author', 2000, 1, 1)")
+            conn.exec_driver_sql("INSERT INTO loans (cust_id, book_id, loan_date, due_date, is_loaned, active) "
+                                 "VALUES (1, 1, '2024-01-01 10:00:00.000000', '2024-01-11 10:00:00.000000', 1, 1)")
+            # The feed as it was before it was keyed by customer
+            conn.exec_driver_sql("DROP TABLE my_loans")
+            conn.exec_driver_sql("CREATE TABLE my_loans (loan_id INTEGER PRIMARY KEY, book_name VARCHAR(255))")
+
+    assert runner_exit_code(app, ['db', 'upgrade']) == 0
+    with app.app_context():
+        feed = db.session.get(MyLoan, 1)
+        assert (feed.cust_id, feed.book_name, feed.due_date) == (1, 'Book', datetime(2024, 1, 11, 10, 0))
+        db.session.remove()
+    # Nothing is left to apply
+    assert 'Applied 0 migrations' in app.test_cli_runner().invoke(args=['init-db']).output
+
+
+def test_async_api_matches_flask_responses(file_app):
+    pytest.importorskip('aiosqlite')
+    pytest.importorskip('httpx')
+    from starlette.testclient import TestClient
+    from app.async_api import create_async_app
+
+    async_app = create_async_app(SQLALCHEMY_DATABASE_URI=file_app.config['SQLALCHEMY_DATABASE_URI'],
+                                 LOG_ACCESS_ENABLED=False)
+    flask_client = file_app.test_client()
+    with file_app.app_context():
+        reader = auth_header(1, 'reader1', 'customer')
+        librarian = auth_header(201, 'Ran', 'librarian')
+    flask_client.post('/api/loans/checkout', json={'book_id': 1}, headers=reader)
+
+    with TestClient(async_app) as async_client:
+        for path, headers in (('/api/books?limit=5', librarian), ('/api/books/available', reader),
+                              ('/api/my-loans', reader), ('/auth/customers/7', librarian)):
+            expected = flask_client.get(path, headers=headers)
+            response = async_client.get(path, headers=headers)
+            assert (response.status_code, response.json()) == (expected.status_code, expected.get_json())
+        assert async_client.get('/api/my-loans').status_code == 401
+        assert async_client.get('/api/my-loans', headers=librarian).status_code == 403
+
+
+
+def test_async_api_uses_its_own_url_rate_limits_and_shared_revocations(file_app, tmp_path):
+    pytest.importorskip('aiosqlite')
+    pytest.importorskip('httpx')
+    import jwt
+    from starlette.testclient import TestClient
+    from app.async_api import create_async_app
+    from app.revocation import SQLiteRevocationStore
+
+    revocations = str(tmp_path / 'revocations.db')
+    async_app = create_async_app(SQLALCHEMY_DATABASE_URI='sqlite:///unused.db',
+                                 DATABASE_REPLICA_URLS=['sqlite:///replica.db'],
+                                 ASYNC_DATABASE_URL=file_app.config['SQLALCHEMY_DATABASE_URI'],
+                                 JWT_REVOCATION_DB_PATH=revocations,
+                                 RATELIMIT_RULES={'api.get_my_loans': '2/minute'},
+                                 LOG_ACCESS_ENABLED=False)
+    # The explicit async URL wins over the replicas
+    assert [engine.url.database for engine in async_app.state.api.engines] == \
+        [file_app.config['SQLALCHEMY_DATABASE_URI'].split('///')[1]]
+
+    with file_app.app_context():
+        reader = auth_header(1, 'reader1', 'customer')
+        librarian = auth_header(201, 'Ran', 'librarian')
+    with TestClient(async_app) as client:
+        # The Flask app's per-endpoint budget applies here too
+        assert [client.get('/api/my-loans', headers=reader).status_code for _ in range(2)] == [200, 200]
+        limited = client.get('/api/my-loans', headers=reader)
+        assert limited.status_code == 429 and int(limited.headers['Retry-After']) >= 1
+        assert client.get('/api/books', headers=reader).status_code == 200
+
+        # A token revoked by the Flask app (same revocation file) is refused
+        claims = jwt.decode(librarian['Authorization'][7:], options={'verify_signature': False})
+        SQLiteRevocationStore(revocations).revoke_token(claims['jti'], claims['exp'])
+        revoked = client.get('/auth/customers/7', headers=librarian)
+        assert (revoked.status_code, revoked.json()) == (401, {'msg': 'Token has been revoked'})
+
+        # The revocation file is read on the thread pool, not on the event loop
+        store, on_loop = async_app.state.api.revocation_store, []
+        is_revoked = store.is_revoked
+
+        def recording_is_revoked(*args):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return is_revoked(*args)
+        store.is_revoked = recording_is_revoked
+        client.get('/api/books', headers=reader)
+        assert on_loop == [False]
+
+
+def test_my_loans_feed_follows_checkout_and_return(file_app):
+    client = file_app.test_client()
+    with file_app.app_context():
+        for i in range(2):
+            DBManager.create_book({'name': f"Feed {i}", 'author': 'B', 'year_published': 2001, 'loan_type_id': 1})
+        reader = auth_header(1, 'reader1', 'customer')
+        librarian = auth_header(201, 'Ran', 'librarian')
+    loan_ids = [client.post('/api/loans/checkout', json={'book_id': book_id}, headers=reader).get_json()['id']
+                for book_id in (1, 2, 3)]
+    client.post('/auth/loans/return', json={'loan_ids': loan_ids[:1]}, headers=librarian)
+
+    def page(query):
+        return client.get(f"/api/my-loans?{query}", headers=reader).get_json()
+
+    assert [loan['loan_id'] for loan in page('status=current')['loans']] == loan_ids[:0:-1]
+    history = page('status=history')['loans']
+    assert [loan['loan_id'] for loan in history] == loan_ids[:1] and history[0]['return_date']
+
+    first = page('limit=2')
+    second = page(f"limit=2&cursor={first['next_cursor']}")
+    assert [loan['loan_id'] for loan in first['loans'] + second['loans']] == loan_ids[::-1]
+    assert second['next_cursor'] is None
+    assert client.get('/api/my-loans?status=late', headers=reader).status_code == 400
+
+
+
+def test_books_keyset_pages_follow_the_cursor_and_filters(app, customer_with_loans):
+    client = app.test_client()
+    librarian = auth_header(0, 'Ran', 'librarian')
+    db.session.add(Book(name='Long loan', author='Author 3', year_published=2003, loan_type_id=3))
+    db.session.commit()
+
+    def page(query):
+        response = client.get(f"/api/books?{query}", headers=librarian)
+        return response.status_code, response.get_json()
+
+    ids, cursor = [], None
+    while True:
+        status, body = page('limit=4' + (f"&cursor={cursor}" if cursor else ''))
+        assert status == 200 and len(body['books']) <= 4
+        ids += [book['id'] for book in body['books']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert ids == list(range(1, 12))
+
+    assert [b['id'] for b in page('author=Author%203')[1]['books']] == [4, 11]
+    assert [b['id'] for b in page('year_from=2003&year_to=2004&loan_type=1')[1]['books']] == [4, 5]
+    status, body = page('loan_type=3&limit=1')
+    assert [b['id'] for b in body['books']] == [11] and body['next_cursor'] is None
+
+    for query in ('cursor=not-a-cursor', 'limit=abc', 'limit=0', 'limit=-3', 'year_from=soon'):
+        status, body = page(query)
+        assert status == 400 and body['error']
+
+
+def test_patch_writes_only_changed_columns_in_set_based_updates(app, customer_with_loans):
+    client = app.test_client()
+    librarian = auth_header(0, 'Ran', 'librarian')
+    updates = []
+
+    @event.listens_for(db.engine, 'before_cursor_execute')
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE books'):
+            updates.append(statement)
+
+    response = client.patch('/auth/books/1', json={'name': 'Book 0', 'author': 'Author 0'}, headers=librarian)
+    assert response.status_code == 200 and updates == []
+    assert client.patch('/auth/books/1', json={'password': 'x'}, headers=librarian).status_code == 400
+
+    body = [{'id': book_id, 'loan_type_id': 3} for book_id in range(1, 11)] + [{'id': 99, 'loan_type_id': 3}]
+    body[1]['name'] = 'Renamed'
+    response = client.patch('/auth/books', json=body, headers=librarian)
+    results = response.get_json()['results']
+    assert response.get_json()['updated'] == 10 and results[-1]['status'] == 'not_found'
+    assert results[1]['changed'] == ['loan_type_id', 'name']
+    assert sorted(statement.split(' WHERE')[0] for statement in updates) == \
+        ['UPDATE books SET loan_type_id=?', 'UPDATE books SET name=?, loan_type_id=?']
+    assert {row.loan_type for row in BookAvailability.query} == {'Long Term'}
+    feed = client.get('/api/my-loans', headers=auth_header(customer_with_loans, 'reader', 'customer')).get_json()
+    assert 'Renamed' in {loan['book_name'] for loan in feed['loans']}
+
+    updates.clear()
+    assert client.patch('/auth/books', json=body, headers=librarian).get_json()['updated'] == 0
+    assert updates == []
+
+
+
+def test_loan_patch_cannot_open_a_second_loan_on_a_copy(app, customer_with_loans):
+    client = app.test_client()
+    librarian = auth_header(0, 'Ran', 'librarian')
+    db.session.add(Book(name='Free', author='A', year_published=2000, loan_type_id=1))
+    db.session.commit()
+    rebuild_availability()
+
+    # Loans 1-10 hold books 1-10
+    response = client.patch('/auth/loans/1', json={'book_id': 2}, headers=librarian)
+    assert response.status_code == 400 and response.get_json()['error'] == 'book 2 is already on loan'
+    assert db.session.get(Loan, 1).book_id == 1
+
+    assert client.patch('/auth/loans/1', json={'book_id': 11}, headers=librarian).status_code == 200
+    assert db.session.get(BookAvailability, 11).availability_status == 'On Loan'
+    assert db.session.get(BookAvailability, 1).availability_status == 'Available'
+
+    # Closing loan 2 frees book 2 for loan 3; reopening loan 2 would then double-lend it
+    body = [{'id': 2, 'is_loaned': False}, {'id': 3, 'book_id': 2}]
+    assert client.patch('/auth/loans', json=body, headers=librarian).get_json()['updated'] == 2
+    response = client.patch('/auth/loans', json=[{'id': 2, 'is_loaned': True}], headers=librarian)
+    assert response.status_code == 400
+    assert db.session.get(Loan, 2).is_loaned is False
+
+
+def test_import_retries_a_failed_batch_row_by_row(app):
+    names = ['a', 'b', 'a', 'c', 'd']
+    stream = io.StringIO(''.join(json.dumps({'name': name, 'password': 'secret'}) + '\n' for name in names))
+    report = import_records('customers', stream, 'jsonl', batch_size=2)
+    assert (report['processed'], report['inserted'], report['failed']) == (5, 4, 1)
+    assert report['errors'][0]['row'] == 3 and report['aborted'] is None
+    assert sorted(c.name for c in Customer.query) == ['a', 'b', 'c', 'd']
+
+
+def test_import_hashes_passwords_on_the_pool_and_checks_supplied_hashes(app):
+    rows = [{'name': 'plain1', 'password': 'secret'},
+            {'name': 'hashed', 'password_hash': generate_password_hash('secret', 'pbkdf2:sha256:1000')},
+            {'name': 'bogus', 'password_hash': 'not-a-hash'},
+            {'name': 'plain2', 'password': 'secret'},
+            {'name': 'plain3', 'password': 'secret'}]
+    stream = io.StringIO(''.join(json.dumps(row) + '\n' for row in rows))
+    report = import_records('customers', stream, 'jsonl', batch_size=10, max_plain_passwords=2)
+    assert [error['row'] for error in report['errors']] == [3, 5]
+    assert 'password_hash' in report['errors'][0]['error'] and 'plain passwords' in report['errors'][1]['error']
+    assert sorted(c.name for c in Customer.query) == ['hashed', 'plain1', 'plain2']
+
+    client = app.test_client()
+    for name in ('plain1', 'hashed'):
+        assert client.post('/auth/login', json={'username': name, 'password': 'secret'}).status_code == 200
+
+
+def test_import_reports_rows_committed_before_an_unreadable_stream(app):
+    rows = ''.join(f"Book {i},Author {i},2000,1\n" for i in range(500))
+    body = f"name,author,year_published,loan_type_id\n{rows}".encode() + b'\xff\xfe broken\n'
+    response = app.test_client().post('/auth/import/books?format=csv&batch_size=100', data=body,
+                                      headers=auth_header(0, 'Ran', 'librarian'))
+    report = response.get_json()
+    assert response.status_code == 400 and report['aborted']
+    assert 300 < report['inserted'] == report['processed'] < 500
+    assert Book.query.count() == BookAvailability.query.count() == report['inserted']
+
+
+def test_exports_stream_every_row_across_chunks(app, customer_with_loans):
+    for i in range(15):
+        db.session.add(Book(name=f"Extra {i}", author='X', year_published=1990, loan_type_id=2))
+    db.session.commit()
+    app.config['EXPORT_BATCH_SIZE'] = 4
+    client = app.test_client()
+    librarian = auth_header(0, 'Ran', 'librarian')
+
+    response = client.get('/auth/books/export', headers=librarian)
+    lines = response.get_data(as_text=True).splitlines()
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line)['id'] for line in lines] == list(range(1, 26))
+
+    response = client.get('/auth/loans/export?format=json', headers=librarian, buffered=False)
+    chunks = list(response.response)
+    loans = json.loads(b''.join(chunks))
+    assert len(chunks) > 3 and [loan['id'] for loan in loans] == list(range(1, 11))
+    assert {loan['customer_name'] for loan in loans} == {'reader'}
+
+
+@pytest.fixture
+def non_utc_timezone(monkeypatch):
+    """Run with a local time zone east of UTC, where naive-UTC timestamp mistakes show up."""
+    monkeypatch.setenv('TZ', 'Asia/Jerusalem')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_refresh_logout_and_deactivation_revoke_tokens(app, non_utc_timezone):
+    db.session.add(Customer(name='reader', password_hash=password_hasher.hash('secret')))
+    db.session.commit()
+    client = app.test_client()
+    bearer = lambda token: {'Authorization': f"Bearer {token}"}
+    login = lambda: client.post('/auth/login', json={'username': 'reader', 'password': 'secret'})
+
+    tokens = login().get_json()
+    response = client.post('/auth/refresh', headers=bearer(tokens['refresh_token']))
+    assert response.status_code == 200
+    access_token = response.get_json()['access_token']
+    assert client.get('/api/my-loans', headers=bearer(access_token)).status_code == 200
+    assert client.post('/auth/refresh', headers=bearer(tokens['access_token'])).status_code == 422
+
+    assert client.post('/auth/logout', headers=bearer(tokens['refresh_token'])).status_code == 200
+    assert client.post('/auth/refresh', headers=bearer(tokens['refresh_token'])).status_code == 401
+
+    assert client.delete('/auth/customers/1', headers=auth_header(0, 'Ran', 'librarian')).status_code == 200
+    assert client.get('/api/my-loans', headers=bearer(access_token)).status_code == 401
+    assert login().status_code == 403
+
+
+def test_login_rehashes_old_hashes_and_sheds_load_when_hasher_is_busy(app):
+    db.session.add(Customer(name='reader', password_hash=generate_password_hash('secret', 'pbkdf2:sha256:500')))
+    db.session.commit()
+    client = app.test_client()
+    credentials = {'username': 'reader', 'password': 'secret'}
+
+    assert client.post('/auth/login', json=credentials).status_code == 200
+    assert db.session.scalar(db.select(Customer.password_hash)).startswith('pbkdf2:sha256:1000$')
+
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE_SIZE=0, PASSWORD_HASH_WAIT_TIMEOUT=0.01)
+    init_password_hasher(app)
+    started, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=password_hasher.run, args=(lambda: started.set() or release.wait(),))
+    holder.start()
+    started.wait()
+    try:
+        response = client.post('/auth/login', json=credentials)
+        assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+    finally:
+        release.set()
+        holder.join()
+    assert client.post('/auth/login', json=credentials).status_code == 200
+
+
+def test_metrics_endpoint_is_off_by_default_and_needs_its_token():
+    assert create_app(TESTING=True, LOG_ACCESS_ENABLED=False).test_client().get('/metrics').status_code == 404
+    client = create_app(TESTING=True, LOG_ACCESS_ENABLED=False, METRICS_ENABLED=True,
+                        METRICS_TOKEN='scrape-me').test_client()
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+    assert response.status_code == 200 and b'# TYPE' in response.data
+
+
+@pytest.fixture
+def catalog(app):
+    for name, author in [('The Hobbit', 'J. R. R. Tolkien'), ('The Silmarillion', 'J. R. R. Tolkien'),
+                         ('Hobbit Homes', 'Ann Other'), ('Dune', 'Frank Herbert'), ('Hidden', 'Hobbitson')]:
+        db.session.add(Book(name=name, author=author, year_published=1970, loan_type_id=1))
+    db.session.commit()
+    index = SearchIndex()
+    index.build()
+    return index
+
+
+def test_search_matches_prefixes_and_typos_and_ranks_names_first(catalog):
+    names = lambda query: [hit['name'] for hit in catalog.search(query)]
+    assert names('silma') == ['The Silmarillion']
+    assert names('tolkein') == ['The Hobbit', 'The Silmarillion']
+    # A name match outweighs an author match, and matching every token outranks matching one
+    assert names('hobbit')[:2] == ['The Hobbit', 'Hobbit Homes'] and names('hobbit')[-1] == 'Hidden'
+    assert names('hobbit tolkien')[0] == 'The Hobbit'
+    assert names('zzzz') == []
+
+
+def test_search_rebuilds_in_background_and_keeps_updates_made_meanwhile(catalog, monkeypatch):
+    load = catalog._load
+
+    def load_while_a_book_is_renamed():
+        rows = load()
+        catalog.update_book(Book(id=4, name='Dune Messiah', author='Frank Herbert', active=True))
+        return rows
+    monkeypatch.setattr(catalog, '_load', load_while_a_book_is_renamed)
+
+    catalog.build()
+    assert [hit['name'] for hit in catalog.search('messiah')] == ['Dune Messiah']
+
+    # A stale index answers at once from its current contents and refreshes in a thread
+    db.session.add(Book(name='Dune Chronicles', author='Frank Herbert', year_published=1970, loan_type_id=1))
+    db.session.commit()
+    release = threading.Event()
+    monkeypatch.setattr(catalog, '_load', lambda: release.wait() and load())
+    catalog.rebuild_seconds = 60
+    catalog._built_at -= 120
+    assert [hit['name'] for hit in catalog.search('dune')] == ['Dune Messiah']
+    release.set()
+    with catalog._build_lock:
+        pass
+    assert catalog.search('chronicles')[0]['name'] == 'Dune Chronicles'
+
+
+def test_batch_return_and_renew_report_per_loan_and_update_read_models(app, customer_with_loans):
+    client = app.test_client()
+    librarian = auth_header(0, 'Ran', 'librarian')
+    db.session.get(Book, 5).loan_type_id = 3
+    db.session.commit()
+    rebuild_availability()
+    assert client.post('/auth/loans/3/return', headers=librarian).status_code == 200
+
+    response = client.post('/auth/loans/return', json={'loan_ids': [1, 3, 99, 2, 1]}, headers=librarian)
+    assert response.get_json() == {'returned': 2, 'results': [
+        {'loan_id': 1, 'status': 'returned'}, {'loan_id': 3, 'status': 'not_on_loan'},
+        {'loan_id': 99, 'status': 'not_found'}, {'loan_id': 2, 'status': 'returned'}]}
+    assert {row.book_id: row.availability_status for row in BookAvailability.query.filter(
+        BookAvailability.book_id.in_([1, 2, 4]))} == {1: 'Available', 2: 'Available', 4: 'On Loan'}
+    assert db.session.get(MyLoan, 1).is_loaned is False and db.session.get(MyLoan, 1).return_date
+
+    response = client.post('/auth/loans/renew', json={'loan_ids': [4, 5, 1]}, headers=librarian)
+    results = response.get_json()['results']
+    today = datetime.utcnow()
+    assert [r['status'] for r in results] == ['renewed', 'renewed', 'not_on_loan']
+    # Each loan gets its own book's loan type period (Short Term 2 days, Long Term 10)
+    assert results[0]['due_date'] == (today + timedelta(days=2)).strftime("%Y-%m-%d")
+    assert results[1]['due_date'] == (today + timedelta(days=10)).strftime("%Y-%m-%d")
+    db.session.expire_all()
+    assert db.session.get(Loan, 5).due_date == db.session.get(MyLoan, 5).due_date \
+        == db.session.get(BookAvailability, 5).return_date
+    assert db.session.get(Loan, 5).due_date.strftime("%Y-%m-%d") == results[1]['due_date']
+
+    assert client.post('/auth/loans/renew', json={'loan_ids': []}, headers=librarian).status_code == 400
+
+
+def test_catalog_etag_revalidates_until_a_book_write(app, customer_with_loans):
+    client = app.test_client()
+    librarian = auth_header(0, 'Ran', 'librarian')
+
+    first = client.get('/api/books', headers=librarian)
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('W/')
+    again = client.get('/api/books', headers=dict(librarian, **{'If-None-Match': etag}))
+    assert again.status_code == 304 and again.data == b'' and again.headers['ETag'] == etag
+
+    assert client.patch('/auth/books/1', json={'name': 'Renamed'}, headers=librarian).status_code == 200
+    changed = client.get('/api/books', headers=dict(librarian, **{'If-None-Match': etag}))
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert changed.get_json()['books'][0]['name'] == 'Renamed'
+
+
+def test_catalog_etag_is_refused_to_other_roles_and_differs_per_process(app, customer_with_loans, monkeypatch):
+    client = app.test_client()
+    reader = auth_header(customer_with_loans, 'reader', 'customer')
+    etag = client.get('/api/books/available', headers=reader).headers['ETag']
+    assert client.get('/api/books/available', headers=dict(reader, **{'If-None-Match': etag})).status_code == 304
+    # The role check runs before the ETag comparison
+    librarian = dict(auth_header(0, 'Ran', 'librarian'), **{'If-None-Match': etag})
+    assert client.get('/api/books/available', headers=librarian).status_code == 403
+
+    # A forked worker (another pid) makes its own tag instead of sharing the master's
+    monkeypatch.setattr(httpcache.os, 'getpid', lambda: -1)
+    assert client.get('/api/books/available', headers=dict(reader, **{'If-None-Match': etag})).status_code == 200
+
+
+def test_responses_are_compressed_per_accept_encoding(app, customer_with_loans, monkeypatch):
+    httpcache.init_http_cache(app)
+    monkeypatch.setattr(httpcache, 'brotli', type('FakeBrotli', (), {
+        'compress': staticmethod(lambda data, quality: b'br:' + data)}))
+    client = app.test_client()
+    librarian = auth_header(0, 'Ran', 'librarian')
+    get = lambda encoding: client.get('/api/books', headers=dict(librarian, **{'Accept-Encoding': encoding}))
+
+    plain = get('identity')
+    assert 'Content-Encoding' not in plain.headers and 'Accept-Encoding' in plain.headers['Vary']
+    assert len(plain.data) > app.config['COMPRESS_MIN_SIZE']
+
+    zipped = get('gzip')
+    assert zipped.headers['Content-Encoding'] == 'gzip' and 'Accept-Encoding' in zipped.headers['Vary']
+    assert json.loads(gzip.decompress(zipped.data)) == plain.get_json()
+
+    assert get('gzip, br').headers['Content-Encoding'] == 'br'
+    monkeypatch.setattr(httpcache, 'brotli', None)
+    assert get('br').headers.get('Content-Encoding') is None
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_revocation_store_opens_a_new_connection_after_fork(tmp_path):
+    from app.revocation import SQLiteRevocationStore
+    store = SQLiteRevocationStore(str(tmp_path / 'revocations.db'))
+    inherited = store._connect()
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # child: report whether it got its own connection and can use it
+        try:
+            store.revoke_token('child', time.time() + 60)
+            os.write(write, b'1' if store._connect() is not inherited else b'0')
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read, 1) == b'1'
+    assert store.is_revoked('child', 'nobody', 0)
+
+
+def test_late_loans_summary_counts_days_late_and_drops_returns(app, customer_with_loans):
+    client = app.test_client()
+    librarian = auth_header(0, 'Ran', 'librarian')
+    now = datetime.utcnow()
+    for loan_id, due in ((1, now - timedelta(days=3, hours=1)), (2, now - timedelta(days=10, hours=1))):
+        db.session.get(Loan, loan_id).due_date = due
+    for loan_id in range(3, 11):
+        db.session.get(Loan, loan_id).due_date = now + timedelta(days=1)
+    db.session.commit()
+
+    assert materialize_late_loans() == 2
+    late = client.get('/auth/loans/late', headers=librarian).get_json()
+    assert [(loan['loan_id'], loan['days_late']) for loan in sorted(late, key=lambda l: l['loan_id'])] == \
+        [(1, 3), (2, 10)]
+    assert late[0]['customer_name'] == 'reader' and late[0]['book_name'].startswith('Book ')
+
+    response = client.get('/auth/loans/late?format=ndjson', headers=librarian)
+    assert [json.loads(line)['loan_id'] for line in response.get_data(as_text=True).splitlines()] == [2, 1]
+    assert client.get('/auth/loans/late', headers=auth_header(1, 'reader', 'customer')).status_code == 403
+
+    # A return removes the loan from the summary without waiting for the next refresh
+    assert client.post('/auth/loans/return', json={'loan_ids': [2]}, headers=librarian).status_code == 200
+    assert [loan['loan_id'] for loan in client.get('/auth/loans/late', headers=librarian).get_json()] == [1]
+
+
+def test_late_loan_scheduler_refreshes_in_one_process_per_lock(file_app, tmp_path):
+    with file_app.app_context():
+        db.session.add(Loan(cust_id=1, book_id=1, due_date=datetime.utcnow() - timedelta(days=2)))
+        db.session.commit()
+        db.session.remove()
+
+    lock_path = str(tmp_path / 'late_loans.lock')
+    scheduler = LateLoanScheduler(file_app, interval=60, lock_path=lock_path)
+    other = LateLoanScheduler(file_app, interval=60, lock_path=lock_path)
+    scheduler.start()
+    try:
+        deadline = time.monotonic() + 5
+        with file_app.app_context():
+            while not db.session.scalar(db.select(db.func.count(LateLoan.loan_id))) and time.monotonic() < deadline:
+                db.session.remove()
+                time.sleep(0.02)
+            assert [row.to_dict()['days_late'] for row in LateLoan.query] == [2]
+            db.session.remove()
+        # A second process on the host does not refresh while the first holds the lock
+        assert scheduler._holds_lock() and not other._holds_lock()
+    finally:
+        scheduler.stop()
+        other.stop()
+
+
+def test_model_dicts_and_row_dumps_come_from_the_same_serializers(app, customer_with_loans):
+    from app.serializers import BOOK, LOAN, AVAILABLE_BOOK
+    loan = db.session.get(Loan, 1)
+    loan.due_date = datetime(2024, 2, 3, 16, 30)
+    db.session.commit()
+    rebuild_availability()
+
+    assert loan.to_dict() == LOAN.dump_row(db.session.execute(LOAN.select().where(Loan.id == 1)).one())
+    assert loan.to_dict()['due_date'] == '2024-02-03'
+    book = db.session.get(Book, 1)
+    assert book.to_dict() == BOOK.dump_row(db.session.execute(BOOK.select().where(Book.id == 1)).one())
+    availability = db.session.get(BookAvailability, 1)
+    assert availability.to_dict() == \
+        AVAILABLE_BOOK.dump_row(db.session.execute(AVAILABLE_BOOK.select().where(BookAvailability.book_id == 1)).one())
+
+
+def test_orjson_provider_encodes_like_the_default_provider():
+    pytest.importorskip('orjson')
+    from datetime import date
+    from flask.json.provider import DefaultJSONProvider
+    from app.json_provider import init_json, OrjsonProvider
+
+    app = Flask(__name__)
+    app.config['JSON_PROVIDER'] = 'orjson'
+    init_json(app)
+    assert isinstance(app.json, OrjsonProvider)
+    data = {'b_date': date(2024, 2, 3), 'a_datetime': datetime(2024, 2, 3, 16, 30, 5), 'n': [1, None, True]}
+    assert json.loads(app.json.dumps(data)) == json.loads(DefaultJSONProvider(app).dumps(data))
+    with app.app_context():
+        assert app.json.response(data).get_data() == DefaultJSONProvider(app).response(data).get_data()
+        assert app.json.loads(app.json.dumps(data))['b_date'] == 'Sat, 03 Feb 2024 00:00:00 GMT'
+
+
+def test_request_logs_are_json_lines_written_by_the_listener_with_the_request_id(tmp_path):
+    from app.logger import stop_logging, log_info
+    log_file = tmp_path / 'app.log'
+    flask_app = Flask(__name__)
+    flask_app.config.update(TESTING=True, LOG_FILE=str(log_file), LOG_FORMAT='json')
+    init_logging(flask_app)
+
+    @flask_app.route('/ping')
+    def ping():
+        log_info('pong')
+        return 'pong'
+
+    client = flask_app.test_client()
+    try:
+        assert client.get('/ping', headers={'X-Request-ID': 'req-42'}).headers['X-Request-ID'] == 'req-42'
+        generated = client.get('/ping').headers['X-Request-ID']
+        assert len(generated) == 32
+    finally:
+        # Stopping the listener flushes the queue into the file
+        stop_logging()
+    records = [json.loads(line) for line in log_file.read_text().splitlines()]
+    by_id = lambda request_id: [r for r in records if r.get('request_id') == request_id]
+    assert [r['message'] for r in by_id('req-42')] == ['pong', 'GET /ping 200']
+    assert [r['message'] for r in by_id(generated)] == ['pong', 'GET /ping 200']
+    access = by_id('req-42')[1]
+    assert access['level'] == 'INFO' and access['status'] == 200 and access['path'] == '/ping'
+    assert 'latency_ms' in access and access['ip'] == '127.0.0.1'
+
+
+def test_pool_stats_count_checkouts_timeouts_and_invalidations(tmp_path):
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import TimeoutError as PoolTimeout
+    from app.database import TimedQueuePool, pool_metrics, pool_stats
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.1)
+    held = engine.connect()
+    with pytest.raises(PoolTimeout):
+        engine.connect()
+    stats = engine.pool.stats()
+    assert stats['checkouts'] == 2 and stats['timeouts'] == 1 and stats['checked_out'] == 1
+    assert stats['max_wait_seconds'] >= 0.1 and stats['wait_seconds'] >= stats['max_wait_seconds']
+    held.invalidate()
+    held.close()
+    assert engine.pool.stats()['invalidations'] == 1 and engine.pool.stats()['checked_out'] == 0
+    engine.dispose()
+
+    # An app's engines report through pool_stats() and the /metrics collector
+    flask_app = Flask(__name__)
+    flask_app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}", DB_POOL_SIZE=2)
+    init_db(flask_app)
+    with flask_app.app_context():
+        db.session.execute(text('SELECT 1'))
+        db.session.remove()
+        stats = pool_stats()
+        assert stats['default']['size'] == 2 and stats['default']['checkouts'] >= 1
+        assert stats['default']['checked_out'] == 0
+        assert 'db_pool_checkouts_total{bind="default"} ' + str(stats['default']['checkouts']) in pool_metrics()
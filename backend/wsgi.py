@@ -0,0 +1,25 @@
+"""
+WSGI entry point for production servers.
+
+    flask --app wsgi init-db                 # before the first start and on every deploy
+    gunicorn -c gunicorn.conf.py wsgi:app    # Linux/macOS: preforked workers, see gunicorn.conf.py
+    python wsgi.py                           # waitress: one process with a thread pool (e.g. Windows)
+
+Importing this module builds the app and nothing else. Background jobs (search index
+build, late-loan refresh) are started per worker by gunicorn's post_fork hook, or by
+the waitress entry point below.
+"""
+import os
+from app import create_app, start_background_jobs, stop_background_jobs
+
+app = create_app()
+
+if __name__ == '__main__':
+    from waitress import serve
+
+    start_background_jobs(app)
+    try:
+        serve(app, host=os.getenv('HOST', '0.0.0.0'), port=int(os.getenv('PORT', '8000')),
+              threads=int(os.getenv('WAITRESS_THREADS', '8')))
+    finally:
+        stop_background_jobs(app)
@@ -0,0 +1,43 @@
+// Access tokens expire after 15 minutes. When a request comes back 401, trade the
+// refresh token (stored at login) for a new access token once and retry the request;
+// if that fails too, the session is over and the user is sent back to the login page.
+(function () {
+    let refreshing = null;
+
+    function refreshAccessToken() {
+        const refreshToken = localStorage.getItem('refresh_token');
+        if (!refreshToken) {
+            return Promise.reject(new Error('No refresh token'));
+        }
+        // Concurrent 401s share one refresh request
+        refreshing = refreshing || axios.post('/auth/refresh', null, {
+            headers: { Authorization: `Bearer ${refreshToken}` }
+        })
+        .then(response => {
+            localStorage.setItem('token', response.data.access_token);
+            return response.data.access_token;
+        })
+        .finally(() => { refreshing = null; });
+        return refreshing;
+    }
+
+    axios.interceptors.response.use(null, async error => {
+        const request = error.config;
+        const status = error.response && error.response.status;
+        if (status !== 401 || !request || request._retried ||
+                ['/auth/login', '/auth/refresh'].includes(request.url)) {
+            return Promise.reject(error);
+        }
+        request._retried = true;
+        try {
+            const token = await refreshAccessToken();
+            request.headers.Authorization = `Bearer ${token}`;
+            return axios(request);
+        } catch (refreshError) {
+            localStorage.removeItem('token');
+            localStorage.removeItem('refresh_token');
+            window.location.href = 'index.html';
+            return Promise.reject(error);
+        }
+    });
+})();